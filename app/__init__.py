@@ -22,6 +22,8 @@ os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"  #để đăng nhập đc trên
 # Database config
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Trả header X-DB-Query-Count (số câu SQL của mỗi request) - dùng khi load test
+app.config['SQL_QUERY_COUNT_HEADER'] = os.getenv('SQL_QUERY_COUNT_HEADER', 'False') == 'True'
 
 # Mail config
 app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER')
@@ -54,10 +56,131 @@ flow = Flow.from_client_secrets_file(
 app.config['QDRANT_API_KEY'] = os.getenv('QDRANT_API_KEY')
 app.config['OPENAI_API_KEY'] = os.getenv('OPENAI_API_KEY')
 app.config['MODEL_LLM_NAME'] = os.getenv('MODEL_LLM_NAME')
-app.config['MODEL_EMBEDDING_NAME'] = os.getenv('MODEL_EMBEDDING_NAME')
-app.config['MODEL_CROSS_ENCODER_NAME'] = os.getenv('MODEL_CROSS_ENCODER_NAME')
+# Endpoint OpenAI-compatible (OpenRouter mặc định, đổi sang server stub khi load test)
+app.config['LLM_API_BASE'] = os.getenv('LLM_API_BASE', 'https://openrouter.ai/api/v1')
+# Chuỗi model dự phòng (phân tách bằng dấu phẩy), thử lần lượt sau MODEL_LLM_NAME
+app.config['MODEL_LLM_FALLBACKS'] = [
+    model.strip() for model in os.getenv('MODEL_LLM_FALLBACKS', '').split(',') if model.strip()
+]
+# Deadline mỗi lần gọi LLM (giây): cả câu trả lời với invoke, token đầu tiên với stream
+app.config['LLM_TIMEOUT'] = float(os.getenv('LLM_TIMEOUT', 30))
+app.config['LLM_STREAM_IDLE_TIMEOUT'] = float(os.getenv('LLM_STREAM_IDLE_TIMEOUT', 15))
+# Gửi thêm request tới model dự phòng nếu chưa có token sau N ms (0 = tắt hedging)
+app.config['LLM_HEDGE_AFTER_MS'] = int(os.getenv('LLM_HEDGE_AFTER_MS', 0))
+app.config['MODEL_EMBEDDING_NAME'] = os.getenv('MODEL_EMBEDDING_NAME', 'dangvantuan/vietnamese-embedding')
+# torch | torch-int8 | onnx | onnx-int8 (xem app/core_rag/embeddings.py)
+app.config['EMBEDDING_BACKEND'] = os.getenv('EMBEDDING_BACKEND', 'torch')
+app.config['EMBEDDING_ONNX_PATH'] = os.getenv('EMBEDDING_ONNX_PATH')
+app.config['EMBEDDING_ONNX_FILE'] = os.getenv('EMBEDDING_ONNX_FILE')
+# Gom embedding của các request đồng thời thành một batch (1 = tắt)
+app.config['EMBEDDING_BATCH_MAX_SIZE'] = int(os.getenv('EMBEDDING_BATCH_MAX_SIZE', 32))
+app.config['EMBEDDING_BATCH_MAX_WAIT_MS'] = float(os.getenv('EMBEDDING_BATCH_MAX_WAIT_MS', 5))
+# Thời gian chờ tối đa (giây) của một lời gọi embedding qua batch
+app.config['EMBEDDING_BATCH_TIMEOUT'] = float(os.getenv('EMBEDDING_BATCH_TIMEOUT', 30))
+app.config['MODEL_CROSS_ENCODER_NAME'] = os.getenv('MODEL_CROSS_ENCODER_NAME', 'itdainb/PhoRanker')
 app.config['COLLECTION_NAME'] = os.getenv('COLLECTION_NAME')
 app.config['QDRANT_URL'] = os.getenv('QDRANT_URL')
+# Truy vấn Qdrant: gRPC thay REST, hnsw_ef (0 = mặc định của server), lượng tử hoá và payload trả về
+app.config['QDRANT_PREFER_GRPC'] = os.getenv('QDRANT_PREFER_GRPC', 'False') == 'True'
+app.config['QDRANT_GRPC_PORT'] = int(os.getenv('QDRANT_GRPC_PORT', 6334))
+app.config['RAG_QDRANT_HNSW_EF'] = int(os.getenv('RAG_QDRANT_HNSW_EF', 0))
+# none | scalar | binary - áp dụng khi `flask rag ingest` tạo/cập nhật collection
+app.config['RAG_QDRANT_QUANTIZATION'] = os.getenv('RAG_QDRANT_QUANTIZATION', 'none')
+app.config['RAG_QDRANT_RESCORE'] = os.getenv('RAG_QDRANT_RESCORE', 'True') == 'True'
+app.config['RAG_QDRANT_OVERSAMPLING'] = float(os.getenv('RAG_QDRANT_OVERSAMPLING', 2.0))
+# Các trường payload lấy về (phân tách bằng dấu phẩy, rỗng = toàn bộ payload)
+app.config['RAG_QDRANT_PAYLOAD_FIELDS'] = [
+    field.strip() for field in os.getenv('RAG_QDRANT_PAYLOAD_FIELDS', 'page_content,metadata.source').split(',')
+    if field.strip()
+]
+# Load model embedding/vector store ở thread nền ngay khi có request đầu tiên tới trang/API chat
+app.config['RAG_WARMUP'] = os.getenv('RAG_WARMUP', 'True') == 'True'
+app.config['RAG_TOP_K'] = int(os.getenv('RAG_TOP_K', 40))
+# similarity hoặc mmr (đa dạng hoá kết quả bằng Maximal Marginal Relevance)
+app.config['RAG_SEARCH_TYPE'] = os.getenv('RAG_SEARCH_TYPE', 'similarity')
+app.config['RAG_MMR_FETCH_K'] = int(os.getenv('RAG_MMR_FETCH_K', 80))
+app.config['RAG_MMR_LAMBDA'] = float(os.getenv('RAG_MMR_LAMBDA', 0.5))
+# Tầng vector: qdrant (mặc định) hoặc local (snapshot mmap export bằng `flask rag export-snapshot`)
+app.config['RAG_VECTOR_TIER'] = os.getenv('RAG_VECTOR_TIER', 'qdrant')
+app.config['RAG_SNAPSHOT_PATH'] = os.getenv('RAG_SNAPSHOT_PATH', os.path.join(app.instance_path, 'vector_snapshot'))
+app.config['RAG_SNAPSHOT_NPROBE'] = int(os.getenv('RAG_SNAPSHOT_NPROBE', 8))
+# Hybrid retrieval: dense (Qdrant) + BM25 cục bộ, gộp bằng Reciprocal Rank Fusion
+app.config['RAG_HYBRID_ENABLED'] = os.getenv('RAG_HYBRID_ENABLED', 'False') == 'True'
+app.config['RAG_BM25_PATH'] = os.getenv('RAG_BM25_PATH', os.path.join(app.instance_path, 'bm25'))
+app.config['RAG_DENSE_K'] = int(os.getenv('RAG_DENSE_K', 20))
+app.config['RAG_SPARSE_K'] = int(os.getenv('RAG_SPARSE_K', 20))
+app.config['RAG_RRF_K'] = int(os.getenv('RAG_RRF_K', 60))
+# Ghép context: bỏ chunk gần trùng và giới hạn số token (0 = không giới hạn)
+app.config['RAG_DEDUP_THRESHOLD'] = float(os.getenv('RAG_DEDUP_THRESHOLD', 0.8))
+app.config['RAG_CONTEXT_TOKEN_BUDGET'] = int(os.getenv('RAG_CONTEXT_TOKEN_BUDGET', 3000))
+# Version dữ liệu do `flask rag ingest` ghi ra sau mỗi lần nạp; cache câu trả lời tự xoá khi version đổi.
+# RAG_COLLECTION_VERSION chỉ cần tăng thủ công khi nạp dữ liệu bằng cách khác (ví dụ notebook)
+app.config['RAG_COLLECTION_VERSION_FILE'] = os.getenv(
+    'RAG_COLLECTION_VERSION_FILE', os.path.join(app.instance_path, 'collection_version.json')
+)
+app.config['RAG_COLLECTION_VERSION'] = os.getenv('RAG_COLLECTION_VERSION', '1')
+
+# Lịch sử hội thoại: giữ nguyên văn N lượt gần nhất, các lượt cũ hơn được tóm tắt (0 = giữ toàn bộ)
+app.config['RAG_HISTORY_TURNS'] = int(os.getenv('RAG_HISTORY_TURNS', 5))
+# Chỉ tóm tắt lại khi số lượt tràn khỏi cửa sổ đạt ngưỡng này
+app.config['RAG_SUMMARY_BATCH_TURNS'] = int(os.getenv('RAG_SUMMARY_BATCH_TURNS', 2))
+# Cache lịch sử hội thoại trong process (write-through)
+app.config['RAG_HISTORY_CACHE_SIZE'] = int(os.getenv('RAG_HISTORY_CACHE_SIZE', 1024))
+app.config['RAG_HISTORY_CACHE_TTL'] = int(os.getenv('RAG_HISTORY_CACHE_TTL', 600))
+
+# Gộp các câu hỏi giống hệt (chưa có lịch sử hội thoại) đang được xử lý đồng thời
+app.config['RAG_SINGLEFLIGHT_ENABLED'] = os.getenv('RAG_SINGLEFLIGHT_ENABLED', 'True') == 'True'
+# Thời gian tối đa (giây) request đi theo chờ request dẫn đầu trước khi tự xử lý
+app.config['RAG_SINGLEFLIGHT_TIMEOUT'] = float(os.getenv('RAG_SINGLEFLIGHT_TIMEOUT', 45))
+
+# Định tuyến câu hỏi: xã giao -> prompt ngắn, hỏi giá mã cổ phiếu -> yfinance, còn lại -> RAG đầy đủ
+app.config['RAG_ROUTER_ENABLED'] = os.getenv('RAG_ROUTER_ENABLED', 'True') == 'True'
+# Câu dài hơn N từ không qua bộ phân loại xã giao trên embedding (0 = chỉ dùng luật từ khoá)
+app.config['RAG_ROUTER_MAX_SMALLTALK_WORDS'] = int(os.getenv('RAG_ROUTER_MAX_SMALLTALK_WORDS', 8))
+app.config['RAG_ROUTER_MARGIN'] = float(os.getenv('RAG_ROUTER_MARGIN', 0.05))
+# Mã cổ phiếu bổ sung (phân tách bằng dấu phẩy) được nhận diện khi viết hoa đứng riêng trong câu hỏi
+app.config['RAG_ROUTER_EXTRA_TICKERS'] = [
+    ticker.strip() for ticker in os.getenv('RAG_ROUTER_EXTRA_TICKERS', '').split(',') if ticker.strip()
+]
+# Hậu tố sàn thêm vào mã 3 ký tự khi tra yfinance (FPT -> FPT.VN)
+app.config['STOCK_DEFAULT_SUFFIX'] = os.getenv('STOCK_DEFAULT_SUFFIX', '.VN')
+# Số thread lấy dữ liệu Yahoo Finance song song và thời gian chờ tối đa (giây) mỗi chỉ số
+app.config['MARKET_DATA_WORKERS'] = int(os.getenv('MARKET_DATA_WORKERS', 8))
+app.config['MARKET_DATA_TIMEOUT'] = float(os.getenv('MARKET_DATA_TIMEOUT', 5))
+# Cache dữ liệu thị trường trong process: TTL (giây) theo loại dữ liệu, giá trị quá TTL
+# vẫn được trả ngay (tối đa thêm MAX_STALE giây) trong khi tải lại ở nền
+app.config['MARKET_CACHE_ENABLED'] = os.getenv('MARKET_CACHE_ENABLED', 'True') == 'True'
+app.config['MARKET_CACHE_QUOTE_TTL'] = int(os.getenv('MARKET_CACHE_QUOTE_TTL', 60))
+app.config['MARKET_CACHE_INFO_TTL'] = int(os.getenv('MARKET_CACHE_INFO_TTL', 3600))
+app.config['MARKET_CACHE_HISTORY_TTL'] = int(os.getenv('MARKET_CACHE_HISTORY_TTL', 900))
+app.config['MARKET_CACHE_MAX_STALE'] = int(os.getenv('MARKET_CACHE_MAX_STALE', 3600))
+# Thread nền làm mới các mã được xem trong HOT_WINDOW giây gần đây (0 = tắt)
+app.config['MARKET_CACHE_REFRESH_INTERVAL'] = int(os.getenv('MARKET_CACHE_REFRESH_INTERVAL', 30))
+app.config['MARKET_CACHE_HOT_WINDOW'] = int(os.getenv('MARKET_CACHE_HOT_WINDOW', 600))
+# Lưu giá OHLCV theo ngày vào SQLite cục bộ, chỉ tải phần còn thiếu từ Yahoo
+app.config['OHLCV_STORE_ENABLED'] = os.getenv('OHLCV_STORE_ENABLED', 'True') == 'True'
+app.config['OHLCV_STORE_PATH'] = os.getenv('OHLCV_STORE_PATH', os.path.join(app.instance_path, 'ohlcv.sqlite3'))
+# Số giây tối thiểu giữa hai lần đồng bộ phần đuôi của một mã
+app.config['OHLCV_SYNC_INTERVAL'] = int(os.getenv('OHLCV_SYNC_INTERVAL', 300))
+# Mã không có dữ liệu trên Yahoo (sai mã, đã huỷ niêm yết) chỉ thử tải lại sau N giây
+app.config['OHLCV_EMPTY_SYNC_INTERVAL'] = int(os.getenv('OHLCV_EMPTY_SYNC_INTERVAL', 3600))
+# Số điểm tối đa của biểu đồ giá khi client không truyền `points` (0 = không giảm điểm)
+app.config['CHART_MAX_POINTS'] = int(os.getenv('CHART_MAX_POINTS', 0))
+# Số bộ kết quả chỉ báo kỹ thuật nhớ trong process (theo mã, chỉ báo, tham số)
+app.config['INDICATOR_CACHE_SIZE'] = int(os.getenv('INDICATOR_CACHE_SIZE', 256))
+
+# Semantic cache câu trả lời
+app.config['RAG_CACHE_ENABLED'] = os.getenv('RAG_CACHE_ENABLED', 'True') == 'True'
+app.config['RAG_CACHE_THRESHOLD'] = float(os.getenv('RAG_CACHE_THRESHOLD', 0.92))
+app.config['RAG_CACHE_MAX_SIZE'] = int(os.getenv('RAG_CACHE_MAX_SIZE', 512))
+app.config['RAG_CACHE_TTL'] = int(os.getenv('RAG_CACHE_TTL', 3600))
+
+# Rerank bằng cross-encoder sau bước tìm kiếm
+app.config['RAG_RERANK_ENABLED'] = os.getenv('RAG_RERANK_ENABLED', 'False') == 'True'
+app.config['RAG_RERANK_TOP_N'] = int(os.getenv('RAG_RERANK_TOP_N', 5))
+app.config['RAG_RERANK_BATCH_SIZE'] = int(os.getenv('RAG_RERANK_BATCH_SIZE', 16))
+app.config['RAG_RERANK_MAX_LENGTH'] = int(os.getenv('RAG_RERANK_MAX_LENGTH', 256))
+app.config['RAG_RERANK_CACHE_SIZE'] = int(os.getenv('RAG_RERANK_CACHE_SIZE', 4096))
 
 
 
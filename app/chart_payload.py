@@ -0,0 +1,63 @@
+"""
+Dữ liệu biểu đồ giá dạng cột (mỗi trường một mảng) thay cho một dict mỗi nến,
+kèm giảm số điểm bằng Largest-Triangle-Three-Buckets (LTTB) cho các khoảng thời gian dài.
+"""
+import numpy as np
+
+
+def lttb_indices(y, threshold, x=None):
+    """
+    Vị trí các điểm được giữ lại khi giảm chuỗi `y` còn `threshold` điểm bằng LTTB:
+    giữ điểm đầu/cuối, mỗi bucket chọn điểm tạo tam giác lớn nhất với điểm đã chọn trước
+    và trung bình bucket kế tiếp, nên vẫn giữ được các đỉnh/đáy của đường giá.
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if not threshold or threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype=float) if x is None else np.asarray(x, dtype=float)
+
+    # threshold - 2 bucket chia đều các điểm ở giữa (trừ điểm đầu và cuối)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_end = n - 1, n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        areas = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[i + 1] = previous
+    return selected
+
+
+def build_chart_payload(hist, max_points=None):
+    """
+    Chuyển DataFrame OHLCV (cột giống yfinance) thành các mảng date/open/high/low/close/volume.
+    `max_points` > 0 thì chọn tối đa ngần ấy nến bằng LTTB trên giá đóng cửa.
+    """
+    hist = hist.dropna(subset=['Close'])
+    total = len(hist)
+    if max_points and total > max_points:
+        hist = hist.iloc[lttb_indices(hist['Close'].to_numpy(dtype=float), max_points)]
+
+    return {
+        'date': hist.index.strftime('%Y-%m-%d').tolist(),
+        'open': hist['Open'].to_numpy(dtype=float).tolist(),
+        'high': hist['High'].to_numpy(dtype=float).tolist(),
+        'low': hist['Low'].to_numpy(dtype=float).tolist(),
+        'close': hist['Close'].to_numpy(dtype=float).tolist(),
+        'volume': hist['Volume'].fillna(0).to_numpy(dtype=np.int64).tolist(),
+        # Số nến trước khi giảm điểm
+        'total_points': total,
+    }
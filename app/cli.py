@@ -0,0 +1,134 @@
+import os
+import click
+from flask.cli import AppGroup
+from app import app
+
+# Các lệnh quản trị RAG: `flask --app app.index rag <lệnh>`
+# Mọi import nặng (torch, qdrant...) đặt trong thân lệnh để các lệnh khác không bị chậm
+rag_cli = AppGroup('rag', help='Quản trị pipeline RAG (embedding, index, ingestion).')
+
+
+def _qdrant_client():
+    from app.core_rag.qdrant_search import build_qdrant_client
+
+    return build_qdrant_client(
+        app.config['QDRANT_URL'],
+        api_key=app.config['QDRANT_API_KEY'],
+        prefer_grpc=app.config['QDRANT_PREFER_GRPC'],
+        grpc_port=app.config['QDRANT_GRPC_PORT'],
+    )
+
+
+@rag_cli.command('export-onnx')
+@click.argument('output_dir')
+@click.option('--quantization', default='avx2',
+              type=click.Choice(['avx2', 'avx512', 'avx512_vnni', 'arm64']),
+              help='Cấu hình lượng tử hoá int8 theo tập lệnh CPU.')
+def export_onnx_command(output_dir, quantization):
+    """Export model embedding sang ONNX + bản int8 để dùng với EMBEDDING_BACKEND=onnx/onnx-int8"""
+    from app.core_rag.embeddings import export_onnx
+
+    export_onnx(app.config['MODEL_EMBEDDING_NAME'], output_dir, quantization)
+    click.echo(f"Đã export ONNX vào {output_dir} "
+               f"(EMBEDDING_ONNX_PATH={output_dir}, EMBEDDING_ONNX_FILE=onnx/model_qint8_{quantization}.onnx)")
+
+
+@rag_cli.command('build-bm25')
+@click.option('--output', default=None, help='Thư mục lưu index (mặc định RAG_BM25_PATH).')
+@click.option('--batch-size', default=1000, show_default=True)
+def build_bm25_command(output, batch_size):
+    """Build chỉ mục BM25 từ toàn bộ chunk trong collection Qdrant"""
+    from app.core_rag.bm25 import BM25Index, iter_qdrant_documents
+
+    output = output or app.config['RAG_BM25_PATH']
+    client = _qdrant_client()
+    documents = list(iter_qdrant_documents(client, app.config['COLLECTION_NAME'], batch_size))
+    click.echo(f"Đã đọc {len(documents)} chunk từ collection {app.config['COLLECTION_NAME']}")
+
+    index = BM25Index.build(documents)
+    index.save(output)
+    click.echo(f"Đã lưu BM25 index ({len(index.vocab)} term) vào {output}")
+
+
+@rag_cli.command('export-snapshot')
+@click.option('--output', default=None, help='Thư mục snapshot (mặc định RAG_SNAPSHOT_PATH).')
+@click.option('--dtype', default='float16', type=click.Choice(['float16', 'int8']), show_default=True)
+@click.option('--lists', 'n_lists', default=0, show_default=True,
+              help='Số cụm IVF để tìm gần đúng (0 = tìm chính xác).')
+def export_snapshot_command(output, dtype, n_lists):
+    """Snapshot collection Qdrant thành file vector mmap dùng cho RAG_VECTOR_TIER=local"""
+    from app.core_rag.local_index import export_snapshot
+
+    output = output or app.config['RAG_SNAPSHOT_PATH']
+    client = _qdrant_client()
+    count = export_snapshot(client, app.config['COLLECTION_NAME'], output, dtype=dtype, n_lists=n_lists)
+    click.echo(f"Đã export {count} vector ({dtype}) vào {output}")
+
+
+@rag_cli.command('ingest')
+@click.argument('data_dir')
+@click.option('--workers', default=None, type=int, help='Số process parse tài liệu (mặc định số CPU - 1).')
+@click.option('--embed-batch-size', default=64, show_default=True)
+@click.option('--upsert-batch-size', default=256, show_default=True)
+@click.option('--upsert-concurrency', default=4, show_default=True, help='Số request upsert chạy đồng thời.')
+@click.option('--chunk-size', default=512, show_default=True)
+@click.option('--chunk-overlap', default=20, show_default=True)
+@click.option('--manifest', default=None, help='File manifest (mặc định instance/ingest_manifest.json).')
+@click.option('--recreate', is_flag=True,
+              help='Xoá và tạo lại collection, bỏ manifest (dùng một lần cho collection tạo từ notebook).')
+@click.option('--no-prune', is_flag=True, help='Không xoá điểm của các file nguồn đã bị xoá.')
+@click.option('--quantization', default=None, type=click.Choice(['none', 'scalar', 'binary']),
+              help='Lượng tử hoá vector của collection (mặc định RAG_QDRANT_QUANTIZATION).')
+def ingest_command(data_dir, workers, embed_batch_size, upsert_batch_size, upsert_concurrency,
+                   chunk_size, chunk_overlap, manifest, recreate, no_prune, quantization):
+    """
+    Nạp tăng dần tài liệu (pdf, docx, json) trong DATA_DIR vào collection Qdrant:
+    chỉ embed chunk mới/đổi, xoá chunk cũ và chunk của file đã bị xoá
+    """
+    from app.core_rag.embeddings import build_embeddings
+    from app.core_rag.ingest import (IngestionPipeline, Manifest, discover_files, ensure_collection,
+                                     manifest_fingerprint, write_collection_version)
+
+    collection_name = app.config['COLLECTION_NAME']
+    manifest = Manifest(
+        manifest or os.path.join(app.instance_path, 'ingest_manifest.json'), collection_name
+    )
+    if recreate:
+        manifest.reset()
+
+    files = discover_files(data_dir)
+    click.echo(f"Tìm thấy {len(files)} file trong {data_dir}")
+
+    embeddings = build_embeddings(
+        app.config['MODEL_EMBEDDING_NAME'], app.config['EMBEDDING_BACKEND'],
+        app.config['EMBEDDING_ONNX_PATH'], app.config['EMBEDDING_ONNX_FILE']
+    )
+    client = _qdrant_client()
+    vector_size = len(embeddings.embed_query("warm-up"))
+    ensure_collection(
+        client, collection_name, vector_size, recreate=recreate,
+        quantization=quantization or app.config['RAG_QDRANT_QUANTIZATION']
+    )
+
+    pipeline = IngestionPipeline(
+        client, embeddings, collection_name, manifest,
+        workers=workers,
+        embed_batch_size=embed_batch_size,
+        upsert_batch_size=upsert_batch_size,
+        upsert_concurrency=upsert_concurrency,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+    )
+    stats = pipeline.run(files, prune=not no_prune)
+    # Cache câu trả lời của web app đổi namespace theo version này
+    version = manifest_fingerprint(manifest)
+    write_collection_version(app.config['RAG_COLLECTION_VERSION_FILE'], collection_name, version)
+    click.echo(f"Collection {collection_name}: {stats['files']} file mới/đổi, "
+               f"{stats['skipped_files']} file không đổi, {stats['removed_files']} file đã xoá; "
+               f"upsert {stats['chunks']} chunk, giữ {stats['unchanged_chunks']}, xoá {stats['deleted_chunks']}")
+    if stats['chunks'] or stats['deleted_chunks']:
+        click.echo(f"Version dữ liệu mới: {version} (cache câu trả lời sẽ tự xoá)")
+        click.echo("Collection đã thay đổi: chạy lại `rag build-bm25` / `rag export-snapshot` nếu đang dùng.")
+
+
+app.cli.add_command(rag_cli)
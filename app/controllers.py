@@ -1,14 +1,15 @@
 import uuid
-from datetime import datetime
+import json
 
 import base64
-from flask import render_template, redirect, request, url_for, session, flash, jsonify
+from flask import render_template, redirect, request, url_for, session, flash, jsonify, Response, stream_with_context
 from flask_login import current_user, logout_user, login_required, login_user
 
 from app.models import RoleEnum, User, ChatConversation, ChatMessage
 from app import app, flow
 from app.form import LoginForm, RegisterForm, ProfileForm, ChangePasswordForm
-from app.dao import dao_authen, dao_user
+from app.dao import dao_authen, dao_user, dao_chat
+from app.decorators import role_only
 from app.extensions import db
 from app.rag_chatbot import rag_chatbot
 
@@ -231,9 +232,20 @@ def profile():
 
 # ============ STOCK MARKET ============
 
-import yfinance as yf
 import pandas as pd
-from datetime import datetime, timedelta
+from app import market_data, ohlcv_store
+from app.chart_payload import build_chart_payload
+from app.indicators import INDICATORS, WARMUP_DAYS, IndicatorEngine, parse_params, to_payload
+
+# Nhớ kết quả chỉ báo theo (mã, chỉ báo, tham số, nến cuối), tạo ở lần dùng đầu
+_indicator_engine = None
+
+
+def _get_indicator_engine():
+    global _indicator_engine
+    if _indicator_engine is None:
+        _indicator_engine = IndicatorEngine(max_entries=app.config['INDICATOR_CACHE_SIZE'])
+    return _indicator_engine
 
 
 @app.route('/stocks')
@@ -248,60 +260,38 @@ def stocks():
 def search_stocks():
     """API tìm kiếm cổ phiếu"""
     query = request.args.get('q', '').upper()
+    # Khoảng thời gian biểu đồ: 1M (mặc định), 3M, 6M, 1Y, 5Y, MAX
+    chart_range = request.args.get('range', '1M').upper()
+    # Số điểm tối đa của biểu đồ (LTTB), không truyền thì dùng CHART_MAX_POINTS (0 = giữ nguyên)
+    max_points = request.args.get('points', app.config['CHART_MAX_POINTS'], type=int)
 
     if not query:
         return jsonify({'success': False, 'message': 'Vui lòng nhập mã cổ phiếu'})
+    if chart_range not in ohlcv_store.RANGES:
+        return jsonify({'success': False, 'message': 'Khoảng thời gian không hợp lệ'})
+    if max_points and max_points < 3:
+        return jsonify({'success': False, 'message': 'Số điểm biểu đồ phải từ 3 trở lên'})
 
     try:
-        # Lấy thông tin cơ bản
-        stock = yf.Ticker(query)
-        info = stock.info
-
-        # Lấy dữ liệu giá trong 30 ngày qua
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=30)
-        hist = stock.history(start=start_date, end=end_date)
+        # Lấy thông tin cơ bản và dữ liệu giá trong khoảng thời gian đã chọn
+        stock_data, hist = market_data.fetch_stock(
+            query,
+            days=ohlcv_store.RANGES[chart_range],
+            cache=market_data.get_cache(),
+            store=ohlcv_store.get_store()
+        )
 
-        if hist.empty:
+        if stock_data is None:
             return jsonify({'success': False, 'message': 'Không tìm thấy dữ liệu cho mã cổ phiếu này'})
 
-        # Chuẩn bị dữ liệu trả về
-        stock_data = {
-            'success': True,
-            'symbol': query,
-            'name': info.get('longName', query),
-            'current_price': info.get('currentPrice', hist['Close'].iloc[-1] if not hist.empty else 0),
-            'previous_close': info.get('previousClose', 0),
-            'change': info.get('currentPrice', 0) - info.get('previousClose', 0) if info.get(
-                'currentPrice') and info.get('previousClose') else 0,
-            'change_percent': info.get('currentPrice', 0) / info.get('previousClose', 1) * 100 - 100 if info.get(
-                'currentPrice') and info.get('previousClose') else 0,
-            'volume': info.get('volume', 0),
-            'market_cap': info.get('marketCap', 0),
-            'pe_ratio': info.get('trailingPE', 0),
-            'dividend_yield': info.get('dividendYield', 0),
-            'currency': info.get('currency', 'USD'),
-            'sector': info.get('sector', 'N/A'),
-            'industry': info.get('industry', 'N/A'),
-            'country': info.get('country', 'N/A')
-        }
-
-        # Chuẩn bị dữ liệu biểu đồ
-        chart_data = []
-        for index, row in hist.iterrows():
-            chart_data.append({
-                'date': index.strftime('%Y-%m-%d'),
-                'open': float(row['Open']),
-                'high': float(row['High']),
-                'low': float(row['Low']),
-                'close': float(row['Close']),
-                'volume': int(row['Volume'])
-            })
+        # Chuẩn bị dữ liệu biểu đồ dạng cột, giảm còn tối đa `points` điểm nếu có
+        chart = build_chart_payload(hist, max_points=max_points)
 
         return jsonify({
             'success': True,
             'stock': stock_data,
-            'chart_data': chart_data
+            'range': chart_range,
+            'chart': chart
         })
 
     except Exception as e:
@@ -309,50 +299,79 @@ def search_stocks():
         return jsonify({'success': False, 'message': f'Lỗi khi tải dữ liệu: {str(e)}'})
 
 
+@app.route('/api/stocks/<symbol>/indicators', methods=['GET'])
+@login_required
+def get_stock_indicators(symbol):
+    """API chỉ báo kỹ thuật (SMA, EMA, RSI, MACD, Bollinger, ATR, VWAP) của một mã"""
+    symbol = symbol.upper()
+    chart_range = request.args.get('range', '1Y').upper()
+    # Danh sách chỉ báo phân tách bằng dấu phẩy, mặc định tất cả
+    names = [name.strip().lower() for name in request.args.get('indicators', ','.join(INDICATORS)).split(',')
+             if name.strip()]
+
+    if chart_range not in ohlcv_store.RANGES:
+        return jsonify({'success': False, 'message': 'Khoảng thời gian không hợp lệ'})
+    unknown = [name for name in names if name not in INDICATORS]
+    if unknown or not names:
+        return jsonify({'success': False, 'message': f"Chỉ báo không hợp lệ: {', '.join(unknown)}"})
+    try:
+        params = {name: parse_params(name, request.args) for name in names}
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+    try:
+        # Tính trên toàn bộ lịch sử đã lưu (thêm WARMUP_DAYS trước khoảng hiển thị) để kết quả
+        # của các lần gọi sau tiếp nối được khi có nến mới
+        days = ohlcv_store.RANGES[chart_range]
+        hist = market_data.get_history(
+            symbol,
+            days + WARMUP_DAYS if days else None,
+            cache=market_data.get_cache(),
+            store=ohlcv_store.get_store(),
+            full=True
+        ).dropna(subset=['Close'])
+
+        if hist.empty:
+            return jsonify({'success': False, 'message': 'Không tìm thấy dữ liệu cho mã cổ phiếu này'})
+
+        visible = hist.index
+        if days:
+            visible = visible[visible.strftime('%Y-%m-%d') >= ohlcv_store.start_date(days)]
+
+        indicators = {
+            name: to_payload(_get_indicator_engine().compute(symbol, name, hist, params[name]), visible)
+            for name in names
+        }
+
+        return jsonify({
+            'success': True,
+            'symbol': symbol,
+            'range': chart_range,
+            'date': visible.strftime('%Y-%m-%d').tolist(),
+            'params': params,
+            'indicators': indicators
+        })
+
+    except Exception as e:
+        app.logger.error(f"Lỗi khi tính chỉ báo {symbol}: {str(e)}")
+        return jsonify({'success': False, 'message': f'Lỗi khi tính chỉ báo: {str(e)}'})
+
+
 @app.route('/api/stocks/market-indices', methods=['GET'])
 @login_required
 def get_market_indices():
     """API lấy thông tin các chỉ số thị trường"""
     try:
-        # Các chỉ số thị trường phổ biến
-        indices_symbols = {
-            '^VNINDEX': 'VN-INDEX',
-            '^HNX': 'HNX-INDEX',
-            '^UPCOM': 'UPCOM-INDEX',
-            '^GSPC': 'S&P 500',
-            '^DJI': 'Dow Jones',
-            '^IXIC': 'NASDAQ',
-            '^FTSE': 'FTSE 100',
-            '^N225': 'Nikkei 225'
-        }
+        # Chỉ số có trong cache trả về ngay, còn lại lấy song song;
+        # chỉ số chậm quá MARKET_DATA_TIMEOUT bị bỏ qua
+        indices = market_data.fetch_indices(
+            max_workers=app.config['MARKET_DATA_WORKERS'],
+            timeout=app.config['MARKET_DATA_TIMEOUT'],
+            logger=app.logger,
+            cache=market_data.get_cache()
+        )
 
-        market_data = []
-
-        for symbol, name in indices_symbols.items():
-            try:
-                index = yf.Ticker(symbol)
-                info = index.info
-                hist = index.history(period='1d')
-
-                if not hist.empty:
-                    current = float(hist['Close'].iloc[-1])
-                    previous = float(info.get('previousClose', current * 0.99))
-                    change = float(current - previous)
-                    change_percent = float((change / previous * 100) if previous else 0)
-
-                    market_data.append({
-                        'symbol': symbol,
-                        'name': name,
-                        'current': round(current, 2),
-                        'change': round(change, 2),
-                        'change_percent': round(change_percent, 2),
-                        'is_positive': bool(change >= 0)  # Chuyển thành boolean
-                    })
-            except Exception as e:
-                app.logger.error(f"Lỗi khi lấy chỉ số {symbol}: {str(e)}")
-                continue
-
-        return jsonify({'success': True, 'indices': market_data})
+        return jsonify({'success': True, 'indices': indices})
 
     except Exception as e:
         app.logger.error(f"Lỗi khi lấy chỉ số thị trường: {str(e)}")
@@ -421,11 +440,10 @@ def get_conversations():
 def create_conversation():
     """Create a new conversation for the current user"""
     data = request.get_json()
-    conversation = ChatConversation(
+    conversation = dao_chat.create_conversation(
         user_id=current_user.user_id,
         title=data.get('title', 'Cuộc trò chuyện mới')
     )
-    db.session.add(conversation)
     db.session.commit()
 
     return jsonify({
@@ -440,10 +458,7 @@ def create_conversation():
 @login_required
 def get_messages(conversation_id):
     """Get all messages in a conversation (only if user owns it)"""
-    conversation = ChatConversation.query.filter_by(
-        conversation_id=conversation_id,
-        user_id=current_user.user_id
-    ).first()
+    conversation = dao_chat.get_conversation_state(conversation_id, current_user.user_id)
 
     if not conversation:
         return jsonify({'error': 'Conversation not found or access denied'}), 404
@@ -467,22 +482,18 @@ def get_messages(conversation_id):
 @login_required
 def add_message(conversation_id):
     """Add a message to a conversation (only if user owns it)"""
-    conversation = ChatConversation.query.filter_by(
-        conversation_id=conversation_id,
-        user_id=current_user.user_id
-    ).first()
+    conversation = dao_chat.get_conversation_state(conversation_id, current_user.user_id)
 
     if not conversation:
         return jsonify({'error': 'Conversation not found or access denied'}), 404
 
     data = request.get_json()
-    message = ChatMessage(
+    message = dao_chat.add_message(
         conversation_id=conversation_id,
         user_id=current_user.user_id,
         content=data.get('content'),
         message_type=data.get('type', 'user')
     )
-    db.session.add(message)
     db.session.commit()
 
     return jsonify({
@@ -505,18 +516,53 @@ def delete_conversation(conversation_id):
     if not conversation:
         return jsonify({'error': 'Conversation not found or access denied'}), 404
 
-    db.session.delete(conversation)
-    db.session.commit()
+    dao_chat.delete_conversation(conversation)
 
     return jsonify({'message': 'Conversation deleted'}), 200
 
 
+@app.route('/api/health/ready', methods=['GET'])
+def rag_readiness():
+    """Readiness of the embedding model, vector store and LLM client"""
+    status = rag_chatbot.readiness()
+    return jsonify(status), 200 if status['ready'] else 503
+
+
+@app.route('/admin/rag/metrics', methods=['GET'])
+@login_required
+@role_only([RoleEnum.ADMIN])
+def get_rag_metrics():
+    """Per-stage latency histograms plus cache, embedding batch, LLM routing, intent routing and coalescing counters (admin only)"""
+    embeddings = rag_chatbot.embeddings
+    return jsonify({
+        'stages': rag_chatbot.metrics.snapshot(),
+        'answer_cache': rag_chatbot.answer_cache.stats() if rag_chatbot.answer_cache else None,
+        'embedding_batches': embeddings.stats() if hasattr(embeddings, 'stats') else None,
+        'llm': rag_chatbot.llm.stats() if rag_chatbot.llm else None,
+        'intents': rag_chatbot.router.stats() if rag_chatbot.router else None,
+        'single_flight': rag_chatbot.single_flight.stats() if rag_chatbot.single_flight else None
+    })
+
+
+@app.route('/admin/stocks/cache', methods=['GET'])
+@login_required
+@role_only([RoleEnum.ADMIN])
+def get_market_cache_stats():
+    """Hit rate of the shared market data cache per dataset, OHLCV store and indicator memo counters (admin only)"""
+    return jsonify({
+        'cache': market_data.get_cache().stats() if market_data.get_cache() else None,
+        'ohlcv_store': ohlcv_store.get_store().stats() if ohlcv_store.get_store() else None,
+        'indicators': _get_indicator_engine().stats()
+    })
+
+
 # ---------- RAG ONLY -------------
 
 @app.route('/api/chat/send-message', methods=['POST'])
 @login_required
 def send_chat_message():
     """Handle chat messages for financial advisor (RAG only, no image)"""
+    conversation_id = None
     try:
         data = request.get_json()
         message_text = data.get('message', '')
@@ -526,73 +572,151 @@ def send_chat_message():
         if not message_text:
             return jsonify({'error': 'Vui lòng nhập câu hỏi về tài chính'}), 400
 
-        # Tìm hoặc tạo conversation
-        if conversation_id:
-            conversation = ChatConversation.query.filter_by(
-                conversation_id=conversation_id,
-                user_id=current_user.user_id
-            ).first()
-            if not conversation:
-                return jsonify({'error': 'Cuộc trò chuyện không tồn tại'}), 404
-        else:
-            # Tạo conversation mới với title từ message đầu tiên
-            title = message_text[:50] + "..." if message_text else "Tư vấn tài chính"
-            conversation = ChatConversation(
-                user_id=current_user.user_id,
-                title=title
-            )
-            db.session.add(conversation)
-            db.session.flush()
+        # Tìm hoặc tạo conversation (kiểm tra quyền qua cache, không cần đọc DB)
+        conversation_id, first_turn, error = _get_or_create_conversation(conversation_id, message_text)
+        if error:
+            return error
 
         # Lưu tin nhắn người dùng
-        user_message = ChatMessage(
-            conversation_id=conversation.conversation_id,
-            user_id=current_user.user_id,
-            content=message_text,
-            message_type='user'
-        )
-        db.session.add(user_message)
-        db.session.flush()
+        dao_chat.add_message(conversation_id, current_user.user_id, message_text, 'user')
 
         # Lấy response từ RAG
         rag_response_content = ""
         try:
-            rag_response = rag_chatbot.get_rag_response(message_text, conversation.conversation_id)
+            rag_response = rag_chatbot.get_rag_response(message_text, conversation_id)
             rag_response_content = rag_response
         except Exception as e:
             app.logger.error(f"RAG Error: {e}")
             rag_response_content = "Xin lỗi, có lỗi xảy ra khi xử lý yêu cầu tài chính của bạn. Vui lòng thử lại."
 
         # Lưu tin nhắn bot
-        bot_message = ChatMessage(
-            conversation_id=conversation.conversation_id,
-            user_id=current_user.user_id,
-            content=rag_response_content,
-            message_type='bot',
-            is_html=False
-        )
-        db.session.add(bot_message)
-
-        # Cập nhật thời gian conversation
-        conversation.updated_at = datetime.utcnow()
+        dao_chat.add_message(conversation_id, current_user.user_id, rag_response_content, 'bot')
 
-        # Cập nhật tiêu đề nếu là tin nhắn đầu tiên
-        if len(conversation.messages) <= 2:  # Chỉ user và bot message
-            conversation.title = f"Tư vấn: {message_text[:30]}..." if len(
-                message_text) > 30 else f"Tư vấn: {message_text}"
+        # Cập nhật thời gian (và tiêu đề) conversation
+        _touch_conversation(conversation_id, message_text, first_turn)
 
         db.session.commit()
 
         return jsonify({
             'success': True,
-            'conversation_id': conversation.conversation_id,
+            'conversation_id': conversation_id,
             'response': rag_response_content
         })
 
     except Exception as e:
         app.logger.error(f"Chat error: {e}")
         db.session.rollback()
+        if conversation_id:
+            dao_chat.invalidate(conversation_id)
+        return jsonify({
+            'success': False,
+            'error': 'Có lỗi xảy ra khi xử lý tin nhắn tài chính'
+        }), 500
+
+
+def _get_or_create_conversation(conversation_id, message_text):
+    """
+    Trả về (conversation_id, first_turn, error_response).
+    Gọi trước khi lưu tin nhắn của lượt này: first_turn = conversation chưa có tin nhắn nào đã commit.
+    """
+    if conversation_id:
+        state = dao_chat.get_conversation_state(conversation_id, current_user.user_id)
+        if not state:
+            return None, False, (jsonify({'error': 'Cuộc trò chuyện không tồn tại'}), 404)
+        return conversation_id, state.message_count == 0, None
+
+    # Tạo conversation mới với title từ message đầu tiên
+    title = message_text[:50] + "..." if message_text else "Tư vấn tài chính"
+    conversation = dao_chat.create_conversation(current_user.user_id, title)
+    return conversation.conversation_id, True, None
+
+
+def _touch_conversation(conversation_id, message_text, first_turn):
+    # Cập nhật tiêu đề nếu là lượt hỏi đầu tiên
+    title = None
+    if first_turn:
+        title = f"Tư vấn: {message_text[:30]}..." if len(
+            message_text) > 30 else f"Tư vấn: {message_text}"
+    dao_chat.touch_conversation(conversation_id, title)
+
+
+def _sse(event, data):
+    """Định dạng một event Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.route('/api/chat/send-message/stream', methods=['POST'])
+@login_required
+def stream_chat_message():
+    """Same as send_chat_message but streams tokens back as Server-Sent Events"""
+    data = request.get_json()
+    message_text = data.get('message', '')
+    conversation_id = data.get('conversation_id')
+
+    # Validate input
+    if not message_text:
+        return jsonify({'error': 'Vui lòng nhập câu hỏi về tài chính'}), 400
+
+    try:
+        conversation_id, first_turn, error = _get_or_create_conversation(conversation_id, message_text)
+        if error:
+            return error
+
+        # Lưu tin nhắn người dùng trước khi stream để không giữ transaction trong lúc chờ LLM
+        dao_chat.add_message(conversation_id, current_user.user_id, message_text, 'user')
+        db.session.commit()
+    except Exception as e:
+        app.logger.error(f"Chat error: {e}")
+        db.session.rollback()
+        if conversation_id:
+            dao_chat.invalidate(conversation_id)
         return jsonify({
             'success': False,
             'error': 'Có lỗi xảy ra khi xử lý tin nhắn tài chính'
-        }), 500
\ No newline at end of file
+        }), 500
+
+    user_id = current_user.user_id
+
+    def generate():
+        tokens = rag_chatbot.stream_rag_response(message_text, conversation_id)
+        answer_parts = []
+        try:
+            yield _sse('start', {'conversation_id': conversation_id})
+
+            for token in tokens:
+                answer_parts.append(token)
+                yield _sse('token', {'token': token})
+
+            # Stream xong mới lưu tin nhắn bot hoàn chỉnh
+            bot_message = dao_chat.add_message(conversation_id, user_id, "".join(answer_parts), 'bot')
+            message_id = bot_message.message_id
+            _touch_conversation(conversation_id, message_text, first_turn)
+
+            db.session.commit()
+
+            yield _sse('done', {
+                'conversation_id': conversation_id,
+                'message_id': message_id
+            })
+
+        except GeneratorExit:
+            # Client đóng kết nối: dừng gọi LLM, không lưu câu trả lời dang dở
+            app.logger.info(f"Chat stream closed by client, conversation={conversation_id}")
+            db.session.rollback()
+            raise
+
+        except Exception as e:
+            app.logger.error(f"Chat stream error: {e}")
+            db.session.rollback()
+            dao_chat.invalidate(conversation_id)
+            # Kể cả khi đã stream một phần (StreamInterrupted): không lưu câu trả lời dang dở
+            yield _sse('error', {'error': 'Có lỗi xảy ra khi xử lý tin nhắn tài chính'})
+
+        finally:
+            tokens.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
@@ -0,0 +1 @@
+# Các thành phần dùng chung cho pipeline RAG (metrics, retrieval, ingestion...)
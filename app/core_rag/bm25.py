@@ -0,0 +1,216 @@
+import json
+import os
+import re
+import unicodedata
+from array import array
+import numpy as np
+from app.core_rag.payload_store import JsonlPayloadStore, record_to_document, write_jsonl
+
+# Hư từ thường gặp, không mang nghĩa khi tìm kiếm
+VIETNAMESE_STOPWORDS = {
+    "là", "của", "và", "các", "những", "có", "được", "cho", "trong", "với", "về", "này", "đó",
+    "thì", "mà", "gì", "nào", "như", "khi", "để", "từ", "theo", "một", "cũng", "đã", "sẽ",
+    "đang", "bị", "tại", "do", "nên", "hay", "hoặc", "nếu", "vì", "ra", "vào", "lên", "rằng",
+    "thế", "sao", "bao", "nhiêu", "ạ", "nhé", "không",
+}
+
+_TOKEN_RE = re.compile(r"\w+(?:[./\-]\w+)*")
+
+
+def strip_accents(text):
+    """Bỏ dấu tiếng Việt (khấu hao -> khau hao), đ -> d"""
+    text = unicodedata.normalize("NFD", text)
+    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+    return text.replace("đ", "d").replace("Đ", "D")
+
+
+def tokenize(text):
+    """
+    Tách token cho tiếng Việt:
+    - giữ nguyên cụm số hiệu như 111/2013/tt-btc, 22.5, mã cổ phiếu, đồng thời tách thêm từng phần
+    - thêm bigram âm tiết (khấu_hao, cổ_phiếu) vì từ tiếng Việt thường gồm nhiều âm tiết
+    - thêm dạng không dấu để khớp câu hỏi gõ không dấu
+    """
+    text = unicodedata.normalize("NFC", text).lower()
+    syllables = []
+    tokens = []
+    for match in _TOKEN_RE.finditer(text):
+        token = match.group(0)
+        parts = re.split(r"[./\-]", token)
+        if len(parts) > 1:
+            tokens.append(token)
+            syllables.extend(parts)
+        else:
+            syllables.append(token)
+
+    for i, syllable in enumerate(syllables):
+        if syllable not in VIETNAMESE_STOPWORDS:
+            tokens.append(syllable)
+        if i + 1 < len(syllables):
+            tokens.append(f"{syllable}_{syllables[i + 1]}")
+
+    folded = [strip_accents(token) for token in tokens]
+    return tokens + [plain for token, plain in zip(tokens, folded) if plain != token]
+
+
+class BM25Index:
+    """
+    Chỉ mục BM25 lưu dạng CSR (term -> danh sách doc, tf) bằng numpy.
+    Lưu xuống thư mục gồm index.npz, vocab.json và docs.jsonl; nội dung tài liệu
+    được đọc qua mmap theo offset nên load index gần như tức thì.
+    """
+
+    def __init__(self, vocab, indptr, doc_ids, tfs, doc_len, idf, docs, k1=1.5, b=0.75):
+        self.vocab = vocab
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_len = doc_len
+        self.idf = idf
+        self.avgdl = float(doc_len.mean()) if len(doc_len) else 0.0
+        self.k1 = k1
+        self.b = b
+        # list record khi vừa build, JsonlPayloadStore khi load từ đĩa
+        self._docs = docs
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    @classmethod
+    def build(cls, documents, k1=1.5, b=0.75):
+        """documents: list dict {'id', 'page_content', 'metadata'}"""
+        vocab = {}
+        term_list, doc_list, tf_list = array("i"), array("i"), array("f")
+        doc_len = np.zeros(len(documents), dtype=np.float32)
+
+        for doc_idx, doc in enumerate(documents):
+            counts = {}
+            tokens = tokenize(doc["page_content"])
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            doc_len[doc_idx] = len(tokens)
+            for token, tf in counts.items():
+                term_list.append(vocab.setdefault(token, len(vocab)))
+                doc_list.append(doc_idx)
+                tf_list.append(tf)
+
+        # Sắp xếp theo (term, doc) để tạo CSR
+        term_ids = np.frombuffer(term_list, dtype=np.int32)
+        order = np.lexsort((np.frombuffer(doc_list, dtype=np.int32), term_ids))
+        doc_ids = np.frombuffer(doc_list, dtype=np.int32)[order]
+        tfs = np.frombuffer(tf_list, dtype=np.float32)[order]
+        df = np.bincount(term_ids, minlength=len(vocab))
+        indptr = np.concatenate([[0], np.cumsum(df)]).astype(np.int64)
+
+        n_docs = len(documents)
+        idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        return cls(vocab, indptr, doc_ids, tfs, doc_len, idf, list(documents), k1=k1, b=b)
+
+    def search(self, query, k=20):
+        """Trả về list (vị trí tài liệu, điểm BM25) giảm dần"""
+        if not len(self.doc_len):
+            return []
+        scores = np.zeros(len(self.doc_len), dtype=np.float32)
+        norm = self.k1 * (1 - self.b + self.b * self.doc_len / (self.avgdl or 1.0))
+        for token in set(tokenize(query)):
+            term_id = self.vocab.get(token)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            ids = self.doc_ids[start:end]
+            tf = self.tfs[start:end]
+            scores[ids] += self.idf[term_id] * tf * (self.k1 + 1) / (tf + norm[ids])
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+    def get_document(self, doc_idx):
+        if isinstance(self._docs, list):
+            return record_to_document(self._docs[doc_idx])
+        return record_to_document(self._docs.get(doc_idx))
+
+    def get_relevant_documents(self, query, k=20):
+        docs = []
+        for doc_idx, score in self.search(query, k):
+            doc = self.get_document(doc_idx)
+            doc.metadata["bm25_score"] = score
+            docs.append(doc)
+        return docs
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        offsets = write_jsonl(os.path.join(path, "docs.jsonl"), iter(self._docs))
+
+        np.savez(
+            os.path.join(path, "index.npz"),
+            indptr=self.indptr, doc_ids=self.doc_ids, tfs=self.tfs, doc_len=self.doc_len,
+            idf=self.idf, doc_offsets=offsets,
+            params=np.asarray([self.k1, self.b], dtype=np.float32),
+        )
+        with open(os.path.join(path, "vocab.json"), "w", encoding="utf-8") as f:
+            json.dump(self.vocab, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        arrays = np.load(os.path.join(path, "index.npz"))
+        with open(os.path.join(path, "vocab.json"), encoding="utf-8") as f:
+            vocab = json.load(f)
+        k1, b = (float(x) for x in arrays["params"])
+        return cls(
+            vocab, arrays["indptr"], arrays["doc_ids"], arrays["tfs"], arrays["doc_len"], arrays["idf"],
+            JsonlPayloadStore(os.path.join(path, "docs.jsonl"), arrays["doc_offsets"]), k1=k1, b=b,
+        )
+
+    @staticmethod
+    def exists(path):
+        return bool(path) and os.path.exists(os.path.join(path, "index.npz"))
+
+
+def iter_qdrant_documents(client, collection_name, batch_size=1000):
+    """Đọc toàn bộ chunk (payload dạng LangChain: page_content + metadata) từ collection Qdrant"""
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=False,
+        )
+        for point in points:
+            payload = point.payload or {}
+            yield {
+                "id": str(point.id),
+                "page_content": payload.get("page_content", ""),
+                "metadata": payload.get("metadata") or {},
+            }
+        if offset is None:
+            break
+
+
+def reciprocal_rank_fusion(result_lists, k=60, limit=None):
+    """
+    Gộp nhiều danh sách Document đã xếp hạng bằng Reciprocal Rank Fusion:
+    score(d) = sum 1 / (k + rank). Tài liệu được nhận diện theo metadata['_id'].
+    """
+    scores = {}
+    docs = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, start=1):
+            doc_id = doc.metadata.get("_id")
+            key = str(doc_id) if doc_id is not None else doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            docs.setdefault(key, doc)
+
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    if limit:
+        ranked = ranked[:limit]
+    fused = []
+    for key in ranked:
+        doc = docs[key]
+        doc.metadata["rrf_score"] = scores[key]
+        fused.append(doc)
+    return fused
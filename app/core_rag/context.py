@@ -0,0 +1,84 @@
+import re
+import unicodedata
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken là tuỳ chọn, không có thì ước lượng theo số ký tự
+    tiktoken = None
+
+
+class TokenCounter:
+    """
+    Đếm token cho model LLM đang dùng. Có tiktoken thì đếm chính xác theo encoding
+    của model (mặc định o200k_base cho các model qua OpenRouter), không có thì
+    ước lượng khoảng 3 ký tự/token - đủ sát với tiếng Việt có dấu.
+    """
+
+    def __init__(self, model_name=None, chars_per_token=3.0):
+        self.chars_per_token = chars_per_token
+        self._encoding = None
+        if tiktoken is not None:
+            # Tên model trên OpenRouter có dạng "openai/gpt-oss-20b:free"
+            base_name = (model_name or "").split("/")[-1].split(":")[0]
+            try:
+                self._encoding = tiktoken.encoding_for_model(base_name)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("o200k_base")
+
+    def count(self, text):
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return int(len(text) / self.chars_per_token) + 1
+
+
+def _shingles(text, size=3):
+    # Shingle theo từ (âm tiết) sau khi chuẩn hoá
+    text = unicodedata.normalize("NFC", text).lower()
+    words = re.findall(r"\w+", text)
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def deduplicate_documents(docs, threshold=0.8):
+    """
+    Bỏ các chunk gần trùng nhau (Jaccard trên shingle >= threshold), giữ chunk
+    xếp hạng cao hơn. Với vài chục chunk thì so sánh trực tiếp tập shingle đủ nhanh,
+    không cần MinHash.
+    """
+    kept, kept_shingles = [], []
+    for doc in docs:
+        shingles = _shingles(doc.page_content)
+        if not shingles:
+            continue
+        duplicate = False
+        for other in kept_shingles:
+            intersection = len(shingles & other)
+            if intersection and intersection / len(shingles | other) >= threshold:
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append(doc)
+            kept_shingles.append(shingles)
+    return kept
+
+
+def pack_documents(docs, token_budget, counter, separator="\n\n"):
+    """
+    Lấy lần lượt các chunk theo thứ hạng cho tới khi hết token_budget.
+    Chunk quá dài so với phần ngân sách còn lại thì bỏ qua, thử chunk tiếp theo.
+    """
+    if not token_budget:
+        return list(docs)
+
+    packed, used = [], 0
+    separator_tokens = counter.count(separator)
+    for doc in docs:
+        tokens = counter.count(doc.page_content) + (separator_tokens if packed else 0)
+        if used + tokens > token_budget:
+            continue
+        packed.append(doc)
+        used += tokens
+    return packed
@@ -0,0 +1,188 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_EMBEDDING_MODEL = "dangvantuan/vietnamese-embedding"
+
+# torch: PyTorch fp32 như trước (HuggingFaceEmbeddings)
+# torch-int8: PyTorch, lượng tử hoá động int8 các lớp Linear
+# onnx / onnx-int8: ONNX Runtime (cần cài optimum[onnxruntime]), file export bằng `flask rag export-onnx`
+EMBEDDING_BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+
+ONNX_FILE_NAMES = {
+    "onnx": "onnx/model.onnx",
+    "onnx-int8": "onnx/model_qint8_avx2.onnx",
+}
+
+
+class SentenceTransformerEmbeddings(Embeddings):
+    """Embeddings chạy trên CPU bằng SentenceTransformer với backend torch-int8 hoặc ONNX"""
+
+    def __init__(self, model_name, backend="torch-int8", onnx_file=None, batch_size=32):
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.backend = backend
+        self.batch_size = batch_size
+
+        if backend == "torch-int8":
+            import torch
+            model = SentenceTransformer(model_name, device="cpu")
+            self.model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        elif backend in ONNX_FILE_NAMES:
+            self.model = SentenceTransformer(
+                model_name,
+                device="cpu",
+                backend="onnx",
+                model_kwargs={"file_name": onnx_file or ONNX_FILE_NAMES[backend]}
+            )
+        else:
+            raise ValueError(f"Unsupported embedding backend: {backend}")
+
+    def embed_documents(self, texts):
+        vectors = self.model.encode(
+            list(texts),
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        return vectors.tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class BatchingEmbeddings(Embeddings):
+    """
+    Gom các lời gọi embedding đồng thời từ nhiều request thành một forward pass.
+    Một thread nền duy nhất gọi model: lấy yêu cầu đầu tiên trong hàng đợi, chờ thêm tối đa
+    `max_wait_ms` (hoặc tới khi đủ `max_batch_size` câu) rồi embed cả lô và trả kết quả
+    về từng caller qua Future. Model chỉ chạy trên một thread nên các thread torch không tranh nhau.
+    Caller chờ tối đa `timeout` giây; nếu thread nền dừng bất thường, mọi yêu cầu đang chờ nhận lỗi ngay.
+    """
+
+    def __init__(self, embeddings, max_batch_size=32, max_wait_ms=5, timeout=30):
+        self.embeddings = embeddings
+        self.max_batch_size = max(int(max_batch_size), 1)
+        self.max_wait = max(float(max_wait_ms), 0.0) / 1000
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._error = None
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._texts = 0
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+
+    def _submit(self, texts):
+        if self._error is not None:
+            raise RuntimeError(f"Embedding batcher đã dừng: {self._error!r}")
+        future = Future()
+        self._queue.put((list(texts), future))
+        return future.result(timeout=self.timeout)
+
+    def embed_query(self, text):
+        return self._submit([text])[0]
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        return self._submit(texts)
+
+    def _collect(self):
+        requests = [self._queue.get()]
+        size = len(requests[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            requests.append(item)
+            size += len(item[0])
+        return requests
+
+    def _run(self):
+        requests = []
+        try:
+            while True:
+                requests = self._collect()
+                self._process(requests)
+                requests = []
+        except BaseException as e:
+            # Thread sắp dừng (lỗi ngoài Exception, ví dụ SystemExit/MemoryError): không để caller chờ mãi
+            self._error = e
+            self._fail(requests, e)
+            while True:
+                try:
+                    self._fail([self._queue.get_nowait()], e)
+                except queue.Empty:
+                    break
+            raise
+
+    @staticmethod
+    def _fail(requests, error):
+        for _, future in requests:
+            if not future.done():
+                future.set_exception(RuntimeError(f"Embedding batcher đã dừng: {error!r}"))
+
+    def _process(self, requests):
+        texts = [text for request_texts, _ in requests for text in request_texts]
+        try:
+            vectors = self.embeddings.embed_documents(texts)
+        except Exception as e:
+            for _, future in requests:
+                future.set_exception(e)
+            return
+
+        start = 0
+        for request_texts, future in requests:
+            future.set_result(vectors[start:start + len(request_texts)])
+            start += len(request_texts)
+        with self._stats_lock:
+            self._batches += 1
+            self._texts += len(texts)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'batches': self._batches,
+                'texts': self._texts,
+                'avg_batch_size': round(self._texts / self._batches, 2) if self._batches else 0.0,
+                'queued': self._queue.qsize(),
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'alive': self._error is None,
+            }
+
+
+def build_embeddings(model_name=None, backend="torch", onnx_path=None, onnx_file=None):
+    """
+    Tạo model embedding theo backend cấu hình (EMBEDDING_BACKEND).
+    onnx_path: thư mục chứa model đã export ONNX (mặc định tải theo model_name).
+    """
+    model_name = model_name or DEFAULT_EMBEDDING_MODEL
+    if backend == "torch":
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=model_name)
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unsupported embedding backend: {backend}")
+    if backend in ONNX_FILE_NAMES and onnx_path:
+        model_name = onnx_path
+    return SentenceTransformerEmbeddings(model_name, backend=backend, onnx_file=onnx_file)
+
+
+def export_onnx(model_name, output_dir, quantization="avx2"):
+    """
+    Export model sang ONNX (onnx/model.onnx) và bản lượng tử hoá động int8
+    (onnx/model_qint8_<quantization>.onnx) vào output_dir.
+    """
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    model = SentenceTransformer(model_name, device="cpu", backend="onnx")
+    model.save_pretrained(output_dir)
+    export_dynamic_quantized_onnx_model(model, quantization, output_dir)
+    return output_dir
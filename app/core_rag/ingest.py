@@ -0,0 +1,483 @@
+"""
+Pipeline nạp tài liệu vào Qdrant (thay cho các cell trong rag_finance.ipynb):
+
+    load -> clean -> split  (process pool, song song theo file)
+         -> embed           (theo batch, ở process chính)
+         -> upsert          (theo batch, nhiều request đồng thời)
+
+Mỗi bước giới hạn số phần việc đang chờ nên bộ nhớ không phụ thuộc kích thước thư mục.
+
+Nạp tăng dần: ID điểm suy ra từ hash nội dung chunk, manifest lưu hash từng file nguồn và
+ID các điểm của nó. Chỉ file mới/đổi được parse lại, chỉ chunk mới được embed; điểm cũ của
+file đổi và của file đã bị xoá được xoá khỏi collection sau khi phần mới đã upsert xong.
+Manifest chỉ ghi nhận một file khi đã xử lý xong nên chạy lại sau khi crash sẽ tiếp tục.
+"""
+import json
+import os
+import re
+import threading
+import time
+import uuid
+import xxhash
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".json")
+
+
+def preprocess_data(text):
+    #Xóa URL
+    text = re.sub(r'(https?://\S+|www\.\S+)', '', text)
+    # Xoá các dòng chỉ chứa dấu = hoặc -
+    text = re.sub(r'^[=\-]{2,}\s*$', '', text, flags=re.MULTILINE)
+    #Xoá các ký tự bảng markdown (|, ---)
+    text = re.sub(r'\|.*?\|', '', text)
+    # Xoá emoji và ký tự Unicode không cần thiết
+    text = re.sub(r'[^\w\s,.!?à-ỹÀ-Ỹ\-–]', '', text)
+    # Xoá khoảng trắng thừa và dòng trống
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text
+
+
+def json_to_documents(json_data, source=None):
+    from langchain_core.documents import Document
+
+    docs = []
+    for item in json_data:
+        text = ""
+        for key, value in item.items():
+            text += f"{key}: {value}\n"
+        docs.append(Document(page_content=text, metadata={"source": source} if source else {}))
+    return docs
+
+
+def load_file(path):
+    """Load một file theo phần mở rộng (pdf, docx, json)"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".pdf":
+        from langchain_community.document_loaders import UnstructuredPDFLoader
+        return UnstructuredPDFLoader(path).load()
+    if extension == ".docx":
+        from langchain_community.document_loaders import UnstructuredWordDocumentLoader
+        return UnstructuredWordDocumentLoader(path).load()
+    if extension == ".json":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return json_to_documents(data if isinstance(data, list) else [data], source=path)
+    raise ValueError(f"Unsupported file type: {path}")
+
+
+def text_split(cleaned_data, chunk_size=512, chunk_overlap=20):
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=["\n\n", "\n", ". ", " ", ""]
+    )
+    return text_splitter.split_documents(cleaned_data)
+
+
+def process_file(path, chunk_size=512, chunk_overlap=20):
+    """
+    Chạy trong process con: load -> clean -> split một file.
+    Trả về list dict (picklable) {'page_content', 'metadata'}.
+    """
+    from langchain_core.documents import Document
+
+    cleaned_data = []
+    for doc in load_file(path):
+        cleaned_content = preprocess_data(doc.page_content)
+        if cleaned_content:
+            cleaned_data.append(Document(page_content=cleaned_content, metadata=doc.metadata))
+
+    return [
+        {"page_content": chunk.page_content, "metadata": dict(chunk.metadata, source=path)}
+        for chunk in text_split(cleaned_data, chunk_size, chunk_overlap)
+    ]
+
+
+def discover_files(data_dir):
+    """
+    Liệt kê file hỗ trợ trong data_dir dưới dạng đường dẫn tuyệt đối: ID điểm và khoá manifest
+    không phụ thuộc cách gõ đường dẫn (`./data` hay `/abs/data`) nên không embed lại/tạo điểm trùng.
+    """
+    files = []
+    for root, _, names in os.walk(os.path.abspath(data_dir)):
+        for name in sorted(names):
+            if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                files.append(os.path.join(root, name))
+    return sorted(files)
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}:{int(stat.st_mtime)}"
+
+
+def file_hash(path, block_size=1 << 20):
+    hasher = xxhash.xxh3_128()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def chunk_point_id(source, content, occurrence=0):
+    """
+    ID điểm tất định từ hash nội dung chunk. Kèm nguồn để hai file trùng đoạn văn không
+    dùng chung điểm (xoá file này không làm mất chunk của file kia), kèm số lần lặp
+    để các chunk giống hệt nhau trong cùng file vẫn giữ đủ.
+    """
+    digest = xxhash.xxh3_128_digest(f"{source}\x00{occurrence}\x00{content}".encode("utf-8"))
+    return str(uuid.UUID(bytes=digest))
+
+
+def ensure_collection(client, collection_name, vector_size, recreate=False, quantization=None):
+    """
+    Tạo collection nếu chưa có (hoặc tạo lại khi recreate).
+    quantization: none | scalar | binary; với collection đã có thì cập nhật cấu hình lượng tử hoá.
+    """
+    from qdrant_client.models import Distance, VectorParams
+    from app.core_rag.qdrant_search import quantization_config
+
+    exists = client.collection_exists(collection_name)
+    if exists and recreate:
+        client.delete_collection(collection_name)
+        exists = False
+    if not exists:
+        client.create_collection(
+            collection_name=collection_name,
+            vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE),
+            quantization_config=quantization_config(quantization),
+        )
+    elif quantization and quantization != "none":
+        client.update_collection(
+            collection_name=collection_name,
+            quantization_config=quantization_config(quantization),
+        )
+
+
+class Manifest:
+    """
+    Trạng thái nạp của từng file nguồn: path -> {signature (size:mtime), hash, points}.
+    Ghi nguyên tử, gộp các lần ghi liên tiếp (tối đa mỗi `flush_interval` giây);
+    nếu crash thì các file chưa kịp ghi chỉ bị xử lý lại, ID tất định nên không tạo điểm trùng.
+    """
+
+    def __init__(self, path, collection_name, flush_interval=2.0):
+        self.path = path
+        self.collection_name = collection_name
+        self.flush_interval = flush_interval
+        self.files = {}
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("collection") == collection_name:
+                self.files = self._normalize(data.get("files", {}))
+
+    @staticmethod
+    def _normalize(files):
+        """
+        Manifest cũ lưu đường dẫn như khi gõ lệnh: chuẩn hoá về tuyệt đối để khớp discover_files.
+        Cùng một file dưới hai cách viết thì gộp điểm và bỏ signature/hash để file được nạp lại:
+        điểm trùng (ID theo đường dẫn cũ) bị coi là stale và xoá.
+        """
+        normalized = {}
+        for file_path, entry in files.items():
+            file_path = os.path.abspath(file_path)
+            if file_path in normalized:
+                previous = normalized[file_path]
+                entry = {"signature": "", "hash": "",
+                         "points": list(dict.fromkeys(previous["points"] + entry["points"]))}
+            normalized[file_path] = entry
+        return normalized
+
+    def get(self, file_path):
+        return self.files.get(file_path)
+
+    def is_unchanged(self, file_path):
+        """So khớp nhanh theo size:mtime, nếu khác thì so hash nội dung (file chỉ bị touch/copy lại)"""
+        entry = self.files.get(file_path)
+        if entry is None:
+            return False, None
+        signature = file_signature(file_path)
+        if entry["signature"] == signature:
+            return True, entry["hash"]
+        content_hash = file_hash(file_path)
+        if entry["hash"] == content_hash:
+            self.update(file_path, content_hash, entry["points"])
+            return True, content_hash
+        return False, content_hash
+
+    def update(self, file_path, content_hash, point_ids):
+        with self._lock:
+            self.files[file_path] = {
+                "signature": file_signature(file_path),
+                "hash": content_hash,
+                "points": list(point_ids),
+            }
+        self.save()
+
+    def remove(self, file_path):
+        with self._lock:
+            self.files.pop(file_path, None)
+        self.save()
+
+    def missing_sources(self):
+        return [file_path for file_path in self.files if not os.path.exists(file_path)]
+
+    def save(self, force=False):
+        if not self.path:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last_flush < self.flush_interval:
+                return
+            self._last_flush = now
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"collection": self.collection_name, "files": self.files}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    def reset(self):
+        with self._lock:
+            self.files = {}
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def manifest_fingerprint(manifest):
+    """Version dữ liệu của collection suy ra từ manifest: đổi khi có file mới, file đổi nội dung hoặc bị xoá"""
+    digest = xxhash.xxh64()
+    for file_path in sorted(manifest.files):
+        entry = manifest.files[file_path]
+        digest.update(f"{file_path}\0{entry['hash']}\0{len(entry['points'])}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def write_collection_version(path, collection_name, version):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"collection": collection_name, "version": version, "updated_at": time.time()}, f)
+    os.replace(tmp_path, path)
+
+
+class CollectionVersion:
+    """
+    Version dữ liệu collection do `rag ingest` ghi ra file (chuỗi rỗng nếu chưa có).
+    Đọc lại khi mtime của file đổi nên mọi worker thấy version mới ngay sau lần nạp dữ liệu.
+    """
+
+    def __init__(self, path, collection_name):
+        self.path = path
+        self.collection_name = collection_name
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._version = ""
+
+    def get(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        with self._lock:
+            if mtime != self._mtime:
+                self._mtime = mtime
+                self._version = self._read() if mtime is not None else ""
+            return self._version
+
+    def _read(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return ""
+        return data.get("version", "") if data.get("collection") == self.collection_name else ""
+
+
+class IngestionPipeline:
+    def __init__(self, client, embeddings, collection_name, manifest, workers=None,
+                 embed_batch_size=64, upsert_batch_size=256, upsert_concurrency=4,
+                 chunk_size=512, chunk_overlap=20, progress=True):
+        self.client = client
+        self.embeddings = embeddings
+        self.collection_name = collection_name
+        self.manifest = manifest
+        self.workers = workers or max((os.cpu_count() or 2) - 1, 1)
+        self.embed_batch_size = embed_batch_size
+        self.upsert_batch_size = upsert_batch_size
+        self.upsert_concurrency = upsert_concurrency
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.progress = progress
+
+        self._pending = {}  # file -> {'remaining', 'hash', 'points', 'stale'} chờ upsert xong
+        self._pending_lock = threading.Lock()
+        self._upsert_slots = threading.BoundedSemaphore(upsert_concurrency)
+        self._upsert_errors = []
+        self.stats = {
+            "files": 0, "skipped_files": 0, "removed_files": 0,
+            "chunks": 0, "unchanged_chunks": 0, "deleted_chunks": 0,
+        }
+
+    def _progress_bar(self, total, desc, unit):
+        if not self.progress:
+            return None
+        from tqdm import tqdm
+        return tqdm(total=total, desc=desc, unit=unit)
+
+    def _delete_points(self, point_ids):
+        if not point_ids:
+            return
+        from qdrant_client.models import PointIdsList
+
+        point_ids = list(point_ids)
+        for start in range(0, len(point_ids), self.upsert_batch_size):
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=PointIdsList(points=point_ids[start:start + self.upsert_batch_size]),
+                wait=True,
+            )
+        with self._pending_lock:
+            self.stats["deleted_chunks"] += len(point_ids)
+
+    def remove_missing_sources(self):
+        """Xoá điểm của các file nguồn không còn tồn tại"""
+        for file_path in self.manifest.missing_sources():
+            self._delete_points(self.manifest.get(file_path)["points"])
+            self.manifest.remove(file_path)
+            self.stats["removed_files"] += 1
+
+    def _changed_files(self, files):
+        changed = []
+        for path in files:
+            unchanged, content_hash = self.manifest.is_unchanged(path)
+            if unchanged:
+                self.stats["skipped_files"] += 1
+            else:
+                changed.append((path, content_hash))
+        return changed
+
+    def run(self, files, prune=True):
+        if prune:
+            self.remove_missing_sources()
+        files = self._changed_files(files)
+        file_bar = self._progress_bar(len(files), "files", "file")
+        chunk_bar = self._progress_bar(None, "chunks", "chunk")
+
+        buffer = []
+        upsert_pool = ThreadPoolExecutor(max_workers=self.upsert_concurrency, thread_name_prefix="qdrant-upsert")
+        with ProcessPoolExecutor(max_workers=self.workers) as parse_pool:
+            pending = {}
+            queue = iter(files)
+
+            def submit_next():
+                item = next(queue, None)
+                if item is not None:
+                    future = parse_pool.submit(process_file, item[0], self.chunk_size, self.chunk_overlap)
+                    pending[future] = item
+
+            # Giới hạn số file đang parse để bộ nhớ không tăng theo số file
+            for _ in range(self.workers * 2):
+                submit_next()
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path, content_hash = pending.pop(future)
+                    submit_next()
+                    chunks = future.result()
+                    self.stats["files"] += 1
+                    if file_bar is not None:
+                        file_bar.update(1)
+                    buffer.extend(self._plan_file(path, content_hash or file_hash(path), chunks))
+                    if len(buffer) >= self.upsert_batch_size:
+                        self._flush(buffer, upsert_pool, chunk_bar)
+                        buffer = []
+
+        if buffer:
+            self._flush(buffer, upsert_pool, chunk_bar)
+        upsert_pool.shutdown(wait=True)
+        self.manifest.save(force=True)
+
+        for bar in (file_bar, chunk_bar):
+            if bar is not None:
+                bar.close()
+        if self._upsert_errors:
+            raise RuntimeError(f"{len(self._upsert_errors)} upsert batch(es) failed: {self._upsert_errors[0]}")
+        return self.stats
+
+    def _plan_file(self, path, content_hash, chunks):
+        """So ID chunk mới với manifest, trả về các chunk cần embed; chunk đã có giữ nguyên"""
+        occurrences = {}
+        point_ids = []
+        for chunk in chunks:
+            content = chunk["page_content"]
+            occurrence = occurrences.get(content, 0)
+            occurrences[content] = occurrence + 1
+            point_ids.append(chunk_point_id(path, content, occurrence))
+
+        entry = self.manifest.get(path)
+        old_ids = set(entry["points"]) if entry else set()
+        new_items = [
+            (path, point_id, chunk) for point_id, chunk in zip(point_ids, chunks)
+            if point_id not in old_ids
+        ]
+        stale = old_ids.difference(point_ids)
+        self.stats["unchanged_chunks"] += len(chunks) - len(new_items)
+
+        if not new_items:
+            self._finish_file(path, content_hash, point_ids, stale)
+            return []
+        with self._pending_lock:
+            self._pending[path] = {
+                "remaining": len(new_items), "hash": content_hash, "points": point_ids, "stale": stale,
+            }
+        return new_items
+
+    def _finish_file(self, path, content_hash, point_ids, stale):
+        # Xoá điểm cũ sau khi điểm mới đã có để truy vấn đang chạy không bị thiếu tài liệu
+        self._delete_points(stale)
+        self.manifest.update(path, content_hash, point_ids)
+
+    def _flush(self, buffer, upsert_pool, chunk_bar):
+        """Embed một batch upsert (theo từng lô embed_batch_size) rồi đẩy sang thread upsert,
+        chặn khi đã đủ số request đồng thời để embedding không chạy quá xa Qdrant"""
+        from qdrant_client.models import PointStruct
+
+        texts = [chunk["page_content"] for _, _, chunk in buffer]
+        vectors = []
+        for start in range(0, len(texts), self.embed_batch_size):
+            vectors.extend(self.embeddings.embed_documents(texts[start:start + self.embed_batch_size]))
+        points = [
+            PointStruct(id=point_id, vector=vector, payload=chunk)
+            for (_, point_id, chunk), vector in zip(buffer, vectors)
+        ]
+
+        self._upsert_slots.acquire()
+        upsert_pool.submit(self._upsert, points, [path for path, _, _ in buffer], chunk_bar)
+
+    def _upsert(self, points, sources, chunk_bar):
+        try:
+            self.client.upsert(collection_name=self.collection_name, points=points, wait=True)
+            if chunk_bar is not None:
+                chunk_bar.update(len(points))
+
+            finished = []
+            with self._pending_lock:
+                self.stats["chunks"] += len(points)
+                for path in sources:
+                    state = self._pending[path]
+                    state["remaining"] -= 1
+                    if state["remaining"] == 0:
+                        finished.append((path, self._pending.pop(path)))
+            for path, state in finished:
+                self._finish_file(path, state["hash"], state["points"], state["stale"])
+        except Exception as e:
+            self._upsert_errors.append(str(e))
+        finally:
+            self._upsert_slots.release()
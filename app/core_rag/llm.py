@@ -0,0 +1,216 @@
+"""
+Gọi LLM qua nhiều model OpenAI-compatible với deadline, hedged request và fallback:
+- mỗi request có một deadline chung (toàn bộ câu trả lời với invoke, token đầu tiên với stream)
+- hedge: nếu model hiện tại chưa có kết quả/token đầu sau `hedge_after_ms` thì gửi thêm
+  request tới model kế tiếp, lấy bên nào xong trước
+- fallback: model lỗi thì chuyển sang model tiếp theo trong chuỗi cho tới khi hết deadline
+"""
+import queue
+import threading
+import time
+
+
+class LLMTimeoutError(TimeoutError):
+    pass
+
+
+class LLMUnavailableError(RuntimeError):
+    pass
+
+
+class _Attempt:
+    """Một request tới một model, chạy ở thread riêng và đẩy sự kiện vào hàng đợi chung"""
+
+    def __init__(self, index, model, hedge=False):
+        self.index = index
+        self.model = model
+        self.hedge = hedge
+        self.start = time.perf_counter()
+        self.cancelled = threading.Event()
+
+
+class LLMRouter:
+    def __init__(self, models, api_key, api_base, temperature=0.4, max_tokens=2048,
+                 timeout=30.0, stream_idle_timeout=15.0, hedge_after_ms=0, metrics=None):
+        if not models:
+            raise ValueError("At least one LLM model is required")
+        self.models = list(models)
+        self.api_key = api_key
+        self.api_base = api_base
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+        self.stream_idle_timeout = stream_idle_timeout
+        self.hedge_after = hedge_after_ms / 1000 if hedge_after_ms else None
+        self.metrics = metrics
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'requests': 0, 'timeouts': 0, 'failures': 0, 'fallbacks': 0, 'hedges': 0, 'hedge_wins': 0,
+            'answered_by': {model: 0 for model in self.models},
+        }
+
+    def _client(self, model):
+        with self._lock:
+            client = self._clients.get(model)
+            if client is None:
+                from langchain_community.chat_models import ChatOpenAI
+                client = ChatOpenAI(
+                    model=model,
+                    openai_api_key=self.api_key,
+                    openai_api_base=self.api_base,
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens,
+                    request_timeout=self.timeout,
+                    # Không retry trong client, việc thử lại do chuỗi fallback đảm nhiệm
+                    max_retries=0,
+                )
+                self._clients[model] = client
+            return client
+
+    def _count(self, key, model=None):
+        with self._lock:
+            if model is None:
+                self._stats[key] += 1
+            else:
+                self._stats[key][model] = self._stats[key].get(model, 0) + 1
+
+    def _record(self, attempt, error=False):
+        if self.metrics is not None:
+            self.metrics.record(f"llm[{attempt.model}]", (time.perf_counter() - attempt.start) * 1000, error=error)
+
+    def _start(self, index, model, messages, events, streaming, hedge=False):
+        attempt = _Attempt(index, model, hedge)
+
+        def run():
+            try:
+                client = self._client(model)
+                if not streaming:
+                    events.put(("result", attempt, client.invoke(messages)))
+                    return
+                stream = client.stream(messages)
+                try:
+                    for chunk in stream:
+                        if attempt.cancelled.is_set():
+                            break
+                        events.put(("chunk", attempt, chunk))
+                finally:
+                    stream.close()
+                events.put(("end", attempt, None))
+            except Exception as e:
+                events.put(("error", attempt, e))
+
+        threading.Thread(target=run, name=f"llm-{model}", daemon=True).start()
+        return attempt
+
+    def _race(self, messages, streaming, timings=None):
+        """
+        Chạy chuỗi fallback/hedge cho tới khi có model trả về kết quả (invoke) hoặc
+        chunk có nội dung đầu tiên (stream). Trả về (attempt thắng, sự kiện đầu, hàng đợi).
+        """
+        self._count('requests')
+        events = queue.Queue()
+        pending = list(self.models)
+        deadline = time.monotonic() + self.timeout
+        running = []
+        last_error = None
+        index = 0
+
+        def launch(hedge=False):
+            nonlocal index
+            attempt = self._start(index, pending.pop(0), messages, events, streaming, hedge)
+            index += 1
+            running.append(attempt)
+            return attempt
+
+        launch()
+        hedge_at = time.monotonic() + self.hedge_after if self.hedge_after and pending else None
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                for attempt in running:
+                    attempt.cancelled.set()
+                    self._record(attempt, error=True)
+                self._count('timeouts')
+                raise LLMTimeoutError(f"No LLM response within {self.timeout}s ({last_error or 'timeout'})")
+
+            wait_until = min(deadline, hedge_at) if hedge_at else deadline
+            try:
+                kind, attempt, payload = events.get(timeout=max(wait_until - now, 0))
+            except queue.Empty:
+                if hedge_at and time.monotonic() >= hedge_at:
+                    # Model hiện tại chậm -> gửi thêm request dự phòng tới model kế tiếp
+                    launch(hedge=True)
+                    self._count('hedges')
+                    hedge_at = None
+                continue
+
+            if attempt not in running:
+                continue  # sự kiện của request đã bị bỏ
+            if kind == "error" or kind == "end":
+                # Lỗi hoặc stream kết thúc mà không có nội dung -> thử model tiếp theo
+                running.remove(attempt)
+                self._record(attempt, error=True)
+                last_error = payload if kind == "error" else "empty response"
+                if not running:
+                    if not pending:
+                        self._count('failures')
+                        raise LLMUnavailableError(f"All LLM models failed: {last_error}")
+                    launch()
+                    self._count('fallbacks')
+                    hedge_at = time.monotonic() + self.hedge_after if self.hedge_after and pending else None
+                continue
+            if kind == "chunk" and not payload.content:
+                continue
+
+            for other in running:
+                if other is not attempt:
+                    other.cancelled.set()
+            if attempt.hedge:
+                self._count('hedge_wins')
+            self._count('answered_by', attempt.model)
+            if timings is not None:
+                timings["llm_model"] = attempt.model
+            return attempt, payload, events
+
+    def invoke(self, messages, timings=None):
+        attempt, response, _ = self._race(messages, streaming=False, timings=timings)
+        self._record(attempt)
+        return response
+
+    def stream(self, messages, timings=None):
+        """Generator các chunk của model thắng; đóng generator sẽ huỷ request đang chạy"""
+        attempt, chunk, events = self._race(messages, streaming=True, timings=timings)
+        error = False
+        try:
+            yield chunk
+            while True:
+                try:
+                    kind, source, payload = events.get(timeout=self.stream_idle_timeout)
+                except queue.Empty:
+                    raise LLMTimeoutError(f"LLM stream idle for {self.stream_idle_timeout}s")
+                if source is not attempt:
+                    continue
+                if kind == "chunk":
+                    yield payload
+                elif kind == "end":
+                    return
+                else:
+                    raise payload
+        except GeneratorExit:
+            raise  # client ngắt kết nối, không tính là lỗi của model
+        except BaseException:
+            error = True
+            raise
+        finally:
+            attempt.cancelled.set()
+            self._record(attempt, error=error)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['answered_by'] = dict(self._stats['answered_by'])
+        stats['models'] = list(self.models)
+        stats['hedge_after_ms'] = self.hedge_after * 1000 if self.hedge_after else 0
+        stats['timeout_s'] = self.timeout
+        return stats
@@ -0,0 +1,226 @@
+import json
+import os
+import numpy as np
+from app.core_rag.payload_store import JsonlPayloadStore, record_to_document, write_jsonl
+
+# Số vector nhân ma trận mỗi lần khi quét toàn bộ, giới hạn bộ nhớ tạm
+_SCAN_CHUNK = 65536
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _quantize(vectors, dtype):
+    """Trả về (vector đã mã hoá, scale) - int8 dùng scale riêng cho từng vector"""
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.round(vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    return vectors.astype(np.float16), None
+
+
+def _kmeans(vectors, n_lists, iterations=10, seed=0):
+    # k-means cầu (spherical) đơn giản bằng numpy cho vector đã chuẩn hoá
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        for i in range(n_lists):
+            members = vectors[assign == i]
+            if len(members):
+                centroids[i] = members.mean(axis=0)
+        centroids = _normalize(centroids)
+    return centroids.astype(np.float32)
+
+
+def _point_vector(point, vector_name=None):
+    # Collection tạo bởi LangChain dùng vector không tên; collection có named vectors trả về dict
+    if isinstance(point.vector, dict):
+        return point.vector[vector_name] if vector_name else next(iter(point.vector.values()))
+    return point.vector
+
+
+def export_snapshot(client, collection_name, path, dtype="float16", n_lists=0, batch_size=1024,
+                    sample_size=100_000, vector_name=None):
+    """
+    Snapshot collection Qdrant ra thư mục `path`:
+    - vectors.npy: vector đã chuẩn hoá (float16 hoặc int8 + scales.npy), đọc bằng mmap
+    - docs.jsonl + offsets: payload của từng chunk
+    - centroids.npy / list_ids.npy / list_offsets.npy nếu n_lists > 0 (IVF lượng tử hoá thô)
+    Ghi vào thư mục tạm rồi đổi tên để worker đang đọc snapshot cũ không bị ảnh hưởng.
+    """
+    total = client.count(collection_name=collection_name, exact=True).count
+    tmp_path = f"{path}.tmp"
+    os.makedirs(tmp_path, exist_ok=True)
+
+    codes = None
+    scales = np.zeros(total, dtype=np.float32)
+    records = []
+    written = 0
+    offset = None
+    while written < total:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        if not points:
+            break
+        batch = _normalize(np.asarray([_point_vector(point, vector_name) for point in points], dtype=np.float32))
+        batch = batch[:total - written]
+        if codes is None:
+            codes = np.lib.format.open_memmap(
+                os.path.join(tmp_path, "vectors.npy"), mode="w+",
+                dtype=np.int8 if dtype == "int8" else np.float16, shape=(total, batch.shape[1])
+            )
+        encoded, batch_scales = _quantize(batch, dtype)
+        codes[written:written + len(batch)] = encoded
+        if batch_scales is not None:
+            scales[written:written + len(batch)] = batch_scales
+        for point in points[:len(batch)]:
+            payload = point.payload or {}
+            records.append({
+                "id": str(point.id),
+                "page_content": payload.get("page_content", ""),
+                "metadata": payload.get("metadata") or {},
+            })
+        written += len(batch)
+        if offset is None:
+            break
+
+    if codes is None:
+        raise ValueError(f"Collection {collection_name} is empty")
+    codes.flush()
+
+    offsets = write_jsonl(os.path.join(tmp_path, "docs.jsonl"), records)
+    np.save(os.path.join(tmp_path, "offsets.npy"), offsets)
+    if dtype == "int8":
+        np.save(os.path.join(tmp_path, "scales.npy"), scales[:written])
+
+    if n_lists:
+        # Train centroid trên một mẫu, gán cụm theo từng khối để không phải giải nén toàn bộ vào RAM
+        int8_scales = scales if dtype == "int8" else None
+        sample_ids = np.sort(np.random.default_rng(0).choice(written, min(written, sample_size), replace=False))
+        centroids = _kmeans(_decode(codes, int8_scales, sample_ids), n_lists)
+        assign = np.concatenate([
+            np.argmax(_decode(codes, int8_scales, slice(i, min(i + _SCAN_CHUNK, written))) @ centroids.T, axis=1)
+            for i in range(0, written, _SCAN_CHUNK)
+        ])
+        list_ids = np.argsort(assign, kind="stable").astype(np.int64)
+        list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=n_lists))]).astype(np.int64)
+        np.save(os.path.join(tmp_path, "centroids.npy"), centroids)
+        np.save(os.path.join(tmp_path, "list_ids.npy"), list_ids)
+        np.save(os.path.join(tmp_path, "list_offsets.npy"), list_offsets)
+
+    with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "collection_name": collection_name,
+            "count": written,
+            "dim": int(codes.shape[1]),
+            "dtype": dtype,
+            "n_lists": n_lists,
+        }, f)
+    del codes
+
+    if os.path.exists(path):
+        old_path = f"{path}.old"
+        if os.path.exists(old_path):
+            _remove_tree(old_path)
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    return written
+
+
+def _remove_tree(path):
+    for name in os.listdir(path):
+        os.remove(os.path.join(path, name))
+    os.rmdir(path)
+
+
+def _decode(codes, scales, selector):
+    vectors = np.asarray(codes[selector], dtype=np.float32)
+    if scales is not None:
+        vectors *= scales[selector][:, None]
+    return vectors
+
+
+class LocalVectorIndex:
+    """
+    Tầng tìm kiếm trong process trên snapshot mmap (np.load mmap_mode='r'),
+    các worker cùng máy dùng chung page cache nên không nhân bản bộ nhớ.
+    Tìm chính xác bằng nhân ma trận theo khối, hoặc chỉ quét nprobe cụm gần nhất nếu có IVF.
+    """
+
+    def __init__(self, path, nprobe=8):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.nprobe = nprobe
+        # File có thể dư hàng trống nếu collection bị xoá bớt điểm trong lúc export
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")[:self.meta["count"]]
+        self.scales = None
+        if self.meta["dtype"] == "int8":
+            self.scales = np.load(os.path.join(path, "scales.npy"), mmap_mode="r")
+        self.payloads = JsonlPayloadStore(
+            os.path.join(path, "docs.jsonl"), np.load(os.path.join(path, "offsets.npy"))
+        )
+        self.centroids = None
+        if self.meta.get("n_lists"):
+            self.centroids = np.load(os.path.join(path, "centroids.npy"))
+            self.list_ids = np.load(os.path.join(path, "list_ids.npy"), mmap_mode="r")
+            self.list_offsets = np.load(os.path.join(path, "list_offsets.npy"))
+
+    @staticmethod
+    def exists(path):
+        return bool(path) and os.path.exists(os.path.join(path, "meta.json"))
+
+    def __len__(self):
+        return self.meta["count"]
+
+    def _score(self, selector, query):
+        # selector là slice (quét tuần tự) hoặc mảng vị trí (các cụm IVF được chọn)
+        scores = np.asarray(self.vectors[selector], dtype=np.float32) @ query
+        if self.scales is not None:
+            scores *= self.scales[selector]
+        return scores
+
+    def search(self, vector, k=20):
+        """Trả về list (vị trí, cosine score) giảm dần"""
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        if self.centroids is not None:
+            probes = np.argsort(-(self.centroids @ query))[:self.nprobe]
+            ids = np.concatenate([
+                self.list_ids[self.list_offsets[p]:self.list_offsets[p + 1]] for p in probes
+            ])
+            ids.sort()  # đọc mmap theo thứ tự để tận dụng đọc tuần tự
+            scores = self._score(ids, query)
+        else:
+            ids = None
+            scores = np.empty(len(self), dtype=np.float32)
+            for i in range(0, len(self), _SCAN_CHUNK):
+                scores[i:i + _SCAN_CHUNK] = self._score(slice(i, i + _SCAN_CHUNK), query)
+
+        k = min(k, len(scores))
+        if not k:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        positions = ids[top] if ids is not None else top
+        return [(int(pos), float(scores[i])) for pos, i in zip(positions, top)]
+
+    def similarity_search_by_vector(self, vector, k=20):
+        docs = []
+        for pos, score in self.search(vector, k):
+            doc = record_to_document(self.payloads.get(pos))
+            doc.metadata["score"] = score
+            docs.append(doc)
+        return docs
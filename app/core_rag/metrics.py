@@ -0,0 +1,83 @@
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class StageMetrics:
+    """
+    Đo thời gian từng stage của pipeline RAG (history, embed, search, prompt, llm...)
+    Mỗi stage giữ một cửa sổ trượt các lần đo gần nhất để tính p50/p95/p99
+    """
+
+    def __init__(self, window=1024):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._counts = {}
+        self._errors = {}
+
+    def record(self, name, duration_ms, error=False):
+        with self._lock:
+            if name not in self._samples:
+                self._samples[name] = deque(maxlen=self.window)
+                self._counts[name] = 0
+                self._errors[name] = 0
+            self._samples[name].append(duration_ms)
+            self._counts[name] += 1
+            if error:
+                self._errors[name] += 1
+
+    @contextmanager
+    def stage(self, name, timings=None):
+        """
+        Bấm giờ một stage. Nếu truyền `timings` (dict) thì thời gian (ms)
+        của request hiện tại cũng được ghi vào đó để log theo từng request
+        """
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            self.record(name, duration_ms, error=error)
+            if timings is not None:
+                timings[name] = round(duration_ms, 1)
+
+    def snapshot(self):
+        """Trả về histogram của tất cả stage dưới dạng dict (dùng cho JSON)"""
+        with self._lock:
+            data = {
+                name: (sorted(samples), self._counts[name], self._errors[name])
+                for name, samples in self._samples.items()
+            }
+
+        result = {}
+        for name, (samples, count, errors) in data.items():
+            result[name] = {
+                'count': count,
+                'errors': errors,
+                'p50_ms': _percentile(samples, 50),
+                'p95_ms': _percentile(samples, 95),
+                'p99_ms': _percentile(samples, 99),
+                'max_ms': round(samples[-1], 1) if samples else None,
+            }
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+            self._errors.clear()
+
+
+def _percentile(sorted_samples, percent):
+    # Nearest-rank percentile trên danh sách đã sắp xếp
+    if not sorted_samples:
+        return None
+    rank = max(math.ceil(percent / 100 * len(sorted_samples)) - 1, 0)
+    return round(sorted_samples[rank], 1)
@@ -0,0 +1,47 @@
+import json
+import mmap
+import os
+import numpy as np
+from langchain_core.documents import Document
+
+
+def write_jsonl(path, records):
+    """
+    Ghi các record {'id', 'page_content', 'metadata'} ra file JSONL,
+    trả về mảng offset (n + 1 phần tử) để đọc ngẫu nhiên từng dòng.
+    """
+    offsets = [0]
+    with open(path, "wb") as f:
+        for record in records:
+            line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+            f.write(line)
+            offsets.append(offsets[-1] + len(line))
+    return np.asarray(offsets, dtype=np.int64)
+
+
+class JsonlPayloadStore:
+    """Đọc payload theo vị trí qua mmap, các worker dùng chung page cache của OS"""
+
+    def __init__(self, path, offsets):
+        self.offsets = offsets
+        self._mmap = None
+        if os.path.getsize(path):
+            with open(path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def get(self, idx):
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        return json.loads(self._mmap[start:end])
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self.get(idx)
+
+
+def record_to_document(record):
+    metadata = dict(record.get("metadata") or {})
+    metadata["_id"] = record["id"]
+    return Document(page_content=record["page_content"], metadata=metadata)
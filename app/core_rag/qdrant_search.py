@@ -0,0 +1,84 @@
+from langchain_core.documents import Document
+
+# Payload mà prompt cần: nội dung chunk + nguồn; bỏ phần metadata còn lại để giảm dữ liệu trả về
+DEFAULT_PAYLOAD_FIELDS = ("page_content", "metadata.source")
+
+QUANTIZATION_TYPES = ("none", "scalar", "binary")
+
+
+def build_qdrant_client(url, api_key=None, prefer_grpc=False, grpc_port=6334, timeout=None):
+    from qdrant_client import QdrantClient
+
+    if url == ":memory:":
+        # Qdrant chạy trong process (load test / benchmark), mỗi client là một instance riêng
+        return QdrantClient(location=":memory:")
+    return QdrantClient(url=url, api_key=api_key, prefer_grpc=prefer_grpc, grpc_port=grpc_port, timeout=timeout)
+
+
+def quantization_config(kind):
+    """Cấu hình lượng tử hoá khi tạo collection: scalar (int8) hoặc binary, giữ bản nén trong RAM"""
+    from qdrant_client import models
+
+    if not kind or kind == "none":
+        return None
+    if kind == "scalar":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    if kind == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+    raise ValueError(f"Unsupported quantization: {kind}")
+
+
+def search_params(hnsw_ef=None, rescore=True, oversampling=None, exact=False):
+    from qdrant_client import models
+
+    quantization = None
+    if rescore is not None or oversampling:
+        # Tìm trên vector nén, lấy dư `oversampling` lần rồi chấm lại bằng vector gốc
+        quantization = models.QuantizationSearchParams(rescore=rescore, oversampling=oversampling or None)
+    return models.SearchParams(hnsw_ef=hnsw_ef or None, exact=exact, quantization=quantization)
+
+
+def payload_selector(fields):
+    from qdrant_client import models
+
+    if not fields:
+        return True
+    return models.PayloadSelectorInclude(include=list(fields))
+
+
+class QdrantSearcher:
+    """
+    Tìm kiếm similarity trực tiếp bằng QdrantClient.query_points thay cho QdrantVectorStore:
+    tham số HNSW/lượng tử hoá theo cấu hình và chỉ lấy các trường payload cần cho prompt.
+    """
+
+    def __init__(self, client, collection_name, hnsw_ef=None, rescore=True, oversampling=None,
+                 payload_fields=DEFAULT_PAYLOAD_FIELDS, vector_name=None):
+        self.client = client
+        self.collection_name = collection_name
+        self.vector_name = vector_name
+        self.params = search_params(hnsw_ef, rescore, oversampling)
+        self.with_payload = payload_selector(payload_fields)
+
+    def search(self, vector, k=20):
+        return self.client.query_points(
+            collection_name=self.collection_name,
+            query=list(vector),
+            using=self.vector_name,
+            limit=k,
+            search_params=self.params,
+            with_payload=self.with_payload,
+            with_vectors=False,
+        ).points
+
+    def similarity_search_by_vector(self, vector, k=20):
+        docs = []
+        for point in self.search(vector, k):
+            payload = point.payload or {}
+            metadata = dict(payload.get("metadata") or {})
+            metadata["_id"] = str(point.id)
+            metadata["score"] = point.score
+            docs.append(Document(page_content=payload.get("page_content", ""), metadata=metadata))
+        return docs
@@ -0,0 +1,77 @@
+import threading
+import xxhash
+from cachetools import LRUCache
+
+
+class CrossEncoderReranker:
+    """
+    Rerank tài liệu bằng cross-encoder (mặc định itdainb/PhoRanker) chạy trên CPU.
+    Model chỉ được load ở lần rerank đầu tiên; điểm của từng cặp (query, chunk)
+    được cache nên các câu hỏi lặp lại không phải chấm điểm lại.
+    """
+
+    def __init__(self, model_name, top_n=5, batch_size=16, max_length=256, cache_size=4096, device="cpu"):
+        self.model_name = model_name
+        self.top_n = top_n
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.device = device
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._scores = LRUCache(maxsize=cache_size)
+        self._scores_lock = threading.Lock()
+
+    @property
+    def is_loaded(self):
+        return self._model is not None
+
+    def _get_model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(
+                        self.model_name,
+                        max_length=self.max_length,
+                        device=self.device
+                    )
+        return self._model
+
+    @staticmethod
+    def _pair_key(query, text):
+        return xxhash.xxh64_hexdigest(f"{query}\x00{text}")
+
+    def score(self, query, texts):
+        """Chấm điểm các cặp (query, text), chỉ đưa vào model những cặp chưa có trong cache"""
+        keys = [self._pair_key(query, text) for text in texts]
+        scores = [None] * len(texts)
+
+        with self._scores_lock:
+            for i, key in enumerate(keys):
+                scores[i] = self._scores.get(key)
+
+        missing = [i for i, value in enumerate(scores) if value is None]
+        if missing:
+            pairs = [[query, texts[i]] for i in missing]
+            predicted = self._get_model().predict(
+                pairs,
+                batch_size=self.batch_size,
+                show_progress_bar=False
+            )
+            with self._scores_lock:
+                for i, value in zip(missing, predicted):
+                    scores[i] = float(value)
+                    self._scores[keys[i]] = scores[i]
+
+        return scores
+
+    def rerank(self, query, docs, top_n=None):
+        """Sắp xếp tài liệu theo điểm giảm dần và giữ lại top_n"""
+        if not docs:
+            return []
+        top_n = top_n or self.top_n
+        scores = self.score(query, [doc.page_content for doc in docs])
+        reranked = sorted(zip(docs, scores), key=lambda x: x[1], reverse=True)
+        for doc, value in reranked:
+            doc.metadata['rerank_score'] = value
+        return [doc for doc, _ in reranked[:top_n]]
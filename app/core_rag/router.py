@@ -0,0 +1,195 @@
+"""
+Phân loại ý định câu hỏi trước khi chạy RAG, không gọi mạng:
+- smalltalk: chào hỏi / cảm ơn / xã giao -> prompt ngắn, không tìm kiếm tài liệu
+- stock: hỏi giá một mã cổ phiếu -> dữ liệu yfinance thay vì tìm kiếm tài liệu
+- rag: còn lại -> pipeline RAG đầy đủ
+
+Luật từ khoá chạy trước; câu ngắn mà luật không quyết được thì dùng bộ phân loại
+nearest-centroid trên embedding của câu hỏi (vector được trả lại để RAG dùng tiếp).
+"""
+import re
+import threading
+import numpy as np
+
+SMALLTALK = "smalltalk"
+STOCK = "stock"
+RAG = "rag"
+
+# Câu hỏi đã chuẩn hoá (chữ thường, không dấu câu), cho phép thêm tối đa 2 từ ở cuối ("cảm ơn bạn nhiều")
+_SMALLTALK_RE = re.compile(
+    r"^(?:xin |ok |dạ |vâng )?(?:"
+    r"chào|chao|hi|hello|hey|alo|"
+    r"cảm ơn|cám ơn|cam on|thanks|thank you|tks|"
+    r"tạm biệt|tam biet|bye|goodbye|"
+    r"bạn là ai|bạn tên gì|bạn làm được gì|bạn có thể làm gì|ban la ai"
+    r")(?: \w+){0,2}$"
+)
+# Lời đáp ngắn ("ok", "dạ"): chỉ là xã giao khi đứng một mình và hội thoại chưa có lịch sử,
+# còn lại thường là câu tiếp nối ("ok tiếp tục", "dạ cho hỏi") cần lịch sử -> RAG
+_ACK_RE = re.compile(r"^(?:ok|oke|okay|được rồi|vâng|dạ|ừ|uh)(?: |$)")
+
+# Có các từ này thì không coi là xã giao ("chào bạn, lãi suất tiết kiệm bao nhiêu")
+FINANCE_KEYWORDS = (
+    "tài chính", "đầu tư", "tiết kiệm", "lãi", "vay", "nợ", "cổ phiếu", "chứng khoán", "trái phiếu",
+    "quỹ", "bảo hiểm", "thuế", "ngân sách", "chi tiêu", "thu nhập", "lương", "hưu trí", "tiền",
+    "giá", "vàng", "ngân hàng", "tín dụng", "lạm phát", "tai chinh", "dau tu", "tiet kiem", "co phieu",
+)
+
+# Từ chỉ câu hỏi về giá / diễn biến của mã
+PRICE_KEYWORDS = (
+    "giá", "thị giá", "bao nhiêu", "hôm nay", "tăng", "giảm", "khối lượng", "vốn hoá", "vốn hóa",
+    "gia", "bao nhieu", "hom nay", "price", "quote",
+)
+
+_UPPER_TICKER_RE = re.compile(r"\b([A-Z][A-Z0-9]{2,4}(?:\.[A-Z]{1,3})?)\b")
+_MARKED_TICKER_RE = re.compile(r"\b(?:mã|ma|cổ phiếu|co phieu|cp)\s+([a-z][a-z0-9]{2,4}(?:\.[a-z]{1,3})?)\b")
+
+# Chữ viết tắt / từ không dấu hay gặp, không phải mã cổ phiếu
+NOT_TICKERS = {
+    "ETF", "VND", "USD", "EUR", "JPY", "GDP", "CPI", "EPS", "ROE", "ROA", "NAV", "VAT", "TNCN", "BHXH",
+    "BHYT", "IPO", "FDI", "ATM", "OTP", "PDF", "SJC", "HOSE", "HNX", "UPCOM", "API", "CEO", "CFO",
+    "NAO", "NAY", "HAY", "THE", "NEN", "CHO", "CON", "GIA", "MUA", "BAN", "TOT", "LAI", "VOI", "CUA",
+    "MOI", "TAI", "SAO", "KHI", "DAU", "ROI", "THI", "NHU", "NHE", "VAY", "CAN", "KHONG", "DUOC",
+}
+
+# Mã viết hoa đứng riêng (không có "mã"/"cổ phiếu" phía trước) chỉ được coi là mã cổ phiếu nếu nằm
+# trong danh sách này, tránh nhầm các từ viết tắt như HCM (TP.HCM), FED, RON95 thành mã
+KNOWN_TICKERS = {
+    # VN30
+    "ACB", "BCM", "BID", "BVH", "CTG", "FPT", "GAS", "GVR", "HDB", "HPG", "MBB", "MSN", "MWG", "PLX",
+    "POW", "SAB", "SHB", "SSB", "SSI", "STB", "TCB", "TPB", "VCB", "VHM", "VIB", "VIC", "VJC", "VNM",
+    "VPB", "VRE",
+    # Một số mã phổ biến khác trên HOSE/HNX
+    "DGC", "DIG", "DPM", "DCM", "DXG", "EIB", "FRT", "GMD", "HAG", "HSG", "HVN", "KBC", "KDH", "LPB",
+    "NVL", "OCB", "PDR", "PNJ", "PVD", "PVS", "REE", "SHS", "VCI", "VHC",
+    # Cổ phiếu Mỹ hay được hỏi
+    "AAPL", "MSFT", "GOOGL", "GOOG", "AMZN", "META", "NVDA", "TSLA", "NFLX", "AMD", "INTC", "IBM",
+    "ORCL", "JPM", "BAC",
+}
+
+SMALLTALK_EXAMPLES = (
+    "xin chào", "chào buổi sáng", "bạn khỏe không", "cảm ơn bạn nhiều", "tạm biệt nhé",
+    "bạn là ai", "bạn tên là gì", "hôm nay bạn thế nào", "rất vui được gặp bạn", "ok cảm ơn",
+    "hay quá", "tuyệt vời", "bạn giúp được gì cho tôi", "chúc bạn một ngày tốt lành",
+)
+FINANCE_EXAMPLES = (
+    "lãi suất tiết kiệm ngân hàng", "nên đầu tư vào đâu", "cách lập ngân sách cá nhân",
+    "quỹ dự phòng là gì", "mua bảo hiểm nhân thọ", "thuế thu nhập cá nhân", "cổ phiếu là gì",
+    "trái phiếu doanh nghiệp", "vay mua nhà", "chứng chỉ quỹ", "quản lý chi tiêu hàng tháng",
+    "nghỉ hưu sớm", "lạm phát ảnh hưởng thế nào", "trả nợ thẻ tín dụng",
+)
+
+
+class Route:
+    def __init__(self, intent, reason, symbols=(), vector=None):
+        self.intent = intent
+        self.reason = reason
+        # Các mã thử lần lượt cho intent stock, ví dụ ["FPT.VN", "FPT"]
+        self.symbols = list(symbols)
+        # Embedding câu hỏi đã chuẩn hoá nếu bộ phân loại đã tính (RAG dùng lại)
+        self.vector = vector
+
+
+class IntentRouter:
+    def __init__(self, embeddings=None, max_smalltalk_words=8, margin=0.05, min_score=0.5, stock_suffix=".VN",
+                 known_tickers=()):
+        self.embeddings = embeddings
+        self.max_smalltalk_words = max_smalltalk_words
+        self.margin = margin
+        self.min_score = min_score
+        self.stock_suffix = stock_suffix
+        self.known_tickers = KNOWN_TICKERS | {ticker.upper() for ticker in known_tickers}
+        self._centroids = None
+        self._lock = threading.Lock()
+        self._stats = {SMALLTALK: 0, STOCK: 0, RAG: 0, 'classifier': 0}
+
+    def route(self, query, normalized, has_history=None):
+        """`has_history`: hàm không tham số cho biết hội thoại đã có lịch sử (chỉ gọi khi cần)"""
+        route = self._route(query, normalized, has_history)
+        with self._lock:
+            self._stats[route.intent] += 1
+            if route.reason == "classifier":
+                self._stats['classifier'] += 1
+        return route
+
+    def _route(self, query, normalized, has_history=None):
+        symbols = self.stock_symbols(query, normalized)
+        if symbols:
+            return Route(STOCK, "ticker", symbols=symbols)
+
+        if not normalized or any(keyword in normalized for keyword in FINANCE_KEYWORDS):
+            return Route(RAG, "keyword")
+        if _SMALLTALK_RE.match(normalized):
+            return Route(SMALLTALK, "keyword")
+        ack = _ACK_RE.match(normalized)
+        if ack:
+            if has_history is not None and has_history():
+                return Route(RAG, "follow_up")
+            if ack.end() == len(normalized):
+                return Route(SMALLTALK, "keyword")
+        if self.embeddings is None or len(normalized.split()) > self.max_smalltalk_words:
+            return Route(RAG, "default")
+
+        vector = self.embeddings.embed_query(normalized)
+        smalltalk_score, finance_score = self._scores(vector)
+        if smalltalk_score >= self.min_score and smalltalk_score - finance_score >= self.margin:
+            return Route(SMALLTALK, "classifier", vector=vector)
+        return Route(RAG, "classifier", vector=vector)
+
+    def stock_symbols(self, query, normalized):
+        """
+        Mã cổ phiếu được hỏi giá trong câu, kèm hậu tố sàn mặc định cho mã 3 ký tự.
+        Nhận mã viết hoa có trong danh sách mã đã biết (hay có hậu tố sàn, ví dụ ABC.VN) kèm từ hỏi giá,
+        hoặc mã có "mã"/"cổ phiếu" đứng trước nếu là mã đã biết hay câu có từ hỏi giá
+        ("cổ phiếu tech là gì" không phải câu hỏi giá).
+        """
+        asks_price = any(keyword in normalized for keyword in PRICE_KEYWORDS)
+        candidates = [m for m in _UPPER_TICKER_RE.findall(query) if self._is_known_ticker(m)]
+        marked = [
+            m.upper() for m in _MARKED_TICKER_RE.findall(normalized)
+            if m.upper() not in NOT_TICKERS and (asks_price or m.upper().split(".")[0] in self.known_tickers)
+        ]
+        if marked:
+            candidates = marked + candidates
+        elif not candidates or not asks_price:
+            return []
+
+        symbol = candidates[0]
+        if "." in symbol or len(symbol) != 3 or not self.stock_suffix:
+            return [symbol]
+        return [symbol + self.stock_suffix, symbol]
+
+    def _is_known_ticker(self, symbol):
+        base, _, suffix = symbol.partition(".")
+        if base in NOT_TICKERS:
+            return False
+        return base in self.known_tickers or (suffix and "." + suffix == self.stock_suffix)
+
+    def _scores(self, vector):
+        if self._centroids is None:
+            with self._lock:
+                if self._centroids is None:
+                    self._centroids = np.stack([
+                        self._centroid(SMALLTALK_EXAMPLES),
+                        self._centroid(FINANCE_EXAMPLES),
+                    ])
+        scores = self._centroids @ _unit(vector)
+        return float(scores[0]), float(scores[1])
+
+    def _centroid(self, examples):
+        vectors = np.asarray(self.embeddings.embed_documents(list(examples)), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return _unit(vectors.mean(axis=0))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['max_smalltalk_words'] = self.max_smalltalk_words
+        stats['margin'] = self.margin
+        return stats
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
@@ -0,0 +1,110 @@
+import threading
+import time
+
+
+class FlightAbandoned(Exception):
+    """Request dẫn đầu bị huỷ (client ngắt kết nối / lỗi giữa chừng) trước khi có kết quả đầy đủ"""
+
+
+class Call:
+    """Một lần xử lý đang chạy; request dẫn đầu phát token/kết quả, các request đi theo chờ nhận"""
+
+    def __init__(self):
+        self.created = time.monotonic()
+        self.followers = 0
+        self.done = False
+        self.result = None
+        self.error = None
+        self._parts = []
+        self._cond = threading.Condition()
+
+    def publish(self, part):
+        with self._cond:
+            self._parts.append(part)
+            self._cond.notify_all()
+
+    def resolve(self, result=None, error=None):
+        with self._cond:
+            self.done = True
+            self.result = result
+            self.error = error
+            self._cond.notify_all()
+
+    def wait(self, timeout):
+        """Chờ kết quả cuối cùng; TimeoutError nếu quá hạn, ném lại lỗi của request dẫn đầu"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.done, timeout):
+                raise TimeoutError("Coalesced request timed out")
+            if self.error is not None:
+                raise self.error
+            return self.result
+
+    def iter_parts(self, first_timeout, idle_timeout):
+        """
+        Yield các phần câu trả lời ngay khi request dẫn đầu phát ra (stream);
+        nếu request dẫn đầu không stream thì yield kết quả cuối một lần.
+        Chờ phần đầu tối đa `first_timeout`, các phần sau tối đa `idle_timeout` mỗi phần.
+        """
+        index = 0
+        while True:
+            timeout = idle_timeout if index else first_timeout
+            with self._cond:
+                if not self._cond.wait_for(lambda: len(self._parts) > index or self.done, timeout):
+                    raise TimeoutError("Coalesced request timed out")
+                parts = self._parts[index:]
+                index = len(self._parts)
+                done, result, error = self.done, self.result, self.error
+            for part in parts:
+                yield part
+            if done and not parts:
+                if error is not None:
+                    raise error
+                if index == 0 and result is not None:
+                    yield result
+                return
+
+
+class SingleFlight:
+    """
+    Gộp các request giống nhau đang chạy đồng thời theo key: request đầu tiên (leader) làm việc,
+    các request sau (follower) nhận chung kết quả. Khoá chỉ giữ trong lúc tra/ghi dict nên các
+    key khác không bị chặn. Lời gọi quá `timeout` giây không nhận thêm follower.
+    """
+
+    def __init__(self, timeout=45.0):
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._leaders = 0
+        self._followers = 0
+
+    def begin(self, key):
+        """Trả về (call, is_leader)"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and not call.done and time.monotonic() - call.created < self.timeout:
+                call.followers += 1
+                self._followers += 1
+                return call, False
+            call = Call()
+            self._calls[key] = call
+            self._leaders += 1
+            return call, True
+
+    def finish(self, key, call, result=None, error=None):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.resolve(result, error)
+
+    def remaining(self, call):
+        return max(self.timeout - (time.monotonic() - call.created), 0.0)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'leaders': self._leaders,
+                'coalesced': self._followers,
+                'timeout_s': self.timeout,
+            }
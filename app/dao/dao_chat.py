@@ -0,0 +1,216 @@
+import threading
+from datetime import datetime
+from cachetools import TTLCache
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from langchain_core.messages import HumanMessage, AIMessage
+from app import app
+from app.models import ChatConversation, ChatMessage
+from app.extensions import db
+
+
+class ConversationState:
+    """
+    Trạng thái của một conversation được cache trong process:
+    chủ sở hữu, số tin nhắn, bản tóm tắt và các tin nhắn chưa được tóm tắt
+    (đã chuyển sẵn sang LangChain messages).
+    """
+    __slots__ = ('conversation_id', 'user_id', 'message_count', 'summary', 'summary_upto_message_id', 'messages')
+
+    def __init__(self, conversation_id, user_id, message_count=0, summary=None,
+                 summary_upto_message_id=0, messages=None):
+        self.conversation_id = conversation_id
+        self.user_id = user_id
+        self.message_count = message_count
+        self.summary = summary
+        self.summary_upto_message_id = summary_upto_message_id or 0
+        self.messages = messages or []  # list (message_id, LangChain message)
+
+    def copy(self):
+        return ConversationState(
+            self.conversation_id, self.user_id, self.message_count, self.summary,
+            self.summary_upto_message_id, list(self.messages)
+        )
+
+
+# Cache write-through: cập nhật mỗi khi lưu tin nhắn (sau khi transaction commit), xoá khi xoá conversation.
+# Mỗi worker có cache riêng nên TTL giới hạn thời gian dữ liệu có thể bị cũ
+# khi cùng một conversation được ghi từ worker khác.
+_cache = TTLCache(
+    maxsize=app.config['RAG_HISTORY_CACHE_SIZE'],
+    ttl=app.config['RAG_HISTORY_CACHE_TTL']
+)
+_lock = threading.Lock()
+
+_PENDING_KEY = 'dao_chat_cache_updates'
+
+
+def _defer(update):
+    """Chờ transaction hiện tại commit thành công mới cập nhật cache (rollback thì bỏ)"""
+    db.session.info.setdefault(_PENDING_KEY, []).append(update)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_pending(session):
+    updates = session.info.pop(_PENDING_KEY, ())
+    if updates:
+        with _lock:
+            for update in updates:
+                update()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def _to_langchain_message(message_type, content):
+    if message_type == "user":
+        return HumanMessage(content=content)
+    if message_type == "bot":
+        return AIMessage(content=content)
+    return None
+
+
+def _max_cached_messages():
+    # Giữ đủ cho cửa sổ lịch sử + phần tràn chờ tóm tắt; 0 = giữ toàn bộ
+    turns = app.config['RAG_HISTORY_TURNS']
+    if not turns:
+        return None
+    return (turns + app.config['RAG_SUMMARY_BATCH_TURNS']) * 2 * 2
+
+
+def _load_state(conversation_id):
+    conversation = ChatConversation.query.get(conversation_id)
+    if not conversation:
+        return None
+
+    summary_upto = conversation.summary_upto_message_id or 0
+    query = ChatMessage.query.filter(
+        ChatMessage.conversation_id == conversation_id,
+        ChatMessage.message_id > summary_upto
+    ).order_by(ChatMessage.message_id.desc())
+    limit = _max_cached_messages()
+    if limit:
+        query = query.limit(limit)
+    rows = query.all()
+    rows.reverse()
+
+    messages = []
+    for row in rows:
+        message = _to_langchain_message(row.message_type, row.content)
+        if message is not None:
+            messages.append((row.message_id, message))
+
+    return ConversationState(
+        conversation_id=conversation_id,
+        user_id=conversation.user_id,
+        message_count=ChatMessage.query.filter_by(conversation_id=conversation_id).count(),
+        summary=conversation.summary,
+        summary_upto_message_id=summary_upto,
+        messages=messages
+    )
+
+
+def get_conversation_state(conversation_id, user_id=None):
+    """
+    Lấy trạng thái conversation từ cache (đọc DB nếu chưa có).
+    Truyền user_id để kiểm tra quyền sở hữu; trả về None nếu không tồn tại/không thuộc user.
+    """
+    with _lock:
+        state = _cache.get(conversation_id)
+
+    if state is None:
+        state = _load_state(conversation_id)
+        if state is None:
+            return None
+        with _lock:
+            _cache[conversation_id] = state
+
+    if user_id is not None and state.user_id != user_id:
+        return None
+
+    with _lock:
+        return state.copy()
+
+
+def create_conversation(user_id, title):
+    """Tạo conversation mới (flush để có ID), đưa vào cache khi commit"""
+    conversation = ChatConversation(user_id=user_id, title=title)
+    db.session.add(conversation)
+    db.session.flush()
+
+    conversation_id = conversation.conversation_id
+
+    def update():
+        _cache[conversation_id] = ConversationState(conversation_id=conversation_id, user_id=user_id)
+
+    _defer(update)
+    return conversation
+
+
+def add_message(conversation_id, user_id, content, message_type, is_html=False):
+    """Lưu tin nhắn (flush, chưa commit); cache được cập nhật khi transaction commit"""
+    message = ChatMessage(
+        conversation_id=conversation_id,
+        user_id=user_id,
+        content=content,
+        message_type=message_type,
+        is_html=is_html
+    )
+    db.session.add(message)
+    db.session.flush()
+
+    message_id = message.message_id
+    langchain_message = _to_langchain_message(message_type, content)
+
+    def update():
+        state = _cache.get(conversation_id)
+        if state is not None:
+            state.message_count += 1
+            if langchain_message is not None:
+                state.messages.append((message_id, langchain_message))
+                limit = _max_cached_messages()
+                if limit and len(state.messages) > limit:
+                    # Chỉ xảy ra khi tóm tắt nền chậm/lỗi liên tục: các tin nhắn này vẫn nằm trong DB
+                    # và sẽ được tóm tắt ở lần sau, nhưng tạm thời không có trong prompt
+                    app.logger.warning(
+                        f"Conversation {conversation_id}: {len(state.messages) - limit} tin nhắn chưa được tóm tắt "
+                        f"bị bỏ khỏi cache lịch sử (tóm tắt tới message_id={state.summary_upto_message_id})"
+                    )
+                    del state.messages[:-limit]
+
+    _defer(update)
+    return message
+
+
+def touch_conversation(conversation_id, title=None):
+    """Cập nhật updated_at (và tiêu đề) bằng một câu UPDATE, không cần SELECT"""
+    values = {'updated_at': datetime.now()}
+    if title:
+        values['title'] = title
+    ChatConversation.query.filter_by(conversation_id=conversation_id).update(values)
+
+
+def apply_summary(conversation_id, summary, summary_upto_message_id):
+    """Cập nhật bản tóm tắt trong cache sau khi đã lưu DB"""
+    with _lock:
+        state = _cache.get(conversation_id)
+        if state is not None:
+            state.summary = summary
+            state.summary_upto_message_id = summary_upto_message_id
+            state.messages = [
+                (message_id, message) for message_id, message in state.messages
+                if message_id > summary_upto_message_id
+            ]
+
+
+def invalidate(conversation_id):
+    with _lock:
+        _cache.pop(conversation_id, None)
+
+
+def delete_conversation(conversation):
+    db.session.delete(conversation)
+    db.session.commit()
+    invalidate(conversation.conversation_id)
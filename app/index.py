@@ -1,8 +1,12 @@
 from app import app , login
+from flask import request
 from flask_login import current_user
 from app.dao import dao_authen
 from app import controllers
+from app import cli
 from app.extensions import db
+from app.rag_chatbot import rag_chatbot
+from app.query_counter import init_query_counter
 
 
 # Hàm này luôn truyền các info vào -> .html nao cung co
@@ -15,6 +19,19 @@ def common_attr():
         }
     return {}
 
+# Các route dùng tới RAG: trang chatbot và API chat
+RAG_WARMUP_PREFIXES = ('/chatbot', '/api/chat/')
+
+
+# Warm-up RAG ở nền khi có request đầu tiên tới trang/API chat (lệnh CLI, đăng nhập, file tĩnh... không load model)
+@app.before_request
+def start_rag_warmup():
+    if request.path.startswith(RAG_WARMUP_PREFIXES):
+        rag_chatbot.start_warmup()
+
+if app.config['SQL_QUERY_COUNT_HEADER']:
+    init_query_counter(app, db)
+
 #Chi Flask lay user
 @login.user_loader
 def user_load(user_id):
@@ -31,10 +48,12 @@ app.add_url_rule("/chatbot", "chatbot", controllers.chatbot)  # MỞ COMMENT NÀ
 app.add_url_rule("/profile", "profile", controllers.profile, methods=['GET', 'POST'])
 app.add_url_rule("/stocks", "stocks", controllers.stocks)
 app.add_url_rule("/api/stocks/search", "search_stocks", controllers.search_stocks, methods=['GET'])
+app.add_url_rule("/api/stocks/<symbol>/indicators", "get_stock_indicators", controllers.get_stock_indicators, methods=['GET'])
 app.add_url_rule("/api/stocks/market-indices", "get_market_indices", controllers.get_market_indices, methods=['GET'])
 app.add_url_rule("/api/stocks/top-gainers", "get_top_gainers", controllers.get_top_gainers, methods=['GET'])
 app.add_url_rule("/api/stocks/top-losers", "get_top_losers", controllers.get_top_losers, methods=['GET'])
 
 
 if __name__ == '__main__':
+    rag_chatbot.start_warmup()
     app.run(host="localhost", port=5050, debug=True)
\ No newline at end of file
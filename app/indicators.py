@@ -0,0 +1,237 @@
+"""
+Chỉ báo kỹ thuật (SMA, EMA, RSI, MACD, Bollinger, ATR, VWAP) tính bằng phép toán theo cột
+của pandas/NumPy trên lịch sử OHLCV theo ngày.
+
+Mỗi chỉ báo tính được cho phần đuôi của chuỗi khi biết kết quả các dòng trước đó:
+- chỉ báo dạng cửa sổ trượt (SMA, Bollinger, VWAP) chỉ cần `window - 1` nến trước
+- chỉ báo đệ quy (EMA, RSI, MACD, ATR) khởi tạo EMA từ giá trị trạng thái của dòng trước
+nên khi có nến mới, IndicatorEngine chỉ tính lại từ nến cuối đã nhớ thay vì cả chuỗi.
+Cột bắt đầu bằng "_" là trạng thái nội bộ, không trả về cho client.
+"""
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+# Tính trên ít nhất ngần ấy ngày trước khoảng hiển thị để các chỉ báo đệ quy ổn định
+WARMUP_DAYS = 365
+
+
+def _last(prev, column):
+    if prev is None or prev.empty:
+        return None
+    return prev[column].iloc[-1]
+
+
+def _ewm(values, alpha, seed=None):
+    """EMA (adjust=False) của `values`, tiếp nối từ giá trị `seed` của dòng trước nếu có"""
+    if seed is None or np.isnan(seed):
+        return values.ewm(alpha=alpha, adjust=False).mean()
+    seeded = pd.concat([pd.Series([seed]), values.reset_index(drop=True)], ignore_index=True)
+    return pd.Series(seeded.ewm(alpha=alpha, adjust=False).mean().to_numpy()[1:], index=values.index)
+
+
+def _rolling(series, start, window):
+    """Cửa sổ trượt cho các dòng từ `start`, lấy thêm `window - 1` dòng trước làm đệm"""
+    lo = max(start - window + 1, 0)
+    return series.iloc[lo:].rolling(window), start - lo
+
+
+def _warmup_mask(frame, start, length):
+    """True với các dòng chưa đủ `length` nến để chỉ báo có nghĩa"""
+    return np.arange(start, len(frame)) < length
+
+
+def sma(frame, start=0, prev=None, window=20):
+    rolling, offset = _rolling(frame['Close'], start, window)
+    return pd.DataFrame({'sma': rolling.mean().iloc[offset:]})
+
+
+def ema(frame, start=0, prev=None, span=20):
+    close = frame['Close'].iloc[start:]
+    return pd.DataFrame({'ema': _ewm(close, 2 / (span + 1), _last(prev, 'ema'))})
+
+
+def rsi(frame, start=0, prev=None, period=14):
+    # Cần giá đóng cửa của nến trước để tính thay đổi
+    close = frame['Close'].iloc[max(start - 1, 0):]
+    delta = close.diff()
+    if start:
+        delta = delta.iloc[1:]
+    avg_gain = _ewm(delta.clip(lower=0), 1 / period, _last(prev, '_avg_gain'))
+    avg_loss = _ewm((-delta).clip(lower=0), 1 / period, _last(prev, '_avg_loss'))
+
+    values = 100 - 100 / (1 + avg_gain / avg_loss)
+    values = values.where(avg_loss != 0, 100.0).where(avg_gain.notna())
+    values[_warmup_mask(frame, start, period)] = np.nan
+    return pd.DataFrame({'rsi': values, '_avg_gain': avg_gain, '_avg_loss': avg_loss})
+
+
+def macd(frame, start=0, prev=None, fast=12, slow=26, signal=9):
+    close = frame['Close'].iloc[start:]
+    ema_fast = _ewm(close, 2 / (fast + 1), _last(prev, '_ema_fast'))
+    ema_slow = _ewm(close, 2 / (slow + 1), _last(prev, '_ema_slow'))
+    line = ema_fast - ema_slow
+    signal_line = _ewm(line, 2 / (signal + 1), _last(prev, 'signal'))
+    return pd.DataFrame({
+        'macd': line,
+        'signal': signal_line,
+        'histogram': line - signal_line,
+        '_ema_fast': ema_fast,
+        '_ema_slow': ema_slow,
+    })
+
+
+def bollinger(frame, start=0, prev=None, window=20, num_std=2.0):
+    rolling, offset = _rolling(frame['Close'], start, window)
+    middle = rolling.mean().iloc[offset:]
+    std = rolling.std(ddof=0).iloc[offset:]
+    return pd.DataFrame({
+        'middle': middle,
+        'upper': middle + num_std * std,
+        'lower': middle - num_std * std,
+    })
+
+
+def atr(frame, start=0, prev=None, period=14):
+    window = frame.iloc[max(start - 1, 0):]
+    prev_close = window['Close'].shift(1)
+    true_range = pd.concat([
+        window['High'] - window['Low'],
+        (window['High'] - prev_close).abs(),
+        (window['Low'] - prev_close).abs(),
+    ], axis=1).max(axis=1)
+    if start:
+        true_range = true_range.iloc[1:]
+
+    state = _ewm(true_range, 1 / period, _last(prev, '_atr'))
+    values = state.copy()
+    values[_warmup_mask(frame, start, period - 1)] = np.nan
+    return pd.DataFrame({'atr': values, '_atr': state})
+
+
+def vwap(frame, start=0, prev=None, window=20):
+    """VWAP trượt `window` phiên theo giá điển hình (high + low + close) / 3"""
+    typical = (frame['High'] + frame['Low'] + frame['Close']) / 3
+    price_volume, offset = _rolling(typical * frame['Volume'], start, window)
+    volume, _ = _rolling(frame['Volume'].astype(float), start, window)
+    values = (price_volume.sum() / volume.sum()).iloc[offset:]
+    return pd.DataFrame({'vwap': values.replace([np.inf, -np.inf], np.nan)})
+
+
+# Tên chỉ báo -> (hàm, tham số mặc định)
+INDICATORS = {
+    'sma': (sma, {'window': 20}),
+    'ema': (ema, {'span': 20}),
+    'rsi': (rsi, {'period': 14}),
+    'macd': (macd, {'fast': 12, 'slow': 26, 'signal': 9}),
+    'bollinger': (bollinger, {'window': 20, 'num_std': 2.0}),
+    'atr': (atr, {'period': 14}),
+    'vwap': (vwap, {'window': 20}),
+}
+
+
+class _Memo:
+    __slots__ = ('result', 'first_date', 'last_date', 'last_candle', 'settled_close')
+
+    def __init__(self, result, hist):
+        self.result = result
+        self.first_date = hist.index[0]
+        self.last_date = hist.index[-1]
+        self.last_candle = _candle(hist, -1)
+        # Giá đóng cửa của nến áp chót, đổi nghĩa là lịch sử đã bị điều chỉnh (chia tách, cổ tức)
+        self.settled_close = hist['Close'].iloc[-2] if len(hist) > 1 else None
+
+
+def _candle(hist, position):
+    row = hist.iloc[position]
+    return (float(row['Open']), float(row['High']), float(row['Low']), float(row['Close']), float(row['Volume']))
+
+
+class IndicatorEngine:
+    """
+    Nhớ kết quả theo (symbol, chỉ báo, tham số) cùng nến cuối đã tính:
+    - nến cuối không đổi -> trả kết quả cũ
+    - có thêm nến / nến cuối đang giao dịch thay đổi -> chỉ tính lại từ nến cuối đã nhớ
+    - ngày bắt đầu khác hoặc lịch sử bị điều chỉnh -> tính lại toàn bộ
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'incremental': 0, 'full': 0}
+
+    def compute(self, symbol, name, hist, params):
+        """DataFrame kết quả (kể cả cột trạng thái) cho toàn bộ `hist`"""
+        function, _ = INDICATORS[name]
+        key = (symbol, name, tuple(sorted(params.items())))
+        with self._lock:
+            memo = self._memo.get(key)
+            if memo is not None:
+                self._memo.move_to_end(key)
+
+        start = self._reusable_rows(memo, hist)
+        if start == len(hist):
+            self._count('hits')
+            return memo.result
+
+        if start:
+            prev = memo.result.iloc[:start]
+            result = pd.concat([prev, function(hist, start, prev, **params)])
+            self._count('incremental')
+        else:
+            result = function(hist, **params)
+            self._count('full')
+
+        with self._lock:
+            self._memo[key] = _Memo(result, hist)
+            while len(self._memo) > self.max_entries:
+                self._memo.popitem(last=False)
+        return result
+
+    @staticmethod
+    def _reusable_rows(memo, hist):
+        """Số dòng đầu của kết quả đã nhớ còn dùng được cho `hist`"""
+        if memo is None or hist.empty or hist.index[0] != memo.first_date:
+            return 0
+        size = len(memo.result)
+        if len(hist) < size or hist.index[size - 1] != memo.last_date:
+            return 0
+        if memo.settled_close is not None and hist['Close'].iloc[size - 2] != memo.settled_close:
+            return 0
+        if len(hist) == size and _candle(hist, -1) == memo.last_candle:
+            return size
+        # Nến cuối đã nhớ có thể là phiên đang giao dịch -> tính lại từ nến đó
+        return size - 1
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._memo)
+        return stats
+
+
+def parse_params(name, args):
+    """Tham số của chỉ báo từ query string dạng <chỉ báo>_<tham số>, ví dụ sma_window=50"""
+    _, defaults = INDICATORS[name]
+    params = {}
+    for param, default in defaults.items():
+        value = args.get(f"{name}_{param}", default, type=type(default))
+        if value is None or value <= 0:
+            raise ValueError(f"{name}_{param} phải là số dương")
+        params[param] = value
+    return params
+
+
+def to_payload(result, dates):
+    """Các cột kết quả (bỏ cột trạng thái) dạng mảng, NaN -> null, chỉ giữ các dòng có ngày trong `dates`"""
+    result = result.loc[dates]
+    return {
+        column: result[column].astype(object).where(result[column].notna(), None).tolist()
+        for column in result.columns if not column.startswith('_')
+    }
@@ -0,0 +1,291 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+import yfinance as yf
+from app import app
+from app.core_rag.singleflight import SingleFlight
+from app.market_indices import MARKET_INDICES, fetch_index, fetch_indices, fetch_quote
+
+
+class _Entry:
+    __slots__ = ('value', 'fetched_at', 'accessed_at', 'loader')
+
+    def __init__(self, value, fetched_at, loader):
+        self.value = value
+        self.fetched_at = fetched_at
+        self.accessed_at = fetched_at
+        self.loader = loader
+
+
+class MarketDataCache:
+    """
+    Cache dữ liệu thị trường dùng chung trong process, TTL riêng cho từng loại dữ liệu
+    (quote, info, history). Stale-while-revalidate: giá trị quá TTL nhưng chưa quá `max_stale`
+    giây vẫn được trả ngay và được tải lại ở nền; chỉ khi chưa có hoặc quá cũ request mới chờ Yahoo
+    (các request cùng key chờ chung một lần tải). Thread nền làm mới trước các key được truy cập
+    trong `hot_window` giây gần đây khi chúng sắp hết hạn.
+    """
+
+    def __init__(self, ttls, max_stale=3600, max_size=2048, refresh_interval=30, hot_window=600,
+                 refresh_ahead=0.8, workers=4, load_timeout=15):
+        self.ttls = dict(ttls)
+        self.max_stale = max_stale
+        self.max_size = max_size
+        self.refresh_interval = refresh_interval
+        self.hot_window = hot_window
+        self.refresh_ahead = refresh_ahead
+        self.workers = workers
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._flight = SingleFlight(timeout=load_timeout)
+        self._executor = None
+        self._refresher = None
+        self._stats = {
+            dataset: {'hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0, 'errors': 0}
+            for dataset in self.ttls
+        }
+
+    def lookup(self, dataset, key, loader):
+        """Trả về (found, value) không gọi Yahoo; giá trị cũ được tải lại ở nền"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((dataset, key))
+            age = now - entry.fetched_at if entry is not None else None
+            if entry is None or age >= self.ttls[dataset] + self.max_stale:
+                self._stats[dataset]['misses'] += 1
+                return False, None
+            self._entries.move_to_end((dataset, key))
+            entry.accessed_at = now
+            entry.loader = loader
+            if age < self.ttls[dataset]:
+                self._stats[dataset]['hits'] += 1
+                return True, entry.value
+            self._stats[dataset]['stale_hits'] += 1
+            value = entry.value
+        self._schedule_refresh(dataset, key)
+        return True, value
+
+    def get(self, dataset, key, loader):
+        found, value = self.lookup(dataset, key, loader)
+        if found:
+            return value
+        return self.load(dataset, key, loader)
+
+    def load(self, dataset, key, loader):
+        """Tải và lưu giá trị mới không tra cache trước (request cùng key chờ chung một lần tải)"""
+        call, leader = self._flight.begin((dataset, key))
+        if not leader:
+            return call.wait(self._flight.remaining(call))
+        try:
+            value = loader()
+        except Exception as e:
+            self._count(dataset, 'errors')
+            self._flight.finish((dataset, key), call, error=e)
+            raise
+        self._store(dataset, key, value, loader)
+        self._flight.finish((dataset, key), call, result=value)
+        return value
+
+    def _store(self, dataset, key, value, loader):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((dataset, key))
+            if entry is None:
+                self._entries[(dataset, key)] = _Entry(value, now, loader)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+            else:
+                entry.value = value
+                entry.fetched_at = now
+        self._start_refresher()
+
+    def _count(self, dataset, name):
+        with self._lock:
+            self._stats[dataset][name] += 1
+
+    def _schedule_refresh(self, dataset, key):
+        with self._lock:
+            if (dataset, key) in self._refreshing:
+                return
+            self._refreshing.add((dataset, key))
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="market-refresh")
+        self._executor.submit(self._refresh, dataset, key)
+
+    def _refresh(self, dataset, key):
+        try:
+            with self._lock:
+                entry = self._entries.get((dataset, key))
+            if entry is None:
+                return
+            self._store(dataset, key, entry.loader(), entry.loader)
+            self._count(dataset, 'refreshes')
+        except Exception as e:
+            # Giữ giá trị cũ, lần truy cập sau sẽ thử lại
+            self._count(dataset, 'errors')
+            app.logger.warning(f"Làm mới dữ liệu thị trường {dataset} {key} lỗi: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard((dataset, key))
+
+    def _start_refresher(self):
+        if self._refresher is not None or not self.refresh_interval:
+            return
+        with self._lock:
+            if self._refresher is not None:
+                return
+            self._refresher = threading.Thread(target=self._refresh_loop, name="market-refresher", daemon=True)
+        self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            now = time.monotonic()
+            with self._lock:
+                due = [
+                    key for key, entry in self._entries.items()
+                    if now - entry.accessed_at < self.hot_window
+                    and now - entry.fetched_at >= self.ttls[key[0]] * self.refresh_ahead
+                ]
+            for dataset, key in due:
+                self._schedule_refresh(dataset, key)
+
+    def stats(self):
+        with self._lock:
+            sizes = {}
+            for dataset, _ in self._entries:
+                sizes[dataset] = sizes.get(dataset, 0) + 1
+            stats = {}
+            for dataset, counters in self._stats.items():
+                total = counters['hits'] + counters['stale_hits'] + counters['misses']
+                stats[dataset] = dict(
+                    counters,
+                    size=sizes.get(dataset, 0),
+                    ttl_s=self.ttls[dataset],
+                    hit_rate=round((counters['hits'] + counters['stale_hits']) / total, 4) if total else None,
+                )
+            return {
+                'datasets': stats,
+                'refreshing': len(self._refreshing),
+                'max_stale_s': self.max_stale,
+                'hot_window_s': self.hot_window,
+            }
+
+
+def _cached(cache, dataset, key, loader):
+    return loader() if cache is None else cache.get(dataset, key, loader)
+
+
+def load_info(symbol, provider=yf):
+    return provider.Ticker(symbol).info
+
+
+def load_history(symbol, days, provider=yf):
+    if days is None:
+        return provider.Ticker(symbol).history(period='max')
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=days)
+    return provider.Ticker(symbol).history(start=start_date, end=end_date)
+
+
+def get_history(symbol, days=30, cache=None, store=None, full=False):
+    """Lịch sử OHLCV theo ngày: từ OHLCVStore nếu có, ngược lại từ Yahoo (qua cache nếu có)"""
+    if store is not None:
+        return store.history(symbol, days, full=full)
+    return _cached(cache, 'history', (symbol, days), partial(load_history, symbol, days))
+
+
+def fetch_stock(symbol, days=30, cache=None, store=None):
+    """
+    Lấy thông tin cơ bản và lịch sử giá `days` ngày (None = toàn bộ) của một mã qua yfinance.
+    Trả về (stock_data, hist); stock_data là None nếu không có dữ liệu giá.
+    Khi có `cache`, giá hiện tại lấy từ quote (TTL ngắn), thông tin công ty từ info (TTL dài).
+    Khi có `store` (OHLCVStore), lịch sử giá đọc từ đĩa và chỉ tải phần còn thiếu.
+    """
+    info = _cached(cache, 'info', symbol, partial(load_info, symbol))
+    hist = get_history(symbol, days, cache=cache, store=store)
+
+    if hist.empty:
+        return None, hist
+
+    current_price = info.get('currentPrice')
+    previous_close = info.get('previousClose')
+    volume = info.get('volume', 0)
+    if cache is not None:
+        quote = cache.get('quote', symbol, partial(fetch_quote, symbol))
+        if quote is not None:
+            current_price, previous_close, volume = quote['current'], quote['previous'], quote['volume']
+
+    stock_data = {
+        'success': True,
+        'symbol': symbol,
+        'name': info.get('longName', symbol),
+        'current_price': current_price if current_price is not None else hist['Close'].iloc[-1],
+        'previous_close': previous_close or 0,
+        'change': current_price - previous_close if current_price and previous_close else 0,
+        'change_percent': current_price / previous_close * 100 - 100 if current_price and previous_close else 0,
+        'volume': volume,
+        'market_cap': info.get('marketCap', 0),
+        'pe_ratio': info.get('trailingPE', 0),
+        'dividend_yield': info.get('dividendYield', 0),
+        'currency': info.get('currency', 'USD'),
+        'sector': info.get('sector', 'N/A'),
+        'industry': info.get('industry', 'N/A'),
+        'country': info.get('country', 'N/A')
+    }
+    return stock_data, hist
+
+
+def _format_number(value, decimals=2):
+    if value is None:
+        return 'N/A'
+    return f"{value:,.{decimals}f}"
+
+
+def format_stock_answer(stock_data):
+    """Câu trả lời chatbot cho câu hỏi giá cổ phiếu"""
+    change = stock_data.get('change') or 0
+    change_percent = stock_data.get('change_percent') or 0
+    trend = 'tăng' if change >= 0 else 'giảm'
+    currency = stock_data.get('currency', '')
+    lines = [
+        f"{stock_data['name']} ({stock_data['symbol']}):",
+        f"- Giá hiện tại: {_format_number(stock_data.get('current_price'))} {currency}",
+        f"- Giá đóng cửa phiên trước: {_format_number(stock_data.get('previous_close'))} {currency}",
+        f"- Thay đổi: {trend} {_format_number(abs(change))} ({change_percent:+.2f}%)",
+        f"- Khối lượng: {_format_number(stock_data.get('volume'), 0)}",
+    ]
+    if stock_data.get('pe_ratio'):
+        lines.append(f"- P/E: {_format_number(stock_data['pe_ratio'])}")
+    if stock_data.get('market_cap'):
+        lines.append(f"- Vốn hoá: {_format_number(stock_data['market_cap'], 0)} {currency}")
+    lines.append("Dữ liệu từ Yahoo Finance, có thể trễ so với thời gian thực và không phải khuyến nghị đầu tư.")
+    return "\n".join(lines)
+
+
+# Cache dùng chung cho các API chứng khoán và chatbot (None nếu tắt)
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Cache dữ liệu thị trường dùng chung, tạo ở lần dùng đầu; None nếu tắt"""
+    global _cache
+    if _cache is None and app.config['MARKET_CACHE_ENABLED']:
+        with _cache_lock:
+            if _cache is None:
+                _cache = MarketDataCache(
+                    ttls={
+                        'quote': app.config['MARKET_CACHE_QUOTE_TTL'],
+                        'info': app.config['MARKET_CACHE_INFO_TTL'],
+                        'history': app.config['MARKET_CACHE_HISTORY_TTL'],
+                    },
+                    max_stale=app.config['MARKET_CACHE_MAX_STALE'],
+                    refresh_interval=app.config['MARKET_CACHE_REFRESH_INTERVAL'],
+                    hot_window=app.config['MARKET_CACHE_HOT_WINDOW'],
+                )
+    return _cache
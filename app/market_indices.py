@@ -0,0 +1,171 @@
+"""
+Lấy giá các chỉ số thị trường song song qua yfinance (hoặc provider giả lập có cùng hàm Ticker).
+Module không phụ thuộc Flask app: logger và cache (MarketDataCache) được truyền vào từ nơi gọi.
+"""
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+import yfinance as yf
+
+# Các chỉ số thị trường phổ biến
+MARKET_INDICES = {
+    '^VNINDEX': 'VN-INDEX',
+    '^HNX': 'HNX-INDEX',
+    '^UPCOM': 'UPCOM-INDEX',
+    '^GSPC': 'S&P 500',
+    '^DJI': 'Dow Jones',
+    '^IXIC': 'NASDAQ',
+    '^FTSE': 'FTSE 100',
+    '^N225': 'Nikkei 225'
+}
+
+# Pool dùng chung cho mọi request (mỗi kích thước một pool), giới hạn số kết nối đồng thời tới Yahoo
+_executors = {}
+# (symbol, provider) -> _IndexTask đang chờ/chạy: một chỉ số bị treo chỉ giữ tối đa một worker,
+# các request sau dùng lại task đó thay vì gửi thêm
+_inflight = {}
+_executor_lock = threading.Lock()
+
+
+def _get_executor(max_workers):
+    with _executor_lock:
+        executor = _executors.get(max_workers)
+        if executor is None:
+            executor = _executors[max_workers] = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="market-data"
+            )
+        return executor
+
+
+class _IndexTask:
+    __slots__ = ('future', 'started_at')
+
+    def __init__(self):
+        self.future = None
+        self.started_at = None
+
+    def run(self, fn, *args):
+        self.started_at = time.monotonic()
+        return fn(*args)
+
+    def deadline(self, called_at, timeout):
+        """Mỗi chỉ số có `timeout` giây kể từ lúc bắt đầu chạy; task còn xếp hàng phải bắt đầu trong `timeout` giây"""
+        started_at = self.started_at
+        return (called_at if started_at is None else started_at) + timeout
+
+
+def _submit_index(executor, symbol, name, provider, cache):
+    key = (symbol, provider)
+    with _executor_lock:
+        task = _inflight.get(key)
+        if task is not None and not task.future.done():
+            return task
+        task = _inflight[key] = _IndexTask()
+        task.future = executor.submit(task.run, _load_index, symbol, name, provider, cache)
+    task.future.add_done_callback(lambda _: _discard_task(key, task))
+    return task
+
+
+def _discard_task(key, task):
+    with _executor_lock:
+        if _inflight.get(key) is task:
+            del _inflight[key]
+
+
+def fetch_quote(symbol, provider=yf):
+    """
+    Giá đóng cửa gần nhất, phiên trước và khối lượng của một mã/chỉ số; None nếu không có dữ liệu.
+    `provider` là module yfinance hoặc đối tượng giả lập có cùng hàm Ticker(symbol).
+    """
+    ticker = provider.Ticker(symbol)
+    # 5 phiên gần nhất đủ để lấy giá đóng cửa phiên trước, không cần gọi thêm .info
+    hist = ticker.history(period='5d')
+    if hist.empty:
+        return None
+
+    current = float(hist['Close'].iloc[-1])
+    if len(hist) > 1:
+        previous = float(hist['Close'].iloc[-2])
+    else:
+        previous = float(ticker.info.get('previousClose', current * 0.99))
+    return {'current': current, 'previous': previous, 'volume': int(hist['Volume'].iloc[-1])}
+
+
+def fetch_index(symbol, name, provider=yf, cache=None):
+    """Giá hiện tại và thay đổi so với phiên trước của một chỉ số; None nếu không có dữ liệu"""
+    loader = partial(fetch_quote, symbol, provider)
+    return _index_data(symbol, name, loader() if cache is None else cache.get('quote', symbol, loader))
+
+
+def _load_index(symbol, name, provider=yf, cache=None):
+    """Như fetch_index nhưng bỏ qua bước tra cache (fetch_indices đã tra và tính miss trước đó)"""
+    loader = partial(fetch_quote, symbol, provider)
+    return _index_data(symbol, name, loader() if cache is None else cache.load('quote', symbol, loader))
+
+
+def _index_data(symbol, name, quote):
+    if quote is None:
+        return None
+
+    current, previous = quote['current'], quote['previous']
+    change = float(current - previous)
+    change_percent = float((change / previous * 100) if previous else 0)
+
+    return {
+        'symbol': symbol,
+        'name': name,
+        'current': round(current, 2),
+        'change': round(change, 2),
+        'change_percent': round(change_percent, 2),
+        'is_positive': bool(change >= 0)  # Chuyển thành boolean
+    }
+
+
+def fetch_indices(symbols=None, provider=yf, max_workers=8, timeout=5.0, logger=None, cache=None):
+    """
+    Lấy đồng thời các chỉ số thị trường (giữ thứ tự của `symbols`).
+    Chỉ số đã có trong cache trả về ngay; chỉ số nào lỗi hoặc chạy quá `timeout` giây
+    (hay xếp hàng quá `timeout` giây vì pool đang bận) thì bị bỏ qua để không làm chậm các chỉ số còn lại.
+    Chỉ số đang được tải bởi request khác thì chờ chung lần tải đó.
+    """
+    symbols = symbols or MARKET_INDICES
+    called_at = time.monotonic()
+    results = {}
+    tasks = {}
+    for symbol, name in symbols.items():
+        if cache is not None:
+            found, quote = cache.lookup('quote', symbol, partial(fetch_quote, symbol, provider))
+            if found:
+                results[symbol] = _index_data(symbol, name, quote)
+                continue
+        tasks[symbol] = _submit_index(_get_executor(max_workers), symbol, name, provider, cache)
+
+    pending = {task.future: task for task in tasks.values()}
+    while pending:
+        # Hạn của task chưa chạy (called_at + timeout) không muộn hơn hạn sau khi nó bắt đầu chạy,
+        # nên chỉ cần thức dậy ở hạn sớm nhất rồi tính lại
+        now = time.monotonic()
+        deadlines = {future: task.deadline(called_at, timeout) for future, task in pending.items()}
+        pending = {future: task for future, task in pending.items() if deadlines[future] > now}
+        if not pending:
+            break
+        done, _ = wait(pending, timeout=min(deadlines[future] for future in pending) - now,
+                       return_when=FIRST_COMPLETED)
+        for future in done:
+            del pending[future]
+
+    for symbol, task in tasks.items():
+        future = task.future
+        if not future.done():
+            # Không huỷ task (request khác có thể đang chờ chung), kết quả trễ vào cache nếu bật
+            if logger is not None:
+                logger.warning(f"Lấy chỉ số {symbol} quá {timeout}s, bỏ qua")
+            continue
+        try:
+            results[symbol] = future.result()
+        except Exception as e:
+            if logger is not None:
+                logger.error(f"Lỗi khi lấy chỉ số {symbol}: {str(e)}")
+
+    return [results[symbol] for symbol in symbols if results.get(symbol) is not None]
@@ -118,6 +118,10 @@ class ChatConversation(BaseModel):
 
     title = db.Column(db.String(255), nullable=False, default="Cuộc trò chuyện tài chính")
 
+    # Tóm tắt các lượt hội thoại cũ (ngoài cửa sổ lịch sử giữ nguyên văn)
+    summary = db.Column(db.Text, nullable=True)
+    summary_upto_message_id = db.Column(db.Integer, default=0)  # ID tin nhắn cuối cùng đã được tóm tắt
+
     messages = db.relationship('ChatMessage', backref='conversation', cascade='all, delete')
 
 
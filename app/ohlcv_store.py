@@ -0,0 +1,307 @@
+"""
+Lưu giá OHLCV theo ngày của từng mã vào SQLite cục bộ:
+- chỉ tải phần đuôi còn thiếu kể từ ngày đã lưu (nến cũ không đổi), phần đầu chỉ tải khi
+  cần khoảng thời gian dài hơn dữ liệu đang có
+- bảng khoá theo (symbol, date) WITHOUT ROWID nên truy vấn một khoảng ngày là đọc tuần tự
+- dữ liệu đã có thì trả ngay từ đĩa, đồng bộ phần đuôi chạy nền (tối đa một lần mỗi `sync_interval` giây)
+- mã Yahoo không có dữ liệu chỉ được thử tải lại sau `empty_sync_interval` giây
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+import pandas as pd
+import yfinance as yf
+from app import app
+
+# Khoảng thời gian hỗ trợ của biểu đồ -> số ngày (None = toàn bộ lịch sử)
+RANGES = {
+    '1M': 30,
+    '3M': 91,
+    '6M': 182,
+    '1Y': 365,
+    '5Y': 5 * 365 + 1,
+    'MAX': None,
+}
+
+COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS candles (
+    symbol TEXT NOT NULL,
+    date TEXT NOT NULL,
+    open REAL, high REAL, low REAL, close REAL, volume INTEGER,
+    PRIMARY KEY (symbol, date)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS symbols (
+    symbol TEXT PRIMARY KEY,
+    history_start TEXT NOT NULL,
+    last_date TEXT,
+    synced_at REAL NOT NULL
+);
+"""
+
+
+class OHLCVStore:
+    def __init__(self, path, provider=yf, sync_interval=300, empty_sync_interval=3600, overlap_days=5,
+                 adjust_tolerance=0.005, pool_size=4):
+        self.path = path
+        self.provider = provider
+        self.sync_interval = sync_interval
+        self.empty_sync_interval = empty_sync_interval
+        # Tải lại vài phiên cuối để cập nhật nến đang giao dịch và phát hiện giá bị điều chỉnh
+        # (chia tách, cổ tức) - khi đó tải lại toàn bộ lịch sử của mã
+        self.overlap_days = overlap_days
+        self.adjust_tolerance = adjust_tolerance
+        # Kết nối dùng lại giữa các thread (request, đồng bộ nền), giữ tối đa `pool_size` kết nối rảnh
+        self.pool_size = pool_size
+        self._pool = queue.LifoQueue()
+        self._symbol_locks = {}
+        self._lock = threading.Lock()
+        self._syncing = set()
+        self._executor = None
+        self._stats = {'disk_reads': 0, 'tail_syncs': 0, 'full_fetches': 0, 'adjustments': 0, 'errors': 0}
+
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._open()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        self._pool.put(conn)
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        """Mượn một kết nối của pool (mở mới nếu pool rỗng), trả lại sau khi dùng"""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._open()
+        try:
+            yield conn
+        finally:
+            if self._pool.qsize() < self.pool_size:
+                self._pool.put(conn)
+            else:
+                conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def _symbol_lock(self, symbol):
+        with self._lock:
+            return self._symbol_locks.setdefault(symbol, threading.Lock())
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def history(self, symbol, days=30, full=False):
+        """
+        DataFrame OHLCV (index theo ngày, cột giống yfinance) của `days` ngày gần nhất,
+        None = toàn bộ lịch sử. Chỉ gọi Yahoo khi chưa có dữ liệu cho khoảng này.
+        `full` = trả về mọi nến đã lưu của mã (ngày bắt đầu cố định, có thể sớm hơn `days`).
+        """
+        start = start_date(days)
+        meta = self._meta(symbol)
+        if meta is None or start < meta['history_start']:
+            with self._symbol_lock(symbol):
+                meta = self._meta(symbol)
+                if meta is None or start < meta['history_start']:
+                    self._fetch_full(symbol, start)
+        elif self._sync_due(meta):
+            self._schedule_sync(symbol)
+        return self.read(symbol, None if full else start)
+
+    def _sync_due(self, meta):
+        # Mã chưa có nến nào (Yahoo không có dữ liệu) thì thưa hơn để không tải lại toàn bộ mỗi lần
+        interval = self.sync_interval if meta['last_date'] else self.empty_sync_interval
+        return time.time() - meta['synced_at'] >= interval
+
+    def read(self, symbol, start=None):
+        """Đọc các nến từ ngày `start` (chuỗi YYYY-MM-DD) trở đi, không gọi Yahoo"""
+        self._count('disk_reads')
+        query = "SELECT date, open, high, low, close, volume FROM candles WHERE symbol = ?"
+        params = [symbol]
+        if start:
+            query += " AND date >= ?"
+            params.append(start)
+        with self._connection() as conn:
+            rows = conn.execute(query + " ORDER BY date", params).fetchall()
+        frame = pd.DataFrame(rows, columns=['Date'] + COLUMNS)
+        frame.index = pd.DatetimeIndex(pd.to_datetime(frame.pop('Date')), name='Date')
+        return frame
+
+    def _meta(self, symbol):
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT history_start, last_date, synced_at FROM symbols WHERE symbol = ?", (symbol,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'history_start': row[0], 'last_date': row[1], 'synced_at': row[2]}
+
+    def _download(self, symbol, start=None):
+        ticker = self.provider.Ticker(symbol)
+        if start is None or start == _EPOCH:
+            return ticker.history(period='max')
+        return ticker.history(start=start)
+
+    def _fetch_full(self, symbol, start):
+        """Tải toàn bộ lịch sử từ `start` (thay cho dữ liệu đang có)"""
+        hist = self._download(symbol, start)
+        self._count('full_fetches')
+        with self._connection() as conn, conn:
+            if hist.empty and conn.execute("SELECT 1 FROM candles WHERE symbol = ? LIMIT 1", (symbol,)).fetchone():
+                # Yahoo trả rỗng (lỗi tạm thời) -> giữ dữ liệu đã lưu, chỉ ghi nhận lần đồng bộ
+                app.logger.warning(f"Tải lịch sử {symbol} từ {start} không có dữ liệu, giữ nến đã lưu")
+                conn.execute("UPDATE symbols SET synced_at = ? WHERE symbol = ?", (time.time(), symbol))
+                return
+            conn.execute("DELETE FROM candles WHERE symbol = ?", (symbol,))
+            self._write(conn, symbol, hist)
+            conn.execute(
+                "INSERT OR REPLACE INTO symbols (symbol, history_start, last_date, synced_at) VALUES (?, ?, ?, ?)",
+                (symbol, start, _last_date(hist), time.time())
+            )
+
+    def sync(self, symbol, force=False):
+        """Tải phần đuôi từ vài phiên trước ngày cuối đã lưu tới hiện tại (bỏ qua nếu vừa đồng bộ, trừ khi `force`)"""
+        with self._symbol_lock(symbol):
+            meta = self._meta(symbol)
+            if meta is None or not (force or self._sync_due(meta)):
+                return
+            if not meta['last_date']:
+                self._fetch_full(symbol, meta['history_start'])
+                return
+
+            overlap_start = (date.fromisoformat(meta['last_date']) - timedelta(days=self.overlap_days)).isoformat()
+            tail = self._download(symbol, overlap_start)
+            self._count('tail_syncs')
+            if self._adjusted(symbol, tail, meta['last_date']):
+                self._count('adjustments')
+                self._fetch_full(symbol, meta['history_start'])
+                return
+
+            with self._connection() as conn, conn:
+                self._write(conn, symbol, tail)
+                conn.execute(
+                    "UPDATE symbols SET last_date = ?, synced_at = ? WHERE symbol = ?",
+                    (_last_date(tail) or meta['last_date'], time.time(), symbol)
+                )
+
+    def _adjusted(self, symbol, tail, last_date):
+        """So giá đóng cửa các phiên đã lưu trước ngày cuối với dữ liệu vừa tải"""
+        if tail.empty:
+            return False
+        fetched = {_date_key(index): float(close) for index, close in tail['Close'].items()}
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT date, close FROM candles WHERE symbol = ? AND date >= ? AND date < ?",
+                (symbol, min(fetched), last_date)
+            ).fetchall()
+        for day, close in rows:
+            new_close = fetched.get(day)
+            if new_close is not None and close and abs(new_close - close) / close > self.adjust_tolerance:
+                return True
+        return False
+
+    @staticmethod
+    def _write(conn, symbol, hist):
+        if hist.empty:
+            return
+        frame = hist[COLUMNS]
+        conn.executemany(
+            "INSERT OR REPLACE INTO candles (symbol, date, open, high, low, close, volume) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            zip(
+                [symbol] * len(frame),
+                [_date_key(index) for index in frame.index],
+                frame['Open'].astype(float).tolist(),
+                frame['High'].astype(float).tolist(),
+                frame['Low'].astype(float).tolist(),
+                frame['Close'].astype(float).tolist(),
+                frame['Volume'].fillna(0).astype('int64').tolist(),
+            )
+        )
+
+    def _schedule_sync(self, symbol):
+        with self._lock:
+            if symbol in self._syncing:
+                return
+            self._syncing.add(symbol)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="ohlcv-sync")
+        self._executor.submit(self._background_sync, symbol)
+
+    def _background_sync(self, symbol):
+        try:
+            self.sync(symbol)
+        except Exception as e:
+            self._count('errors')
+            app.logger.warning(f"Đồng bộ OHLCV {symbol} lỗi: {e}")
+        finally:
+            with self._lock:
+                self._syncing.discard(symbol)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['syncing'] = len(self._syncing)
+        with self._connection() as conn:
+            row = conn.execute("SELECT COUNT(*), (SELECT COUNT(*) FROM candles) FROM symbols").fetchone()
+        stats['symbols'], stats['candles'] = row
+        stats['path'] = self.path
+        return stats
+
+
+# Mốc "toàn bộ lịch sử" để so sánh chuỗi ngày
+_EPOCH = '1900-01-01'
+
+
+def start_date(days):
+    """Ngày bắt đầu (YYYY-MM-DD) của khoảng `days` ngày gần nhất"""
+    if days is None:
+        return _EPOCH
+    return (datetime.now() - timedelta(days=days)).date().isoformat()
+
+
+def _date_key(index):
+    return index.strftime('%Y-%m-%d')
+
+
+def _last_date(hist):
+    return _date_key(hist.index[-1]) if not hist.empty else None
+
+
+# Kho OHLCV dùng chung, tạo ở lần dùng đầu để các process chỉ import app (lệnh `flask db`, `flask rag`...)
+# không tạo file SQLite
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Kho OHLCV dùng chung; None nếu tắt -> tải lịch sử trực tiếp từ Yahoo như trước"""
+    global _store
+    if _store is None and app.config['OHLCV_STORE_ENABLED']:
+        with _store_lock:
+            if _store is None:
+                _store = OHLCVStore(
+                    app.config['OHLCV_STORE_PATH'],
+                    sync_interval=app.config['OHLCV_SYNC_INTERVAL'],
+                    empty_sync_interval=app.config['OHLCV_EMPTY_SYNC_INTERVAL'],
+                )
+    return _store
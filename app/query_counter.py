@@ -0,0 +1,21 @@
+from flask import g, has_request_context
+from sqlalchemy import event
+
+
+def init_query_counter(app, db):
+    """
+    Đếm số câu SQL của mỗi request và trả về qua header X-DB-Query-Count
+    (bật bằng SQL_QUERY_COUNT_HEADER, dùng cho load test để phát hiện N+1 query).
+    """
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_query(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context():
+            g.db_query_count = g.get('db_query_count', 0) + 1
+
+    @app.after_request
+    def add_query_count_header(response):
+        response.headers['X-DB-Query-Count'] = str(g.get('db_query_count', 0))
+        return response
@@ -1,39 +1,162 @@
 import os
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_qdrant import QdrantVectorStore
-from langchain_community.chat_models import ChatOpenAI
-#cài requirements rồi cài pip install langchain==0.3.27 cài về cái này
-from langchain.memory import ConversationBufferMemory
-from langchain.chains import create_retrieval_chain
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.messages import HumanMessage, AIMessage
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import unicodedata
+import numpy as np
+from cachetools import TTLCache
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder, PromptTemplate, format_document
+from langchain_core.messages import HumanMessage, SystemMessage
 from app import app
+from app.core_rag.bm25 import BM25Index, reciprocal_rank_fusion
+from app.core_rag.context import TokenCounter, deduplicate_documents, pack_documents
+from app.core_rag.embeddings import BatchingEmbeddings, build_embeddings
+from app.core_rag.ingest import CollectionVersion
+from app.core_rag.llm import LLMRouter
+from app.core_rag.local_index import LocalVectorIndex
+from app.core_rag.metrics import StageMetrics
+from app.core_rag.qdrant_search import QdrantSearcher, build_qdrant_client
+from app.core_rag.rerank import CrossEncoderReranker
+from app.core_rag.router import SMALLTALK, STOCK, IntentRouter
+from app.core_rag.singleflight import FlightAbandoned, SingleFlight
+
+
+NO_ANSWER_MESSAGE = 'Xin lỗi, tôi không thể trả lời câu hỏi tài chính này.'
+ERROR_MESSAGE = "Xin lỗi, có lỗi xảy ra khi xử lý yêu cầu tài chính của bạn. Vui lòng thử lại."
+
+
+class StreamInterrupted(Exception):
+    """LLM lỗi sau khi đã stream một phần câu trả lời; phần đã gửi là câu trả lời dang dở"""
+
+
+def normalize_query(query):
+    """Chuẩn hoá câu hỏi: Unicode NFC, chữ thường, bỏ dấu câu và khoảng trắng thừa"""
+    query = unicodedata.normalize("NFC", query).lower()
+    query = re.sub(r"[^\w\s]", " ", query)
+    return re.sub(r"\s+", " ", query).strip()
+
+
+class SemanticAnswerCache:
+    """
+    Cache câu trả lời theo độ tương đồng cosine giữa embedding của các câu hỏi.
+    Giới hạn theo số lượng (LRU) và TTL, tự xoá khi collection đổi tên/version.
+    """
+
+    def __init__(self, threshold, max_size, ttl):
+        self.threshold = threshold
+        self._entries = TTLCache(maxsize=max_size, ttl=ttl)
+        self._lock = threading.Lock()
+        self._namespace = None
+        self.hits = 0
+        self.misses = 0
+
+    def _check_namespace(self, namespace):
+        # Gọi khi đang giữ lock
+        if namespace != self._namespace:
+            self._entries.clear()
+            self._namespace = namespace
+
+    def lookup(self, namespace, vector):
+        """Trả về câu trả lời đã cache nếu có câu hỏi đủ giống, ngược lại None"""
+        vector = _unit(vector)
+        with self._lock:
+            self._check_namespace(namespace)
+            self._entries.expire()
+            entries = list(self._entries.items())
+            best_key, best_score = None, -1.0
+            if entries:
+                matrix = np.stack([entry[0] for _, entry in entries])
+                scores = matrix @ vector
+                best = int(np.argmax(scores))
+                best_key, best_score = entries[best][0], float(scores[best])
+
+            if best_key is not None and best_score >= self.threshold:
+                self.hits += 1
+                # Truy cập lại để cập nhật thứ tự LRU
+                return self._entries[best_key][1]
+
+            self.misses += 1
+            return None
+
+    def store(self, namespace, normalized_query, vector, answer):
+        with self._lock:
+            self._check_namespace(namespace)
+            self._entries[normalized_query] = (_unit(vector), answer)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else None,
+                'threshold': self.threshold,
+                'namespace': self._namespace,
+            }
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
 
 
 class RAGSystem:
     def __init__(self):
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="dangvantuan/vietnamese-embedding"
-        )
-        self.docsearch = QdrantVectorStore.from_existing_collection(
-            embedding=self.embeddings,
-            url=app.config['QDRANT_URL'],
-            api_key=app.config['QDRANT_API_KEY'],
-            collection_name=app.config['COLLECTION_NAME'],
-        )
-        self.retriever = self.docsearch.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": 40}
-        )
-        self.llm = ChatOpenAI(
-            model=app.config['MODEL_LLM_NAME'],
-            openai_api_key=app.config['OPENAI_API_KEY'],
-            openai_api_base="https://openrouter.ai/api/v1",
-            temperature=0.4,
-            max_tokens=2048
+        self.metrics = StageMetrics()
+        self.answer_cache = None
+        if app.config['RAG_CACHE_ENABLED']:
+            self.answer_cache = SemanticAnswerCache(
+                threshold=app.config['RAG_CACHE_THRESHOLD'],
+                max_size=app.config['RAG_CACHE_MAX_SIZE'],
+                ttl=app.config['RAG_CACHE_TTL'],
+            )
+        self.collection_version = CollectionVersion(
+            app.config['RAG_COLLECTION_VERSION_FILE'], app.config['COLLECTION_NAME']
         )
 
+        # Gộp các câu hỏi giống hệt (chưa có lịch sử) đang xử lý đồng thời
+        self.single_flight = None
+        if app.config['RAG_SINGLEFLIGHT_ENABLED']:
+            self.single_flight = SingleFlight(timeout=app.config['RAG_SINGLEFLIGHT_TIMEOUT'])
+
+        # Model embedding, vector store và LLM được khởi tạo lười (lần chat đầu tiên
+        # hoặc thread warm-up) để import app / chạy lệnh CLI không phải load torch
+        self.embeddings = None
+        self.docsearch = None
+        self.searcher = None
+        self.local_index = None
+        self.llm = None
+        self.bm25 = None
+        self.token_counter = None
+        self.router = None
+        self.status = {'embeddings': 'pending', 'vector_store': 'pending', 'llm': 'pending'}
+        if app.config['RAG_HYBRID_ENABLED']:
+            self.status['bm25'] = 'pending'
+        self.last_error = None
+        self._ready = False
+        self._init_lock = threading.Lock()
+        self._warmup_thread = None
+
+        self.top_k = app.config['RAG_TOP_K']
+        self.search_type = app.config['RAG_SEARCH_TYPE']
+        self.reranker = None
+        if app.config['RAG_RERANK_ENABLED']:
+            # Model cross-encoder chỉ load khi rerank lần đầu
+            self.reranker = CrossEncoderReranker(
+                model_name=app.config['MODEL_CROSS_ENCODER_NAME'],
+                top_n=app.config['RAG_RERANK_TOP_N'],
+                batch_size=app.config['RAG_RERANK_BATCH_SIZE'],
+                max_length=app.config['RAG_RERANK_MAX_LENGTH'],
+                cache_size=app.config['RAG_RERANK_CACHE_SIZE'],
+            )
+
         self.system_prompt = (
             "Bạn là chuyên gia tư vấn tài chính cá nhân chuyên nghiệp.\n"
             "Thông tin tham khảo từ tài liệu tài chính:\n{context}\n\n"
@@ -53,72 +176,615 @@ class RAGSystem:
             ("human", "{input}")
         ])
 
-    def _get_conversation_messages(self, conversation_id):
+        self.summary_prompt = ChatPromptTemplate.from_messages([
+            ("system",
+             "Bạn tóm tắt hội thoại tư vấn tài chính giữa người dùng và trợ lý.\n"
+             "Cập nhật bản tóm tắt hiện có với các tin nhắn mới, giữ lại các con số, "
+             "mục tiêu, tình hình tài chính và câu hỏi quan trọng của người dùng.\n"
+             "Viết bằng tiếng Việt, ngắn gọn, tối đa 10 câu."),
+            ("human", "Bản tóm tắt hiện có:\n{summary}\n\nTin nhắn mới:\n{messages}")
+        ])
+
+        # Tóm tắt lịch sử chạy nền, mỗi conversation chỉ một tác vụ tại một thời điểm
+        self.history_turns = app.config['RAG_HISTORY_TURNS']
+        self.summary_batch_turns = app.config['RAG_SUMMARY_BATCH_TURNS']
+        self._summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="rag-summary")
+        self._summary_pending = set()
+        self._summary_lock = threading.Lock()
+
+        # Câu xã giao: prompt ngắn, không tìm kiếm tài liệu
+        self.smalltalk_prompt = ChatPromptTemplate.from_messages([
+            ("system",
+             "Bạn là trợ lý tư vấn tài chính cá nhân thân thiện. Trả lời ngắn gọn bằng tiếng Việt "
+             "(1-2 câu) và mời người dùng đặt câu hỏi về tài chính."),
+            ("human", "{input}")
+        ])
+
+        # Giống định dạng mặc định của create_stuff_documents_chain
+        self.document_prompt = PromptTemplate.from_template("{page_content}")
+        self.document_separator = "\n\n"
+
+    @property
+    def is_ready(self):
+        return self._ready
+
+    def ensure_ready(self):
+        """Khởi tạo các thành phần nặng nếu chưa có (an toàn khi gọi từ nhiều thread)"""
+        if self._ready:
+            return
+        with self._init_lock:
+            if self._ready:
+                return
+            with self.metrics.stage("warmup"):
+                self._load_components()
+            self._ready = True
+
+    def _load_components(self):
+        component = 'llm'
+        try:
+            self.status['llm'] = 'loading'
+            self.llm = LLMRouter(
+                models=[app.config['MODEL_LLM_NAME']] + app.config['MODEL_LLM_FALLBACKS'],
+                api_key=app.config['OPENAI_API_KEY'],
+                api_base=app.config['LLM_API_BASE'],
+                temperature=0.4,
+                max_tokens=2048,
+                timeout=app.config['LLM_TIMEOUT'],
+                stream_idle_timeout=app.config['LLM_STREAM_IDLE_TIMEOUT'],
+                hedge_after_ms=app.config['LLM_HEDGE_AFTER_MS'],
+                metrics=self.metrics,
+            )
+            self.token_counter = TokenCounter(app.config['MODEL_LLM_NAME'])
+            self.status['llm'] = 'ready'
+
+            component = 'embeddings'
+            self.status['embeddings'] = 'loading'
+            self.embeddings = build_embeddings(
+                model_name=app.config['MODEL_EMBEDDING_NAME'],
+                backend=app.config['EMBEDDING_BACKEND'],
+                onnx_path=app.config['EMBEDDING_ONNX_PATH'],
+                onnx_file=app.config['EMBEDDING_ONNX_FILE'],
+            )
+            if app.config['EMBEDDING_BATCH_MAX_SIZE'] > 1:
+                self.embeddings = BatchingEmbeddings(
+                    self.embeddings,
+                    max_batch_size=app.config['EMBEDDING_BATCH_MAX_SIZE'],
+                    max_wait_ms=app.config['EMBEDDING_BATCH_MAX_WAIT_MS'],
+                    timeout=app.config['EMBEDDING_BATCH_TIMEOUT'],
+                )
+            if app.config['RAG_ROUTER_ENABLED']:
+                self.router = IntentRouter(
+                    self.embeddings,
+                    max_smalltalk_words=app.config['RAG_ROUTER_MAX_SMALLTALK_WORDS'],
+                    margin=app.config['RAG_ROUTER_MARGIN'],
+                    stock_suffix=app.config['STOCK_DEFAULT_SUFFIX'],
+                    known_tickers=app.config['RAG_ROUTER_EXTRA_TICKERS'],
+                )
+            self.status['embeddings'] = 'ready'
+
+            component = 'vector_store'
+            self.status['vector_store'] = 'loading'
+            if app.config['RAG_VECTOR_TIER'] == 'local':
+                # Snapshot mmap trong process, Qdrant vẫn là nguồn dữ liệu gốc
+                self.local_index = LocalVectorIndex(
+                    app.config['RAG_SNAPSHOT_PATH'],
+                    nprobe=app.config['RAG_SNAPSHOT_NPROBE']
+                )
+            else:
+                client = build_qdrant_client(
+                    app.config['QDRANT_URL'],
+                    api_key=app.config['QDRANT_API_KEY'],
+                    prefer_grpc=app.config['QDRANT_PREFER_GRPC'],
+                    grpc_port=app.config['QDRANT_GRPC_PORT'],
+                )
+                self.searcher = QdrantSearcher(
+                    client,
+                    app.config['COLLECTION_NAME'],
+                    hnsw_ef=app.config['RAG_QDRANT_HNSW_EF'],
+                    rescore=app.config['RAG_QDRANT_RESCORE'],
+                    oversampling=app.config['RAG_QDRANT_OVERSAMPLING'],
+                    payload_fields=app.config['RAG_QDRANT_PAYLOAD_FIELDS'],
+                )
+                if self.search_type == "mmr":
+                    # MMR cần vector của các ứng viên nên vẫn dùng QdrantVectorStore
+                    from langchain_qdrant import QdrantVectorStore
+                    self.docsearch = QdrantVectorStore(
+                        client=client,
+                        collection_name=app.config['COLLECTION_NAME'],
+                        embedding=self.embeddings,
+                    )
+            self.status['vector_store'] = 'ready'
+
+            if app.config['RAG_HYBRID_ENABLED']:
+                component = 'bm25'
+                self.status['bm25'] = 'loading'
+                if BM25Index.exists(app.config['RAG_BM25_PATH']):
+                    self.bm25 = BM25Index.load(app.config['RAG_BM25_PATH'])
+                    self.status['bm25'] = 'ready'
+                else:
+                    # Chưa build index (flask rag build-bm25) -> chỉ dùng dense
+                    self.status['bm25'] = 'missing'
+                    app.logger.warning(f"BM25 index not found at {app.config['RAG_BM25_PATH']}")
+            self.last_error = None
+        except Exception as e:
+            self.status[component] = 'error'
+            self.last_error = f"{component}: {e}"
+            raise
+
+    def start_warmup(self):
+        """Khởi tạo model/vector store ở thread nền (chỉ chạy một lần)"""
+        if self._ready or self._warmup_thread is not None or not app.config['RAG_WARMUP']:
+            return
+        with self._init_lock:
+            if self._warmup_thread is not None:
+                return
+            self._warmup_thread = threading.Thread(
+                target=self._warm_up, name="rag-warmup", daemon=True
+            )
+        self._warmup_thread.start()
+
+    def _warm_up(self):
+        try:
+            self.ensure_ready()
+            # Chạy thử một lần để torch khởi tạo sẵn kernel, tránh chậm ở câu hỏi đầu tiên
+            self.embeddings.embed_query("khởi động")
+            if self.reranker is not None:
+                self.reranker.score("khởi động", ["khởi động"])
+            app.logger.info("RAG warm-up finished")
+        except Exception as e:
+            app.logger.error(f"RAG warm-up error: {e}")
+
+    def readiness(self):
+        return {
+            'ready': self._ready,
+            'components': dict(self.status),
+            'reranker': (
+                'disabled' if self.reranker is None
+                else 'ready' if self.reranker.is_loaded else 'pending'
+            ),
+            'error': self.last_error,
+        }
+
+    def _get_conversation_messages(self, conversation_id, query=None):
         """
-        Lấy lịch sử hội thoại và chuyển đổi sang định dạng LangChain messages
+        Lấy lịch sử hội thoại (LangChain messages) từ cache của dao_chat.
+        Giữ nguyên văn mọi tin nhắn chưa được tóm tắt (RAG_HISTORY_TURNS lượt gần nhất cộng phần
+        tràn đang chờ tóm tắt), phần cũ hơn được thay bằng bản tóm tắt lưu trong ChatConversation.
         """
-        from app.models import ChatMessage
+        from app.dao import dao_chat
 
-        messages = ChatMessage.query.filter_by(
-            conversation_id=conversation_id
-        ).order_by(ChatMessage.timestamp.asc()).all()
+        state = dao_chat.get_conversation_state(conversation_id)
+        if state is None:
+            return []
 
-        # Chuyển đổi sang định dạng LangChain messages
-        langchain_messages = []
-        for msg in messages:
-            if msg.message_type == "user":
-                langchain_messages.append(HumanMessage(content=msg.content))
-            elif msg.message_type == "bot":
-                langchain_messages.append(AIMessage(content=msg.content))
+        # Tin nhắn hiện tại của người dùng đã được lưu trước khi gọi RAG
+        history = self._drop_current_query([message for _, message in state.messages], query)
+        if not self.history_turns:
+            return history
 
-        return langchain_messages
+        # Cửa sổ tràn đủ nhiều -> tóm tắt lại ở nền. Tới khi tóm tắt xong, phần tràn vẫn được gửi
+        # nguyên văn (không cắt theo cửa sổ) để không mất ngữ cảnh giữa bản tóm tắt và cửa sổ
+        window = self.history_turns * 2
+        if len(history) - window >= self.summary_batch_turns * 2:
+            self._schedule_summary(conversation_id)
 
-    def get_rag_response(self, query, conversation_id):
+        if state.summary:
+            history.insert(0, SystemMessage(content=f"Tóm tắt hội thoại trước đó:\n{state.summary}"))
+        return history
+
+    @staticmethod
+    def _drop_current_query(history, query):
+        # Bỏ tin nhắn của lượt hiện tại (đã lưu DB) để câu hỏi không bị lặp trong prompt
+        if query is not None and history and isinstance(history[-1], HumanMessage) \
+                and history[-1].content == query:
+            return history[:-1]
+        return history
+
+    def _schedule_summary(self, conversation_id):
+        with self._summary_lock:
+            if conversation_id in self._summary_pending:
+                return
+            self._summary_pending.add(conversation_id)
+        self._summary_executor.submit(self._refresh_summary, conversation_id)
+
+    def _refresh_summary(self, conversation_id):
+        """Gộp các tin nhắn đã ra khỏi cửa sổ vào bản tóm tắt của conversation (chạy nền)"""
+        from app.dao import dao_chat
+        from app.extensions import db
+        from app.models import ChatConversation, ChatMessage
+
+        try:
+            self.ensure_ready()
+            with app.app_context():
+                start = time.perf_counter()
+                conversation = ChatConversation.query.get(conversation_id)
+                if not conversation:
+                    return
+
+                messages = ChatMessage.query.filter(
+                    ChatMessage.conversation_id == conversation_id,
+                    ChatMessage.message_id > (conversation.summary_upto_message_id or 0)
+                ).order_by(ChatMessage.message_id.asc()).all()
+                # Câu hỏi của lượt đang xử lý (chưa có câu trả lời) không thuộc cửa sổ lịch sử,
+                # bỏ đi để ranh giới tóm tắt trùng với cửa sổ _history_for dùng và không cắt giữa một lượt
+                if messages and messages[-1].message_type == 'user':
+                    messages = messages[:-1]
+                to_fold = messages[:-self.history_turns * 2]
+                if not to_fold:
+                    return
+
+                transcript = "\n".join(
+                    f"{'Người dùng' if msg.message_type == 'user' else 'Trợ lý'}: {msg.content}"
+                    for msg in to_fold
+                )
+                response = self.llm.invoke(self.summary_prompt.format_messages(
+                    summary=conversation.summary or "(chưa có)",
+                    messages=transcript
+                ))
+
+                # Giữ nguyên updated_at để không đổi thứ tự conversation trên sidebar
+                ChatConversation.query.filter_by(conversation_id=conversation_id).update({
+                    'summary': response.content,
+                    'summary_upto_message_id': to_fold[-1].message_id,
+                    'updated_at': ChatConversation.updated_at
+                })
+                db.session.commit()
+                dao_chat.apply_summary(conversation_id, response.content, to_fold[-1].message_id)
+                self.metrics.record("summary", (time.perf_counter() - start) * 1000)
+        except Exception as e:
+            self.metrics.record("summary", 0, error=True)
+            app.logger.error(f"RAG summary error conversation={conversation_id}: {e}")
+        finally:
+            with self._summary_lock:
+                self._summary_pending.discard(conversation_id)
+
+    def _format_context(self, docs):
+        return self.document_separator.join(
+            format_document(doc, self.document_prompt) for doc in docs
+        )
+
+    def _cache_namespace(self):
+        return (f"{app.config['COLLECTION_NAME']}:{app.config['RAG_COLLECTION_VERSION']}:"
+                f"{self.collection_version.get()}")
+
+    def _route(self, query, timings, conversation_id=None):
+        """Phân loại câu hỏi (xã giao / giá cổ phiếu / RAG); None nếu tắt router"""
+        self.ensure_ready()
+        if self.router is None:
+            return None
+
+        def has_history():
+            from app.dao import dao_chat
+
+            state = dao_chat.get_conversation_state(conversation_id) if conversation_id else None
+            if state is None:
+                return False
+            # Tin nhắn của lượt hiện tại có thể đã được lưu, không tính là lịch sử
+            return bool(state.summary or self._drop_current_query([m for _, m in state.messages], query))
+
+        with self.metrics.stage("route", timings):
+            route = self.router.route(query, normalize_query(query), has_history)
+        timings["intent"] = route.intent
+        return route
+
+    def _stock_answer(self, route, timings):
+        """Trả lời giá cổ phiếu từ yfinance; None nếu không lấy được dữ liệu (chuyển sang RAG)"""
+        from app import market_data, ohlcv_store
+
+        with self.metrics.stage("stock", timings):
+            for symbol in route.symbols:
+                try:
+                    # Cùng khoảng 30 ngày với /api/stocks/search để dùng chung cache
+                    stock_data, _ = market_data.fetch_stock(
+                        symbol, days=30, cache=market_data.get_cache(), store=ohlcv_store.get_store()
+                    )
+                except Exception as e:
+                    app.logger.warning(f"Stock lookup error symbol={symbol}: {e}")
+                    continue
+                if stock_data is None:
+                    continue
+                timings["stock_symbol"] = symbol
+                return market_data.format_stock_answer(stock_data)
+        return None
+
+    def _prepare(self, query, conversation_id, timings):
         """
-        Lấy response từ RAG cho 1 conversation_id
+        Lấy lịch sử hội thoại và chuẩn hoá câu hỏi.
+        Trả về (chat_history, normalized, shared_key); shared_key là câu hỏi đã chuẩn hoá khi
+        chưa có lịch sử (câu trả lời không phụ thuộc ngữ cảnh, dùng được cho cache và gộp request).
         """
-        try:
-            # 1. Lấy lịch sử chat từ DB cho conversation
-            chat_history = self._get_conversation_messages(conversation_id)
+        self.ensure_ready()
+
+        # 1. Lấy lịch sử chat từ DB cho conversation
+        with self.metrics.stage("history", timings):
+            chat_history = self._get_conversation_messages(conversation_id, query)
+
+        normalized = normalize_query(query)
+        shared_key = normalized if normalized and not chat_history else None
+        return chat_history, normalized, shared_key
+
+    def _lookup(self, query, normalized, shared_key, timings, query_vector=None):
+        """Embedding câu hỏi đã chuẩn hoá rồi tra semantic cache; trả về (query_vector, cached_answer)"""
+        # 2. Embedding câu hỏi đã chuẩn hoá (dùng chung cho cache và tìm kiếm),
+        # bỏ qua nếu router đã tính
+        if query_vector is None:
+            with self.metrics.stage("embed", timings):
+                query_vector = self.embeddings.embed_query(normalized or query)
+
+        # 3. Semantic cache, chỉ khi chưa có lịch sử hội thoại
+        cached_answer = None
+        if self.answer_cache is not None and shared_key is not None:
+            with self.metrics.stage("cache", timings):
+                cached_answer = self.answer_cache.lookup(self._cache_namespace(), query_vector)
+            timings["cache_hit"] = cached_answer is not None
+
+        return query_vector, cached_answer
 
-            # 2. Tạo memory đúng cách - KHÔNG truyền chat_history vào constructor
-            memory = ConversationBufferMemory(
-                memory_key="chat_history",
-                return_messages=True
+    def _flight_key(self, shared_key):
+        """
+        Khoá gộp request gồm cả namespace version collection: câu hỏi giống hệt nhưng đến sau
+        khi dữ liệu được nạp lại không nhận câu trả lời tính trên collection cũ.
+        Tính một lần cho mỗi request để begin/finish dùng cùng khoá dù version đổi giữa chừng.
+        """
+        if self.single_flight is None or shared_key is None:
+            return None
+        return f"{self._cache_namespace()}\x00{shared_key}"
+
+    def _begin_flight(self, flight_key, timings):
+        """Trả về (call, is_leader) nếu câu hỏi được gộp với request giống hệt đang chạy, ngược lại (None, True)"""
+        if flight_key is None:
+            return None, True
+        call, leader = self.single_flight.begin(flight_key)
+        if not leader:
+            timings["coalesced"] = True
+        return call, leader
+
+    def _dense_search(self, query_vector, k):
+        if self.local_index is not None:
+            # Snapshot cục bộ chỉ hỗ trợ similarity, không có MMR
+            return self.local_index.similarity_search_by_vector(query_vector, k=k)
+        if self.search_type == "mmr":
+            return self.docsearch.max_marginal_relevance_search_by_vector(
+                query_vector,
+                k=k,
+                fetch_k=app.config['RAG_MMR_FETCH_K'],
+                lambda_mult=app.config['RAG_MMR_LAMBDA']
             )
+        return self.searcher.similarity_search_by_vector(query_vector, k=k)
 
-            # 3. Thêm tin nhắn vào memory thủ công
-            for message in chat_history:
-                if isinstance(message, HumanMessage):
-                    memory.chat_memory.add_user_message(message.content)
-                elif isinstance(message, AIMessage):
-                    memory.chat_memory.add_ai_message(message.content)
-
-            # 4. Tạo chain
-            question_answer_chain = create_stuff_documents_chain(
-                self.llm,
-                self.prompt
+    def _build_messages(self, query, chat_history, query_vector, timings):
+        """Tìm kiếm tài liệu trên Qdrant, rerank (nếu bật), ghép context và prompt"""
+        # 4. Tìm kiếm vector (Qdrant hoặc snapshot cục bộ) + BM25 nếu bật hybrid
+        dense_k = app.config['RAG_DENSE_K'] if self.bm25 is not None else self.top_k
+        with self.metrics.stage("search", timings):
+            docs = self._dense_search(query_vector, dense_k)
+
+        if self.bm25 is not None:
+            with self.metrics.stage("bm25", timings):
+                sparse_docs = self.bm25.get_relevant_documents(query, k=app.config['RAG_SPARSE_K'])
+            docs = reciprocal_rank_fusion(
+                [docs, sparse_docs],
+                k=app.config['RAG_RRF_K'],
+                limit=self.top_k
             )
-            rag_chain = create_retrieval_chain(
-                self.retriever,
-                question_answer_chain
+
+        # 4b. Bỏ chunk gần trùng trước khi rerank để đỡ phải chấm điểm
+        with self.metrics.stage("dedup", timings):
+            docs = deduplicate_documents(docs, app.config['RAG_DEDUP_THRESHOLD'])
+
+        # 4c. Rerank bằng cross-encoder, chỉ giữ top-n chunk đưa vào prompt
+        if self.reranker is not None:
+            with self.metrics.stage("rerank", timings):
+                docs = self.reranker.rerank(query, docs)
+
+        # 5. Xếp các chunk vừa ngân sách token của context
+        with self.metrics.stage("pack", timings):
+            docs = pack_documents(
+                docs,
+                app.config['RAG_CONTEXT_TOKEN_BUDGET'],
+                self.token_counter,
+                self.document_separator
             )
+        timings["context_docs"] = len(docs)
 
-            # 5. Tạo input với chat_history từ memory
-            inputs = {
-                "input": query,
-                "chat_history": memory.chat_memory.messages
-            }
+        # 6. Ghép prompt
+        with self.metrics.stage("prompt", timings):
+            messages = self.prompt.format_messages(
+                context=self._format_context(docs),
+                chat_history=chat_history,
+                input=query
+            )
+
+        return messages
+
+    def _store_answer(self, shared_key, query_vector, answer):
+        if self.answer_cache is not None and shared_key is not None \
+                and answer not in (NO_ANSWER_MESSAGE, ERROR_MESSAGE):
+            self.answer_cache.store(self._cache_namespace(), shared_key, query_vector, answer)
+
+    def _log_request(self, conversation_id, start, timings):
+        total_ms = (time.perf_counter() - start) * 1000
+        self.metrics.record("total", total_ms)
+        app.logger.info(
+            f"RAG conversation={conversation_id} total_ms={total_ms:.1f} timings={timings}"
+        )
+
+    def get_rag_response(self, query, conversation_id):
+        """
+        Lấy response từ RAG cho 1 conversation_id.
+        Mỗi bước được bấm giờ riêng để biết stage nào chậm.
+        Câu hỏi giống hệt (chưa có lịch sử) đang được xử lý thì chờ dùng chung kết quả.
+        Câu xã giao và câu hỏi giá cổ phiếu không đi qua bước tìm kiếm tài liệu.
+        """
+        timings = {}
+        start = time.perf_counter()
+        call, leader = None, True
+        answer = ERROR_MESSAGE
+        try:
+            route = self._route(query, timings, conversation_id)
+            if route is not None and route.intent == SMALLTALK:
+                with self.metrics.stage("llm", timings):
+                    response = self.llm.invoke(self.smalltalk_prompt.format_messages(input=query), timings=timings)
+                answer = response.content or NO_ANSWER_MESSAGE
+                return answer
+            if route is not None and route.intent == STOCK:
+                stock_answer = self._stock_answer(route, timings)
+                if stock_answer is not None:
+                    answer = stock_answer
+                    return answer
+
+            chat_history, normalized, shared_key = self._prepare(query, conversation_id, timings)
+
+            flight_key = self._flight_key(shared_key)
+            call, leader = self._begin_flight(flight_key, timings)
+            if not leader:
+                try:
+                    with self.metrics.stage("coalesced_wait", timings):
+                        answer = call.wait(self.single_flight.remaining(call))
+                    return answer
+                except (TimeoutError, FlightAbandoned):
+                    # Request dẫn đầu quá hạn/bị huỷ -> tự xử lý
+                    timings["coalesce_timeout"] = True
+                    call = None
+
+            query_vector, cached_answer = self._lookup(
+                query, normalized, shared_key, timings, route.vector if route is not None else None
+            )
+            if cached_answer is not None:
+                answer = cached_answer
+                return answer
 
-            # 6. Lấy response
-            response = rag_chain.invoke(inputs)
-            answer = response.get('answer', 'Xin lỗi, tôi không thể trả lời câu hỏi tài chính này.')
+            messages = self._build_messages(query, chat_history, query_vector, timings)
 
+            # 7. Gọi LLM
+            with self.metrics.stage("llm", timings):
+                response = self.llm.invoke(messages, timings=timings)
+
+            answer = response.content or NO_ANSWER_MESSAGE
+            self._store_answer(shared_key, query_vector, answer)
+            return answer
+
+        except Exception as e:
+            app.logger.error(f"RAG System Error: {e} timings={timings}")
+            answer = ERROR_MESSAGE
             return answer
 
+        finally:
+            if call is not None and leader:
+                self.single_flight.finish(flight_key, call, result=answer)
+            self._log_request(conversation_id, start, timings)
+
+    def stream_rag_response(self, query, conversation_id):
+        """
+        Giống get_rag_response nhưng yield từng token ngay khi LLM sinh ra.
+        Nếu consumer đóng generator (client ngắt kết nối) thì stream tới LLM cũng được đóng.
+        Request gộp với request giống hệt đang chạy nhận token của request đó.
+        Lỗi sau khi đã yield token thì raise StreamInterrupted để nơi gọi không coi phần đã nhận là câu trả lời đầy đủ.
+        """
+        timings = {}
+        start = time.perf_counter()
+        call, leader = None, True
+        answer = None
+        answer_parts = []
+        try:
+            route = self._route(query, timings, conversation_id)
+            if route is not None and route.intent == SMALLTALK:
+                messages = self.smalltalk_prompt.format_messages(input=query)
+                yield from self._stream_llm(messages, timings, answer_parts)
+                if not answer_parts:
+                    yield NO_ANSWER_MESSAGE
+                return
+            if route is not None and route.intent == STOCK:
+                stock_answer = self._stock_answer(route, timings)
+                if stock_answer is not None:
+                    yield stock_answer
+                    return
+
+            chat_history, normalized, shared_key = self._prepare(query, conversation_id, timings)
+
+            flight_key = self._flight_key(shared_key)
+            call, leader = self._begin_flight(flight_key, timings)
+            if not leader:
+                try:
+                    parts = call.iter_parts(self.single_flight.remaining(call), self.single_flight.timeout)
+                    for part in parts:
+                        answer_parts.append(part)
+                        yield part
+                    return
+                except (TimeoutError, FlightAbandoned) as e:
+                    if answer_parts:
+                        raise StreamInterrupted(f"Request dẫn đầu dừng giữa chừng: {e!r}") from e
+                    # Request dẫn đầu bị huỷ/quá hạn trước khi có token -> tự xử lý
+                    timings["coalesce_timeout"] = True
+                    call = None
+
+            query_vector, cached_answer = self._lookup(
+                query, normalized, shared_key, timings, route.vector if route is not None else None
+            )
+            if cached_answer is not None:
+                answer = cached_answer
+                self._publish(call, leader, answer)
+                yield answer
+                return
+
+            messages = self._build_messages(query, chat_history, query_vector, timings)
+
+            # 7. Gọi LLM ở chế độ stream
+            yield from self._stream_llm(messages, timings, answer_parts, call, leader)
+
+            if not answer_parts:
+                answer = NO_ANSWER_MESSAGE
+                self._publish(call, leader, answer)
+                yield answer
+            else:
+                answer = "".join(answer_parts)
+                self._store_answer(shared_key, query_vector, answer)
+
+        except StreamInterrupted:
+            raise
+
         except Exception as e:
-            app.logger.error(f"RAG System Error: {e}")
-            return "Xin lỗi, có lỗi xảy ra khi xử lý yêu cầu tài chính của bạn. Vui lòng thử lại."
+            app.logger.error(f"RAG System Error: {e} timings={timings}")
+            if answer_parts:
+                raise StreamInterrupted(str(e)) from e
+            answer = ERROR_MESSAGE
+            self._publish(call, leader, answer)
+            yield answer
+
+        finally:
+            if call is not None and leader:
+                if answer is not None:
+                    self.single_flight.finish(flight_key, call, result=answer)
+                else:
+                    self.single_flight.finish(flight_key, call, error=FlightAbandoned())
+            self._log_request(conversation_id, start, timings)
+
+    def _stream_llm(self, messages, timings, answer_parts, call=None, leader=True):
+        """Yield token của LLM, ghi lại vào answer_parts; đóng generator sẽ đóng stream tới LLM"""
+        llm_start = time.perf_counter()
+        stream = self.llm.stream(messages, timings=timings)
+        try:
+            for chunk in stream:
+                if not chunk.content:
+                    continue
+                if not answer_parts:
+                    first_token_ms = (time.perf_counter() - llm_start) * 1000
+                    self.metrics.record("llm_first_token", first_token_ms)
+                    timings["llm_first_token"] = round(first_token_ms, 1)
+                answer_parts.append(chunk.content)
+                self._publish(call, leader, chunk.content)
+                yield chunk.content
+        finally:
+            stream.close()
+
+        llm_ms = (time.perf_counter() - llm_start) * 1000
+        self.metrics.record("llm", llm_ms)
+        timings["llm"] = round(llm_ms, 1)
+
+    @staticmethod
+    def _publish(call, leader, part):
+        if call is not None and leader:
+            call.publish(part)
 
 
-rag_chatbot = RAGSystem()
\ No newline at end of file
+rag_chatbot = RAGSystem()
@@ -285,10 +285,11 @@ class Chatbot {
     this.showTypingIndicator()
 
     try {
-      const response = await fetch('/api/chat/send-message', {
+      const response = await fetch('/api/chat/send-message/stream', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          'Accept': 'text/event-stream',
         },
         body: JSON.stringify({
           message: message,
@@ -296,15 +297,33 @@ class Chatbot {
         })
       })
 
-      const data = await response.json()
+      if (!response.ok || !response.body) {
+        throw new Error('Không thể nhận phản hồi')
+      }
 
-      if (data.success) {
-        this.hideTypingIndicator()
-        this.addMessageToUI(data.response, "bot")
-        await this.loadConversations()
-      } else {
-        throw new Error(data.error || 'Không thể nhận phản hồi')
+      let botMessage = null
+      let answer = ""
+
+      await this.readEventStream(response, (event, data) => {
+        if (event === "token") {
+          // Token đầu tiên: bỏ typing indicator, tạo khung tin nhắn bot
+          if (!botMessage) {
+            this.hideTypingIndicator()
+            this.isTyping = true
+            botMessage = this.addStreamingMessageToUI()
+          }
+          answer += data.token
+          botMessage.update(answer)
+        } else if (event === "error") {
+          throw new Error(data.error || 'Không thể nhận phản hồi')
+        }
+      })
+
+      this.isTyping = false
+      if (!botMessage) {
+        throw new Error('Không thể nhận phản hồi')
       }
+      await this.loadConversations()
     } catch (error) {
       this.hideTypingIndicator()
       const errorMsg = "Xin lỗi, đã có lỗi xảy ra khi xử lý câu hỏi tài chính. Vui lòng thử lại sau."
@@ -313,6 +332,53 @@ class Chatbot {
     }
   }
 
+  async readEventStream(response, onEvent) {
+    // Đọc Server-Sent Events từ body của fetch (EventSource không hỗ trợ POST)
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder("utf-8")
+    let buffer = ""
+
+    while (true) {
+      const { value, done } = await reader.read()
+      if (done) break
+
+      buffer += decoder.decode(value, { stream: true })
+      const frames = buffer.split("\n\n")
+      buffer = frames.pop()
+
+      for (const frame of frames) {
+        let event = "message"
+        let data = ""
+        frame.split("\n").forEach((line) => {
+          if (line.startsWith("event: ")) event = line.slice(7)
+          else if (line.startsWith("data: ")) data += line.slice(6)
+        })
+        if (data) onEvent(event, JSON.parse(data))
+      }
+    }
+  }
+
+  addStreamingMessageToUI() {
+    const timestamp = new Date().toLocaleTimeString("vi-VN", {
+      hour: "2-digit",
+      minute: "2-digit",
+    })
+
+    this.renderMessage({ content: "", type: "bot", timestamp })
+    const messageElement = this.elements.chatMessages?.lastElementChild
+    const contentElement = messageElement?.querySelector(".message-content")
+    const timeElement = contentElement?.querySelector(".message-time")
+
+    return {
+      update: (content) => {
+        if (!contentElement) return
+        contentElement.innerHTML = this.formatMessageContent(content)
+        if (timeElement) contentElement.appendChild(timeElement)
+        this.scrollToBottom()
+      }
+    }
+  }
+
   addMessageToUI(content, type) {
     const timestamp = new Date().toLocaleTimeString("vi-VN", {
       hour: "2-digit",
@@ -73,8 +73,24 @@ function renderMarketIndices(indices) {
     $('#marketIndices').html(html);
 }
 
-function searchStock() {
+// Khoảng thời gian biểu đồ hỗ trợ bởi /api/stocks/search
+const CHART_RANGES = {
+    '1M': '1 tháng',
+    '3M': '3 tháng',
+    '6M': '6 tháng',
+    '1Y': '1 năm',
+    '5Y': '5 năm',
+    'MAX': 'toàn bộ'
+};
+// Số điểm tối đa server trả về cho biểu đồ (giảm điểm bằng LTTB)
+const CHART_MAX_POINTS = 500;
+
+let stockChart = null;
+
+function searchStock(range) {
     const symbol = $('#stockSearch').val().trim().toUpperCase();
+    // Gắn trực tiếp vào sự kiện click thì tham số là event
+    const chartRange = typeof range === 'string' ? range : '1M';
 
     if (!symbol) {
         alert('Vui lòng nhập mã cổ phiếu');
@@ -84,7 +100,7 @@ function searchStock() {
     $.ajax({
         url: '/api/stocks/search',
         method: 'GET',
-        data: { q: symbol },
+        data: { q: symbol, range: chartRange, points: CHART_MAX_POINTS },
         beforeSend: function() {
             $('#searchResultSection').show();
             $('#stockInfo').html(`
@@ -97,7 +113,7 @@ function searchStock() {
         },
         success: function(response) {
             if (response.success) {
-                renderStockInfo(response.stock, response.chart_data);
+                renderStockInfo(response.stock, response.chart, response.range);
             } else {
                 $('#stockInfo').html(`
                     <div class="error-message">
@@ -118,7 +134,7 @@ function searchStock() {
     });
 }
 
-function renderStockInfo(stock, chartData) {
+function renderStockInfo(stock, chart, chartRange) {
     const changeClass = stock.change >= 0 ? 'price-positive' : 'price-negative';
     const changeIcon = stock.change >= 0 ? 'fa-arrow-up' : 'fa-arrow-down';
 
@@ -164,9 +180,12 @@ function renderStockInfo(stock, chartData) {
                 ${detailsHtml}
             </div>
 
-            ${chartData.length > 0 ? `
+            ${chart.close.length > 0 ? `
                 <div class="mt-4">
-                    <h5><i class="fas fa-chart-line me-2"></i>Biểu đồ giá 30 ngày qua</h5>
+                    <div class="d-flex align-items-center justify-content-between">
+                        <h5><i class="fas fa-chart-line me-2"></i>Biểu đồ giá ${CHART_RANGES[chartRange]}</h5>
+                        ${renderRangeButtons(chartRange)}
+                    </div>
                     <div id="priceChart" style="height: 300px; width: 100%;">
                         <!-- Có thể tích hợp biểu đồ bằng Chart.js tại đây -->
                         <canvas id="stockChart"></canvas>
@@ -179,11 +198,19 @@ function renderStockInfo(stock, chartData) {
     $('#stockInfo').html(html);
 
     // Vẽ biểu đồ nếu có dữ liệu
-    if (chartData.length > 0) {
-        drawStockChart(chartData);
+    if (chart.close.length > 0) {
+        drawStockChart(chart);
     }
 }
 
+function renderRangeButtons(activeRange) {
+    const buttons = Object.keys(CHART_RANGES).map(range => `
+        <button type="button" class="btn ${range === activeRange ? 'btn-primary' : 'btn-outline-primary'}"
+                onclick="searchStock('${range}')">${range}</button>
+    `).join('');
+    return `<div class="btn-group btn-group-sm">${buttons}</div>`;
+}
+
 function loadTopStocks() {
     // Tải top gainers
     $.ajax({
@@ -268,7 +295,7 @@ function showError(containerId, message) {
 }
 
 // Hàm vẽ biểu đồ (đơn giản)
-function drawStockChart(chartData) {
+function drawStockChart(chart) {
     const ctx = document.getElementById('stockChart').getContext('2d');
 
     // Kiểm tra xem Chart đã được định nghĩa chưa
@@ -277,19 +304,24 @@ function drawStockChart(chartData) {
         const script = document.createElement('script');
         script.src = 'https://cdn.jsdelivr.net/npm/chart.js';
         script.onload = function() {
-            createChart(ctx, chartData);
+            createChart(ctx, chart);
         };
         document.head.appendChild(script);
     } else {
-        createChart(ctx, chartData);
+        createChart(ctx, chart);
     }
 }
 
-function createChart(ctx, chartData) {
-    const dates = chartData.map(d => d.date);
-    const prices = chartData.map(d => d.close);
+function createChart(ctx, chart) {
+    // Dữ liệu dạng cột: mỗi trường là một mảng
+    const dates = chart.date;
+    const prices = chart.close;
 
-    new Chart(ctx, {
+    // Huỷ biểu đồ cũ trước khi vẽ khoảng thời gian mới
+    if (stockChart) {
+        stockChart.destroy();
+    }
+    stockChart = new Chart(ctx, {
         type: 'line',
         data: {
             labels: dates,
@@ -357,7 +389,7 @@ function setupStockClickEvents() {
 }
 
 // Cập nhật hàm renderStockInfo để thêm nút xem biểu đồ realtime
-function renderStockInfo(stock, chartData) {
+function renderStockInfo(stock, chart, chartRange) {
     const changeClass = stock.change >= 0 ? 'price-positive' : 'price-negative';
     const changeIcon = stock.change >= 0 ? 'fa-arrow-up' : 'fa-arrow-down';
 
@@ -409,9 +441,12 @@ function renderStockInfo(stock, chartData) {
                 ${detailsHtml}
             </div>
 
-            ${chartData.length > 0 ? `
+            ${chart.close.length > 0 ? `
                 <div class="mt-4">
-                    <h5><i class="fas fa-chart-line me-2"></i>Biểu đồ giá 30 ngày qua</h5>
+                    <div class="d-flex align-items-center justify-content-between">
+                        <h5><i class="fas fa-chart-line me-2"></i>Biểu đồ giá ${CHART_RANGES[chartRange]}</h5>
+                        ${renderRangeButtons(chartRange)}
+                    </div>
                     <div id="priceChart" style="height: 300px; width: 100%;">
                         <canvas id="stockChart"></canvas>
                     </div>
@@ -441,8 +476,8 @@ function renderStockInfo(stock, chartData) {
     });
 
     // Vẽ biểu đồ nếu có dữ liệu
-    if (chartData.length > 0) {
-        drawStockChart(chartData);
+    if (chart.close.length > 0) {
+        drawStockChart(chart);
     }
 }
 
@@ -0,0 +1 @@
+# Benchmark hiệu năng cho pipeline RAG và API chứng khoán (chạy bằng `python -m benchmarks.<tên>`)
@@ -0,0 +1,92 @@
+"""
+So sánh cách dựng dữ liệu biểu đồ của /api/stocks/search: vòng lặp hist.iterrows() cũ
+(một dict mỗi nến) với app.chart_payload.build_chart_payload (dạng cột) và có/không LTTB.
+Dữ liệu OHLCV giả lập (random walk theo ngày giao dịch) nên không cần mạng.
+
+    python -m benchmarks.chart_payload --points 500 --repeat 20 --output bench_chart.json
+"""
+import argparse
+import json
+import statistics
+import time
+
+import numpy as np
+import pandas as pd
+
+# Số phiên giao dịch xấp xỉ của mỗi khoảng thời gian
+SIZES = {'1Y': 252, '5Y': 1260, 'max': 6300}
+
+
+def synthetic_history(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.015, rows)))
+    open_ = close * (1 + rng.normal(0, 0.005, rows))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.008, rows)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.008, rows)))
+    index = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=rows, tz='Asia/Ho_Chi_Minh')
+    return pd.DataFrame({
+        'Open': open_, 'High': high, 'Low': low, 'Close': close,
+        'Volume': rng.integers(100_000, 5_000_000, rows),
+    }, index=index)
+
+
+def legacy_chart_data(hist):
+    """Cách làm cũ của search_stocks"""
+    chart_data = []
+    for index, row in hist.iterrows():
+        chart_data.append({
+            'date': index.strftime('%Y-%m-%d'),
+            'open': float(row['Open']),
+            'high': float(row['High']),
+            'low': float(row['Low']),
+            'close': float(row['Close']),
+            'volume': int(row['Volume'])
+        })
+    return chart_data
+
+
+def _measure(fn, repeat):
+    timings, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'median_ms': round(statistics.median(timings), 3),
+        'min_ms': round(min(timings), 3),
+        'payload_bytes': len(json.dumps(result)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=500, help="Số điểm tối đa khi bật LTTB")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    from app.chart_payload import build_chart_payload
+
+    results = {}
+    for name, rows in SIZES.items():
+        hist = synthetic_history(rows)
+        legacy = _measure(lambda: legacy_chart_data(hist), args.repeat)
+        columnar = _measure(lambda: build_chart_payload(hist), args.repeat)
+        lttb = _measure(lambda: build_chart_payload(hist, max_points=args.points), args.repeat)
+        results[name] = {
+            'rows': rows,
+            'iterrows': legacy,
+            'columnar': columnar,
+            f'columnar_lttb_{args.points}': lttb,
+            'speedup': round(legacy['median_ms'] / columnar['median_ms'], 1),
+        }
+        print(f"{name}: {json.dumps(results[name], ensure_ascii=False)}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": {k: v for k, v in vars(args).items() if k != "output"}, "results": results},
+                      f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
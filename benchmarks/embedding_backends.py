@@ -0,0 +1,179 @@
+"""
+So sánh các backend embedding (torch fp32, torch-int8, onnx, onnx-int8) trên CPU:
+thời gian load, độ trễ embed_query, throughput embed_documents, bộ nhớ (RSS)
+và mức độ đồng thuận top-k so với backend torch hiện tại.
+
+    python -m benchmarks.embedding_backends --backends torch torch-int8 onnx-int8 \
+        --onnx-path models/vietnamese-embedding-onnx --output bench_embeddings.json
+
+Mỗi backend chạy trong một process riêng để số đo bộ nhớ không lẫn nhau.
+"""
+import argparse
+import json
+import multiprocessing
+import statistics
+import time
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows không có module resource
+    resource = None
+
+SAMPLE_DOCUMENTS = [
+    "Khấu hao tài sản cố định là việc phân bổ giá trị tài sản vào chi phí trong thời gian sử dụng.",
+    "Phương pháp khấu hao đường thẳng chia đều nguyên giá tài sản cho số năm sử dụng.",
+    "Khấu hao theo số dư giảm dần có điều chỉnh giúp trích khấu hao nhanh trong những năm đầu.",
+    "Thuế thu nhập cá nhân được tính theo biểu thuế lũy tiến từng phần với 7 bậc.",
+    "Người nộp thuế được giảm trừ gia cảnh 11 triệu đồng mỗi tháng cho bản thân.",
+    "Giảm trừ cho mỗi người phụ thuộc là 4,4 triệu đồng mỗi tháng.",
+    "Quỹ dự phòng khẩn cấp nên bằng từ 3 đến 6 tháng chi tiêu thiết yếu.",
+    "Quy tắc 50/30/20 chia thu nhập cho nhu cầu thiết yếu, mong muốn và tiết kiệm.",
+    "Lãi suất kép giúp khoản tiết kiệm tăng trưởng theo cấp số nhân theo thời gian.",
+    "Chứng chỉ quỹ mở phù hợp với nhà đầu tư cá nhân muốn đa dạng hoá danh mục.",
+    "Cổ phiếu blue-chip là cổ phiếu của các doanh nghiệp lớn, hoạt động ổn định.",
+    "Trái phiếu doanh nghiệp có lợi suất cao hơn nhưng rủi ro tín dụng lớn hơn trái phiếu chính phủ.",
+    "Chỉ số P/E cho biết nhà đầu tư trả bao nhiêu đồng cho một đồng lợi nhuận của doanh nghiệp.",
+    "Bảo hiểm nhân thọ giúp bảo vệ tài chính gia đình khi người trụ cột gặp rủi ro.",
+    "Bảo hiểm y tế tự nguyện bổ sung chi phí khám chữa bệnh ngoài bảo hiểm xã hội.",
+    "Lập kế hoạch hưu trí sớm giúp tận dụng lãi kép trong thời gian dài.",
+    "Quỹ hưu trí bổ sung tự nguyện được hưởng ưu đãi thuế thu nhập cá nhân.",
+    "Trả nợ theo phương pháp tuyết lăn ưu tiên các khoản nợ nhỏ nhất trước.",
+    "Phương pháp tuyết lở ưu tiên trả các khoản nợ có lãi suất cao nhất trước.",
+    "Thẻ tín dụng có thời gian miễn lãi tối đa khoảng 45 ngày nếu thanh toán đủ dư nợ.",
+    "Vàng thường được coi là kênh trú ẩn an toàn khi lạm phát tăng cao.",
+    "Bất động sản có tính thanh khoản thấp và cần vốn đầu tư lớn.",
+    "Chỉ số VN-Index phản ánh biến động giá của các cổ phiếu niêm yết trên sàn HOSE.",
+    "Cổ tức có thể được chi trả bằng tiền mặt hoặc bằng cổ phiếu.",
+    "Lạm phát làm giảm sức mua của đồng tiền theo thời gian.",
+    "Tiết kiệm tự động bằng cách trích một phần lương ngay khi nhận giúp duy trì kỷ luật.",
+    "Phân bổ tài sản là việc chia vốn đầu tư giữa cổ phiếu, trái phiếu và tiền mặt.",
+    "Nhà đầu tư nên đánh giá khẩu vị rủi ro trước khi lựa chọn sản phẩm đầu tư.",
+    "Thuế giá trị gia tăng phổ biến hiện nay là 10%, một số hàng hoá áp dụng 5%.",
+    "Doanh nghiệp được trừ chi phí khấu hao khi tính thuế thu nhập doanh nghiệp nếu đúng quy định.",
+]
+
+SAMPLE_QUERIES = [
+    "Khấu hao là gì?",
+    "khấu hao tài sản là gì",
+    "Cách tính thuế thu nhập cá nhân",
+    "Giảm trừ gia cảnh bao nhiêu tiền?",
+    "Nên để bao nhiêu tiền dự phòng?",
+    "Đầu tư gì an toàn với số vốn nhỏ?",
+    "Làm sao để trả nợ nhanh nhất?",
+    "Loại bảo hiểm nào cần thiết cho người trẻ?",
+    "Lập kế hoạch hưu trí từ tuổi 30",
+    "Chỉ số P/E nghĩa là gì?",
+]
+
+
+def _rss_mb():
+    # Peak RSS; ru_maxrss trên Linux tính bằng KB
+    if resource is None:
+        return 0.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_backend(backend, model_name, onnx_path, onnx_file, documents, queries, repeats, queue):
+    from app.core_rag.embeddings import build_embeddings
+
+    try:
+        rss_before = _rss_mb()
+        start = time.perf_counter()
+        embeddings = build_embeddings(model_name, backend, onnx_path=onnx_path, onnx_file=onnx_file)
+        embeddings.embed_query("khởi động")
+        load_s = time.perf_counter() - start
+
+        latencies = []
+        query_vectors = None
+        for _ in range(repeats):
+            vectors = []
+            for query in queries:
+                t = time.perf_counter()
+                vectors.append(embeddings.embed_query(query))
+                latencies.append((time.perf_counter() - t) * 1000)
+            query_vectors = vectors
+
+        start = time.perf_counter()
+        doc_vectors = embeddings.embed_documents(documents)
+        batch_s = time.perf_counter() - start
+
+        latencies.sort()
+        queue.put({
+            'backend': backend,
+            'load_s': round(load_s, 2),
+            'query_p50_ms': round(statistics.median(latencies), 2),
+            'query_p95_ms': round(latencies[int(0.95 * (len(latencies) - 1))], 2),
+            'docs_per_s': round(len(documents) / batch_s, 1),
+            'rss_mb': round(_rss_mb(), 1),
+            'rss_delta_mb': round(_rss_mb() - rss_before, 1),
+            'query_vectors': query_vectors,
+            'doc_vectors': doc_vectors,
+        })
+    except Exception as e:
+        queue.put({'backend': backend, 'error': str(e)})
+
+
+def _top_k(query_vectors, doc_vectors, k):
+    q = np.asarray(query_vectors, dtype=np.float32)
+    d = np.asarray(doc_vectors, dtype=np.float32)
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    d /= np.linalg.norm(d, axis=1, keepdims=True)
+    return np.argsort(-(q @ d.T), axis=1)[:, :k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', nargs='+', default=['torch', 'torch-int8', 'onnx-int8'])
+    parser.add_argument('--model', default='dangvantuan/vietnamese-embedding')
+    parser.add_argument('--onnx-path', help='Thư mục model đã export bằng `flask rag export-onnx`')
+    parser.add_argument('--onnx-file', help='File ONNX trong thư mục (mặc định theo backend)')
+    parser.add_argument('--corpus', help='File text, mỗi dòng một đoạn văn (mặc định dùng bộ mẫu có sẵn)')
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--output', help='Ghi kết quả ra file JSON')
+    args = parser.parse_args()
+
+    documents = SAMPLE_DOCUMENTS
+    if args.corpus:
+        with open(args.corpus, encoding='utf-8') as f:
+            documents = [line.strip() for line in f if line.strip()]
+
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    for backend in args.backends:
+        queue = ctx.Queue()
+        process = ctx.Process(target=_run_backend, args=(
+            backend, args.model, args.onnx_path, args.onnx_file,
+            documents, SAMPLE_QUERIES, args.repeats, queue
+        ))
+        process.start()
+        result = queue.get()
+        process.join()
+        results.append(result)
+
+    baseline = next((r for r in results if r['backend'] == 'torch' and 'error' not in r), None)
+    baseline_top = _top_k(baseline['query_vectors'], baseline['doc_vectors'], args.top_k) if baseline else None
+
+    report = []
+    for result in results:
+        row = {key: value for key, value in result.items() if key not in ('query_vectors', 'doc_vectors')}
+        if baseline_top is not None and 'error' not in result:
+            top = _top_k(result['query_vectors'], result['doc_vectors'], args.top_k)
+            overlaps = [len(set(a) & set(b)) / args.top_k for a, b in zip(top, baseline_top)]
+            row[f'top{args.top_k}_overlap'] = round(float(np.mean(overlaps)), 3)
+            q = np.asarray(result['query_vectors'])
+            qb = np.asarray(baseline['query_vectors'])
+            cos = (q * qb).sum(axis=1) / (np.linalg.norm(q, axis=1) * np.linalg.norm(qb, axis=1))
+            row['cosine_vs_torch'] = round(float(cos.mean()), 4)
+        report.append(row)
+        print(json.dumps(row, ensure_ascii=False))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
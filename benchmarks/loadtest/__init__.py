@@ -0,0 +1 @@
+# Load test luồng chat: `python -m benchmarks.loadtest.run --help`
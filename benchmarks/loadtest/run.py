@@ -0,0 +1,289 @@
+"""
+Load test luồng chat với các virtual user đã đăng nhập. Chạy app Flask trong process cùng:
+- server LLM giả lập OpenAI-compatible (độ trễ token cấu hình được)
+- Qdrant in-memory nạp sẵn các tài liệu của golden set (benchmarks/retrieval)
+- SQLite tạm (mặc định) hoặc MySQL qua --db-url
+
+Mỗi virtual user lặp: GET /api/chat/conversations -> POST /api/chat/send-message
+-> GET /api/chat/conversations/<id>/messages, mở conversation mới sau mỗi --turns lượt.
+Báo cáo throughput, p50/p95/p99, tỉ lệ lỗi và số câu SQL mỗi request (header X-DB-Query-Count).
+
+    python -m benchmarks.loadtest.run --users 20 --duration 60 --token-ms 20 --output bench_load.json
+
+Model embedding vẫn là model thật (EMBEDDING_BACKEND) và cần có sẵn trong cache HuggingFace.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+
+GOLDEN_SET = os.path.join(os.path.dirname(os.path.dirname(__file__)), "retrieval", "golden_set.json")
+PASSWORD = "loadtest-password"
+_CSRF_RE = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+
+
+def _configure_environment(args, llm_base):
+    # Phải đặt trước khi import app (app/__init__.py đọc cấu hình lúc import, load_dotenv không ghi đè)
+    os.environ["DATABASE_URL"] = args.db_url
+    os.environ["LLM_API_BASE"] = llm_base
+    os.environ["OPENAI_API_KEY"] = "stub"
+    os.environ["MODEL_LLM_NAME"] = args.model
+    os.environ["QDRANT_URL"] = ":memory:"
+    os.environ["COLLECTION_NAME"] = "finance_loadtest"
+    os.environ["RAG_VECTOR_TIER"] = "qdrant"
+    os.environ["RAG_SEARCH_TYPE"] = "similarity"
+    os.environ["RAG_HYBRID_ENABLED"] = "False"
+    os.environ["RAG_WARMUP"] = "False"
+    os.environ["RAG_CACHE_ENABLED"] = str(args.answer_cache)
+    os.environ["SQL_QUERY_COUNT_HEADER"] = "True"
+    os.environ.setdefault("SECRET_KEY", "loadtest")
+    os.environ.setdefault("MAIL_PORT", "587")
+
+
+def _seed_vector_store(rag_chatbot):
+    from qdrant_client.models import PointStruct
+    from langchain_core.documents import Document
+    from app.core_rag.ingest import chunk_point_id, ensure_collection, preprocess_data, text_split
+
+    with open(GOLDEN_SET, encoding="utf-8") as f:
+        golden = json.load(f)
+    cleaned = [
+        Document(page_content=preprocess_data(doc["text"]), metadata={"source": doc["source"]})
+        for doc in golden["documents"]
+    ]
+    chunks = text_split(cleaned)
+    vectors = rag_chatbot.embeddings.embed_documents([chunk.page_content for chunk in chunks])
+
+    client = rag_chatbot.searcher.client
+    ensure_collection(client, rag_chatbot.searcher.collection_name, len(vectors[0]))
+    client.upsert(collection_name=rag_chatbot.searcher.collection_name, points=[
+        PointStruct(id=chunk_point_id(chunk.metadata["source"], chunk.page_content, i), vector=vector,
+                    payload={"page_content": chunk.page_content, "metadata": chunk.metadata})
+        for i, (chunk, vector) in enumerate(zip(chunks, vectors))
+    ])
+    return [question["question"] for question in golden["questions"]]
+
+
+def _create_users(app, count):
+    # Tạo trực tiếp bản ghi User (mật khẩu băm giống dao_user) để không phụ thuộc các tham số của form đăng ký
+    import hashlib
+    from app.dao import dao_authen
+    from app.extensions import db
+    from app.models import RoleEnum, User
+
+    hashed_password = hashlib.md5(PASSWORD.encode("utf-8")).hexdigest()
+    with app.app_context():
+        db.create_all()
+        usernames = []
+        for i in range(count):
+            username = f"loadtest_{i}"
+            if not dao_authen.check_username_exists(username):
+                db.session.add(User(
+                    username=username, email=f"{username}@loadtest.local", password=hashed_password,
+                    first_name="Load", last_name=f"Test {i}", phone_number=f"09{i:08d}", address="Loadtest",
+                    role=RoleEnum.USER, is_active=True,
+                ))
+            usernames.append(username)
+        db.session.commit()
+        return usernames
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def record(self, name, latency_ms, ok, db_queries=None):
+        with self._lock:
+            self.samples.setdefault(name, []).append((latency_ms, ok, db_queries))
+
+    def report(self, elapsed_s):
+        report = {}
+        with self._lock:
+            items = list(self.samples.items())
+        for name, samples in sorted(items):
+            latencies = sorted(latency for latency, _, _ in samples)
+            errors = sum(1 for _, ok, _ in samples if not ok)
+            queries = [q for _, _, q in samples if q is not None]
+            report[name] = {
+                "requests": len(samples),
+                "errors": errors,
+                "error_rate": round(errors / len(samples), 4),
+                "throughput_rps": round(len(samples) / elapsed_s, 2),
+                "p50_ms": _percentile(latencies, 50),
+                "p95_ms": _percentile(latencies, 95),
+                "p99_ms": _percentile(latencies, 99),
+                "db_queries_avg": round(sum(queries) / len(queries), 2) if queries else None,
+                "db_queries_max": max(queries) if queries else None,
+            }
+        return report
+
+
+def _percentile(sorted_samples, percent):
+    if not sorted_samples:
+        return None
+    rank = max(math.ceil(percent / 100 * len(sorted_samples)) - 1, 0)
+    return round(sorted_samples[rank], 1)
+
+
+class VirtualUser(threading.Thread):
+    def __init__(self, base_url, username, questions, recorder, deadline, args, seed):
+        super().__init__(name=f"vu-{username}", daemon=True)
+        self.base_url = base_url
+        self.username = username
+        self.questions = questions
+        self.recorder = recorder
+        self.deadline = deadline
+        self.args = args
+        self.random = random.Random(seed)
+
+    def _request(self, session, name, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = session.request(method, self.base_url + path, timeout=self.args.timeout, **kwargs)
+            if kwargs.get("stream"):
+                # Đọc hết stream; thời gian tới token đầu tiên ghi riêng, giữ lại dữ liệu event start
+                first_token = None
+                event = None
+                response.start_event = {}
+                for line in response.iter_lines(decode_unicode=True):
+                    if line.startswith("event: "):
+                        event = line[len("event: "):]
+                        if event == "token" and first_token is None:
+                            first_token = (time.perf_counter() - start) * 1000
+                            self.recorder.record(f"{name} (first token)", first_token, True)
+                    elif line.startswith("data: ") and event == "start":
+                        response.start_event = json.loads(line[len("data: "):])
+            ok = response.status_code < 400
+        except Exception:
+            response, ok = None, False
+        latency_ms = (time.perf_counter() - start) * 1000
+        db_queries = None
+        if response is not None and "X-DB-Query-Count" in response.headers:
+            db_queries = int(response.headers["X-DB-Query-Count"])
+        self.recorder.record(name, latency_ms, ok, db_queries)
+        return response if ok else None
+
+    def _login(self, session):
+        page = session.get(self.base_url + "/login", timeout=self.args.timeout)
+        match = _CSRF_RE.search(page.text)
+        response = session.post(self.base_url + "/login", data={
+            "csrf_token": match.group(1) if match else "",
+            "username": self.username,
+            "password": PASSWORD,
+        }, allow_redirects=False, timeout=self.args.timeout)
+        return response.status_code in (301, 302)
+
+    def run(self):
+        import requests
+
+        session = requests.Session()
+        if not self._login(session):
+            self.recorder.record("POST /login", 0.0, False)
+            return
+
+        conversation_id = None
+        turns = 0
+        while time.monotonic() < self.deadline:
+            self._request(session, "GET /api/chat/conversations", "GET", "/api/chat/conversations")
+
+            if turns >= self.args.turns:
+                conversation_id, turns = None, 0
+            payload = {"message": self.random.choice(self.questions), "conversation_id": conversation_id}
+            if self.args.stream:
+                response = self._request(session, "POST /api/chat/send-message/stream", "POST",
+                                         "/api/chat/send-message/stream", json=payload, stream=True)
+                if response is not None:
+                    conversation_id = response.start_event.get("conversation_id")
+            else:
+                response = self._request(session, "POST /api/chat/send-message", "POST",
+                                         "/api/chat/send-message", json=payload)
+                if response is not None:
+                    conversation_id = response.json().get("conversation_id")
+            turns += 1
+
+            if conversation_id:
+                self._request(session, "GET /api/chat/conversations/<id>/messages", "GET",
+                              f"/api/chat/conversations/{conversation_id}/messages")
+            time.sleep(self.random.uniform(0, 2 * self.args.think_ms) / 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=60, help="Thời gian chạy (giây)")
+    parser.add_argument("--ramp-up", type=float, default=5, help="Thời gian khởi động dần các user (giây)")
+    parser.add_argument("--think-ms", type=float, default=500, help="Thời gian nghỉ trung bình giữa các lượt")
+    parser.add_argument("--turns", type=int, default=5, help="Số lượt mỗi conversation trước khi tạo mới")
+    parser.add_argument("--stream", action="store_true", help="Dùng /api/chat/send-message/stream")
+    parser.add_argument("--answer-cache", action="store_true", help="Bật semantic cache câu trả lời")
+    parser.add_argument("--db-url", help="SQLAlchemy URL (mặc định SQLite tạm), ví dụ mysql+pymysql://...")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--model", default="stub-model")
+    parser.add_argument("--first-token-ms", type=float, default=300)
+    parser.add_argument("--token-ms", type=float, default=20)
+    parser.add_argument("--tokens", type=int, default=150)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    if not args.db_url:
+        args.db_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="rag_loadtest_"), "loadtest.db")
+
+    from benchmarks.loadtest.stub_llm import start_in_background
+
+    llm_server, llm_base = start_in_background(
+        first_token_ms=args.first_token_ms, token_ms=args.token_ms, tokens=args.tokens
+    )
+    _configure_environment(args, llm_base)
+
+    from werkzeug.serving import make_server
+    from app.index import app
+    from app.rag_chatbot import rag_chatbot
+
+    usernames = _create_users(app, args.users)
+    with app.app_context():
+        rag_chatbot.ensure_ready()
+        questions = _seed_vector_store(rag_chatbot)
+
+    server = make_server("127.0.0.1", args.port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="flask-loadtest", daemon=True).start()
+    base_url = f"http://127.0.0.1:{args.port}"
+    print(f"App: {base_url}, LLM stub: {llm_base}, DB: {args.db_url}")
+
+    recorder = Recorder()
+    start = time.monotonic()
+    deadline = start + args.ramp_up + args.duration
+    users = []
+    for i, username in enumerate(usernames):
+        user = VirtualUser(base_url, username, questions, recorder, deadline, args, seed=i)
+        user.start()
+        users.append(user)
+        time.sleep(args.ramp_up / max(len(usernames), 1))
+    for user in users:
+        user.join()
+    elapsed = time.monotonic() - start
+
+    server.shutdown()
+    llm_server.shutdown()
+
+    report = recorder.report(elapsed)
+    for name, stats in report.items():
+        print(f"{name}: {json.dumps(stats, ensure_ascii=False)}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "config": {key: value for key, value in vars(args).items() if key != "output"},
+                "elapsed_s": round(elapsed, 1),
+                "endpoints": report,
+                "rag_stages": rag_chatbot.metrics.snapshot(),
+            }, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Server OpenAI-compatible giả lập (POST /v1/chat/completions, có hỗ trợ stream) để load test
+không tốn token và không phụ thuộc độ trễ của OpenRouter.
+
+    python -m benchmarks.loadtest.stub_llm --port 8089 --first-token-ms 300 --token-ms 20 --tokens 150
+    LLM_API_BASE=http://127.0.0.1:8089/v1 flask --app app.index run
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER_WORDS = (
+    "Để quản lý tài chính cá nhân hiệu quả, bạn nên lập ngân sách theo quy tắc 50/30/20, "
+    "xây dựng quỹ dự phòng từ 3 đến 6 tháng chi tiêu và đa dạng hoá danh mục đầu tư "
+    "giữa tiết kiệm, trái phiếu và chứng chỉ quỹ phù hợp với khẩu vị rủi ro."
+).split()
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Gán bởi make_server
+    first_token_s = 0.3
+    token_s = 0.02
+    tokens = 150
+
+    def log_message(self, format, *args):
+        pass
+
+    def _answer_tokens(self):
+        return [ANSWER_WORDS[i % len(ANSWER_WORDS)] + " " for i in range(self.tokens)]
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        model = body.get("model", "stub")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        tokens = self._answer_tokens()
+
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            time.sleep(self.first_token_s)
+            for i, token in enumerate(tokens):
+                if i:
+                    time.sleep(self.token_s)
+                self._write_event({
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {"role": "assistant", "content": token}, "finish_reason": None}],
+                })
+            self._write_event({
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            })
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+            return
+
+        time.sleep(self.first_token_s + self.token_s * max(len(tokens) - 1, 0))
+        payload = json.dumps({
+            "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens).strip()},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _write_event(self, data):
+        self.wfile.write(f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+
+def make_server(host="127.0.0.1", port=8089, first_token_ms=300, token_ms=20, tokens=150):
+    handler = type("ConfiguredStubLLMHandler", (StubLLMHandler,), {
+        "first_token_s": first_token_ms / 1000,
+        "token_s": token_ms / 1000,
+        "tokens": tokens,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_background(**kwargs):
+    """Chạy server ở thread nền, trả về (server, base_url)"""
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, name="stub-llm", daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--first-token-ms", type=float, default=300)
+    parser.add_argument("--token-ms", type=float, default=20)
+    parser.add_argument("--tokens", type=int, default=150)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.first_token_ms, args.token_ms, args.tokens)
+    print(f"Stub LLM listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
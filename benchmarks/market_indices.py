@@ -0,0 +1,123 @@
+"""
+So sánh thời gian phản hồi của /api/stocks/market-indices: cách cũ (tuần tự .info + .history
+cho từng chỉ số) với app.market_indices.fetch_indices (song song, một request mỗi chỉ số, có timeout).
+Dùng provider giả lập độ trễ mạng nên không gọi Yahoo thật và kết quả ổn định giữa các lần chạy.
+
+    python -m benchmarks.market_indices --latency-ms 300 --slow ^N225 --slow-ms 8000 --timeout 2
+
+--slow giả lập một sàn phản hồi chậm để kiểm tra chỉ số đó bị bỏ qua thay vì làm chậm cả trang.
+"""
+import argparse
+import json
+import statistics
+import time
+
+import pandas as pd
+
+
+class StandInTicker:
+    def __init__(self, provider, symbol):
+        self.provider = provider
+        self.symbol = symbol
+
+    @property
+    def info(self):
+        self.provider.sleep(self.symbol)
+        return {'previousClose': 1000.0}
+
+    def history(self, period='1d', **kwargs):
+        self.provider.sleep(self.symbol)
+        rows = 1 if period == '1d' else 5
+        index = pd.date_range(end=pd.Timestamp.today().normalize(), periods=rows, freq='D')
+        return pd.DataFrame({
+            'Open': [1000.0 + i for i in range(rows)],
+            'High': [1010.0 + i for i in range(rows)],
+            'Low': [990.0 + i for i in range(rows)],
+            'Close': [1000.0 + 2 * i for i in range(rows)],
+            'Volume': [1_000_000] * rows,
+        }, index=index)
+
+
+class StandInProvider:
+    """Thay cho module yfinance: mỗi lời gọi .info / .history ngủ `latency_ms` (sàn chậm: `slow_ms`)"""
+
+    def __init__(self, latency_ms, slow=(), slow_ms=0):
+        self.latency = latency_ms / 1000
+        self.slow = set(slow)
+        self.slow_latency = slow_ms / 1000
+        self.calls = 0
+
+    def sleep(self, symbol):
+        self.calls += 1
+        time.sleep(self.slow_latency if symbol in self.slow else self.latency)
+
+    def Ticker(self, symbol):
+        return StandInTicker(self, symbol)
+
+
+def sequential_indices(provider, symbols):
+    """Cách làm cũ của get_market_indices"""
+    indices = []
+    for symbol, name in symbols.items():
+        index = provider.Ticker(symbol)
+        info = index.info
+        hist = index.history(period='1d')
+        if not hist.empty:
+            current = float(hist['Close'].iloc[-1])
+            previous = float(info.get('previousClose', current * 0.99))
+            change = float(current - previous)
+            indices.append({'symbol': symbol, 'name': name, 'current': round(current, 2),
+                            'change': round(change, 2)})
+    return indices
+
+
+def _measure(fn, repeat):
+    timings, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'median_ms': round(statistics.median(timings), 1),
+        'min_ms': round(min(timings), 1),
+        'max_ms': round(max(timings), 1),
+        'indices': len(result),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency-ms", type=float, default=300, help="Độ trễ mỗi lời gọi tới provider")
+    parser.add_argument("--slow", nargs="*", default=[], help="Các chỉ số phản hồi chậm")
+    parser.add_argument("--slow-ms", type=float, default=8000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    from app.market_indices import MARKET_INDICES, fetch_indices
+
+    results = {}
+    provider = StandInProvider(args.latency_ms, args.slow, args.slow_ms)
+    results['sequential'] = _measure(lambda: sequential_indices(provider, MARKET_INDICES), args.repeat)
+    results['sequential']['calls_per_page'] = provider.calls // args.repeat
+
+    provider = StandInProvider(args.latency_ms, args.slow, args.slow_ms)
+    results['concurrent'] = _measure(
+        lambda: fetch_indices(MARKET_INDICES, provider=provider, max_workers=args.workers, timeout=args.timeout),
+        args.repeat
+    )
+    results['concurrent']['calls_per_page'] = provider.calls // args.repeat
+    results['speedup'] = round(results['sequential']['median_ms'] / results['concurrent']['median_ms'], 2)
+
+    for name, stats in results.items():
+        print(f"{name}: {json.dumps(stats, ensure_ascii=False)}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": {k: v for k, v in vars(args).items() if k != "output"}, "results": results},
+                      f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
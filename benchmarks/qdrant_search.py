@@ -0,0 +1,178 @@
+"""
+So sánh độ trễ / recall của các cấu hình truy vấn Qdrant trên một instance local:
+REST vs gRPC, hnsw_ef, lượng tử hoá (none / scalar / binary) với rescore + oversampling,
+và payload đầy đủ vs chỉ các trường prompt cần.
+
+    docker run -p 6333:6333 -p 6334:6334 qdrant/qdrant
+    python -m benchmarks.qdrant_search --snapshot instance/vector_snapshot --output bench_qdrant.json
+
+Vector lấy từ snapshot (`flask rag export-snapshot`) hoặc sinh ngẫu nhiên theo cụm nếu không có.
+Recall@k tính so với kết quả tìm chính xác (exact=True) trên collection không lượng tử hoá.
+Các collection tạm `bench_<quantization>` bị xoá sau khi chạy.
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+import numpy as np
+
+from app.core_rag.qdrant_search import (
+    DEFAULT_PAYLOAD_FIELDS, build_qdrant_client, payload_selector, quantization_config, search_params,
+)
+
+
+def _load_snapshot(path, limit):
+    with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    count = min(meta["count"], limit)
+    vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")[:count].astype(np.float32)
+    if meta["dtype"] == "int8":
+        vectors *= np.load(os.path.join(path, "scales.npy"))[:count, None]
+    payloads = []
+    with open(os.path.join(path, "docs.jsonl"), encoding="utf-8") as f:
+        for line, _ in zip(f, range(count)):
+            record = json.loads(line)
+            payloads.append({"page_content": record["page_content"], "metadata": record["metadata"]})
+    return vectors, payloads
+
+
+def _synthetic(n, dim, seed=0):
+    # Dữ liệu theo cụm để HNSW/lượng tử hoá có hành vi gần với embedding thật hơn nhiễu đều
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(n // 200, 8), dim)).astype(np.float32)
+    vectors = centers[rng.integers(len(centers), size=n)] + 0.35 * rng.normal(size=(n, dim)).astype(np.float32)
+    payloads = [
+        {"page_content": f"chunk {i} " + "nội dung tài liệu tài chính " * 40,
+         "metadata": {"source": f"doc_{i // 50}.pdf", "page": i % 50, "extra": "x" * 200}}
+        for i in range(n)
+    ]
+    return vectors, payloads
+
+
+def _queries(vectors, n, seed=1):
+    rng = np.random.default_rng(seed)
+    picked = vectors[rng.choice(len(vectors), n, replace=False)]
+    return picked + 0.1 * rng.normal(size=picked.shape).astype(np.float32)
+
+
+def _upload(client, name, vectors, payloads, quantization):
+    from qdrant_client import models
+
+    if client.collection_exists(name):
+        client.delete_collection(name)
+    client.create_collection(
+        collection_name=name,
+        vectors_config=models.VectorParams(size=vectors.shape[1], distance=models.Distance.COSINE),
+        quantization_config=quantization_config(quantization),
+    )
+    client.upload_collection(name, vectors=vectors, payload=payloads, ids=list(range(len(vectors))), batch_size=256)
+    # Chờ optimizer build xong HNSW để đo đúng trạng thái chạy thật
+    while client.get_collection(name).status != models.CollectionStatus.GREEN:
+        time.sleep(0.5)
+
+
+def _run(client, name, queries, k, params, with_payload, repeats):
+    latencies = []
+    results = []
+    for _ in range(repeats):
+        results = []
+        for query in queries:
+            start = time.perf_counter()
+            points = client.query_points(
+                collection_name=name, query=query.tolist(), limit=k,
+                search_params=params, with_payload=with_payload, with_vectors=False,
+            ).points
+            latencies.append((time.perf_counter() - start) * 1000)
+            results.append([point.id for point in points])
+    latencies.sort()
+    return results, {
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 2),
+    }
+
+
+def _recall(results, truth, k):
+    return round(float(np.mean([len(set(r) & set(t)) / k for r, t in zip(results, truth)])), 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:6333")
+    parser.add_argument("--grpc-port", type=int, default=6334)
+    parser.add_argument("--snapshot", help="Thư mục snapshot (mặc định sinh dữ liệu ngẫu nhiên)")
+    parser.add_argument("--size", type=int, default=20000, help="Số vector tối đa")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=40)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--hnsw-ef", type=int, nargs="+", default=[0, 64, 128, 256])
+    parser.add_argument("--quantization", nargs="+", default=["none", "scalar", "binary"])
+    parser.add_argument("--oversampling", type=float, nargs="+", default=[1.0, 2.0, 3.0])
+    parser.add_argument("--output", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    if args.snapshot:
+        vectors, payloads = _load_snapshot(args.snapshot, args.size)
+    else:
+        vectors, payloads = _synthetic(args.size, args.dim)
+    queries = _queries(vectors, min(args.queries, len(vectors)))
+
+    clients = {
+        "rest": build_qdrant_client(args.url),
+        "grpc": build_qdrant_client(args.url, prefer_grpc=True, grpc_port=args.grpc_port),
+    }
+    rest = clients["rest"]
+    full_payload = payload_selector(None)
+    selected_payload = payload_selector(DEFAULT_PAYLOAD_FIELDS)
+
+    report = []
+    truth = None
+    try:
+        for quantization in ["none"] + [q for q in args.quantization if q != "none"]:
+            name = f"bench_{quantization}"
+            _upload(rest, name, vectors, payloads, quantization)
+            if truth is None:
+                truth, _ = _run(rest, name, queries, args.top_k, search_params(exact=True), False, 1)
+            if quantization not in args.quantization:
+                continue
+
+            cases = []
+            for ef in args.hnsw_ef:
+                if quantization == "none":
+                    cases.append((ef, None, None))
+                else:
+                    cases.extend((ef, True, oversampling) for oversampling in args.oversampling)
+                    cases.append((ef, False, None))
+
+            for transport, client in clients.items():
+                for ef, rescore, oversampling in cases:
+                    for payload_name, with_payload in (("full", full_payload), ("selected", selected_payload)):
+                        params = search_params(ef, rescore, oversampling)
+                        results, latency = _run(client, name, queries, args.top_k, params, with_payload, args.repeats)
+                        row = {
+                            "transport": transport,
+                            "quantization": quantization,
+                            "hnsw_ef": ef or "default",
+                            "rescore": rescore,
+                            "oversampling": oversampling,
+                            "payload": payload_name,
+                            **latency,
+                            f"recall@{args.top_k}": _recall(results, truth, args.top_k),
+                        }
+                        report.append(row)
+                        print(json.dumps(row, ensure_ascii=False))
+    finally:
+        for quantization in args.quantization + ["none"]:
+            if rest.collection_exists(f"bench_{quantization}"):
+                rest.delete_collection(f"bench_{quantization}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"size": len(vectors), "queries": len(queries), "results": report}, f,
+                      ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+# Benchmark chất lượng/tốc độ truy hồi chạy offline: `python -m benchmarks.retrieval.run --help`
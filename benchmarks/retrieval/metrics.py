@@ -0,0 +1,25 @@
+"""
+Chỉ số đánh giá truy hồi với độ liên quan nhị phân.
+`hits` là danh sách theo thứ tự xếp hạng: chỉ số của đoạn liên quan trong golden set mà chunk
+khớp (lần đầu tiên), hoặc None nếu chunk không liên quan / trùng đoạn đã tìm thấy.
+"""
+import math
+
+
+def recall_at_k(hits, n_relevant, k):
+    if not n_relevant:
+        return 0.0
+    return sum(1 for hit in hits[:k] if hit is not None) / n_relevant
+
+
+def reciprocal_rank(hits, k=None):
+    for rank, hit in enumerate(hits[:k] if k else hits, start=1):
+        if hit is not None:
+            return 1.0 / rank
+    return 0.0
+
+
+def ndcg_at_k(hits, n_relevant, k):
+    dcg = sum(1.0 / math.log2(rank + 1) for rank, hit in enumerate(hits[:k], start=1) if hit is not None)
+    ideal = sum(1.0 / math.log2(rank + 1) for rank in range(1, min(n_relevant, k) + 1))
+    return dcg / ideal if ideal else 0.0
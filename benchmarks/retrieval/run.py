@@ -0,0 +1,232 @@
+"""
+Đánh giá truy hồi offline trên golden set: chia chunk -> embed -> index vào Qdrant chạy
+in-memory (hoặc thư mục local) -> tìm kiếm (+ BM25 / rerank nếu bật) -> recall@k, MRR, nDCG
+và p50/p95 từng stage. Kết quả ghi JSON kèm commit để so sánh giữa các lần thay đổi.
+
+    python -m benchmarks.retrieval.run --output bench_retrieval.json
+    python -m benchmarks.retrieval.run --chunk-size 256 --hybrid --rerank \
+        --baseline bench_retrieval.json --output bench_retrieval_256.json
+
+Không gọi dịch vụ nào bên ngoài; model HuggingFace cần có sẵn trong cache
+(chạy một lần khi có mạng hoặc đặt HF_HUB_OFFLINE=1).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import time
+
+from benchmarks.retrieval.metrics import ndcg_at_k, recall_at_k, reciprocal_rank
+
+GOLDEN_SET = os.path.join(os.path.dirname(__file__), "golden_set.json")
+
+
+def _normalize(text):
+    from app.core_rag.ingest import preprocess_data
+
+    return preprocess_data(text).lower()
+
+
+def _matches(chunk, snippet):
+    """Chunk chứa đoạn liên quan, hoặc chứa ít nhất một nửa đoạn khi đoạn bị cắt ở biên chunk"""
+    if snippet in chunk:
+        return True
+    for cut in range(len(snippet) // 2, len(snippet)):
+        if chunk.endswith(snippet[:cut]) or chunk.startswith(snippet[-cut:]):
+            return True
+    return False
+
+
+def _judge(docs, relevant):
+    """Đổi danh sách Document đã xếp hạng thành hits cho metrics (mỗi đoạn liên quan tính một lần)"""
+    found = set()
+    hits = []
+    for doc in docs:
+        text = _normalize(doc.page_content)
+        hit = None
+        for idx, item in enumerate(relevant):
+            if idx not in found and doc.metadata.get("source") == item["source"] and _matches(text, item["snippet"]):
+                hit = idx
+                found.add(idx)
+                break
+        hits.append(hit)
+    return hits
+
+
+def _chunk(golden, chunk_size, chunk_overlap):
+    from langchain_core.documents import Document
+    from app.core_rag.ingest import chunk_point_id, preprocess_data, text_split
+
+    cleaned = [
+        Document(page_content=preprocess_data(doc["text"]), metadata={"source": doc["source"]})
+        for doc in golden["documents"]
+    ]
+    records = []
+    occurrences = {}
+    for chunk in text_split(cleaned, chunk_size, chunk_overlap):
+        key = (chunk.metadata["source"], chunk.page_content)
+        occurrence = occurrences.get(key, 0)
+        occurrences[key] = occurrence + 1
+        records.append({
+            "id": chunk_point_id(chunk.metadata["source"], chunk.page_content, occurrence),
+            "page_content": chunk.page_content,
+            "metadata": dict(chunk.metadata),
+        })
+    return records
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _summarize(values):
+    return round(statistics.fmean(values), 4) if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--golden", default=GOLDEN_SET)
+    parser.add_argument("--chunk-size", type=int, default=512)
+    parser.add_argument("--chunk-overlap", type=int, default=20)
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5, 10])
+    parser.add_argument("--top-k", type=int, default=40, help="Số chunk lấy từ vector search (RAG_TOP_K)")
+    parser.add_argument("--model", default="dangvantuan/vietnamese-embedding")
+    parser.add_argument("--backend", default="torch", help="EMBEDDING_BACKEND")
+    parser.add_argument("--onnx-path")
+    parser.add_argument("--onnx-file")
+    parser.add_argument("--hybrid", action="store_true", help="Dense + BM25 gộp bằng RRF")
+    parser.add_argument("--rrf-k", type=int, default=60)
+    parser.add_argument("--rerank", action="store_true", help="Rerank bằng cross-encoder")
+    parser.add_argument("--rerank-model", default="itdainb/PhoRanker")
+    parser.add_argument("--qdrant-path", help="Thư mục Qdrant local mode (mặc định in-memory)")
+    parser.add_argument("--repeats", type=int, default=3, help="Số lần lặp để đo độ trễ")
+    parser.add_argument("--baseline", help="File JSON kết quả trước đó để in chênh lệch")
+    parser.add_argument("--output", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    from qdrant_client import QdrantClient
+    from app.core_rag.bm25 import BM25Index, reciprocal_rank_fusion
+    from app.core_rag.embeddings import build_embeddings
+    from app.core_rag.ingest import ensure_collection
+    from app.core_rag.metrics import StageMetrics
+    from app.core_rag.qdrant_search import QdrantSearcher
+
+    with open(args.golden, encoding="utf-8") as f:
+        golden = json.load(f)
+    for question in golden["questions"]:
+        for item in question["relevant"]:
+            item["snippet"] = _normalize(item["contains"])
+
+    metrics = StageMetrics()
+    build = {}
+
+    start = time.perf_counter()
+    records = _chunk(golden, args.chunk_size, args.chunk_overlap)
+    build["split_s"] = round(time.perf_counter() - start, 3)
+
+    start = time.perf_counter()
+    embeddings = build_embeddings(args.model, args.backend, onnx_path=args.onnx_path, onnx_file=args.onnx_file)
+    build["load_model_s"] = round(time.perf_counter() - start, 3)
+
+    start = time.perf_counter()
+    vectors = embeddings.embed_documents([record["page_content"] for record in records])
+    build["embed_documents_s"] = round(time.perf_counter() - start, 3)
+
+    from qdrant_client.models import PointStruct
+
+    client = QdrantClient(path=args.qdrant_path) if args.qdrant_path else QdrantClient(":memory:")
+    collection_name = "retrieval_benchmark"
+    start = time.perf_counter()
+    ensure_collection(client, collection_name, len(vectors[0]), recreate=True)
+    client.upsert(collection_name=collection_name, points=[
+        PointStruct(id=record["id"], vector=vector,
+                    payload={"page_content": record["page_content"], "metadata": record["metadata"]})
+        for record, vector in zip(records, vectors)
+    ])
+    build["index_s"] = round(time.perf_counter() - start, 3)
+    searcher = QdrantSearcher(client, collection_name)
+
+    bm25 = BM25Index.build(records) if args.hybrid else None
+    reranker = None
+    if args.rerank:
+        from app.core_rag.rerank import CrossEncoderReranker
+        reranker = CrossEncoderReranker(args.rerank_model, top_n=max(args.k))
+        reranker.score("khởi động", ["khởi động"])
+
+    per_question = []
+    for repeat in range(args.repeats):
+        for question in golden["questions"]:
+            query = question["question"]
+            with metrics.stage("total"):
+                with metrics.stage("embed"):
+                    query_vector = embeddings.embed_query(query)
+                with metrics.stage("search"):
+                    docs = searcher.similarity_search_by_vector(query_vector, k=args.top_k)
+                if bm25 is not None:
+                    with metrics.stage("bm25"):
+                        sparse_docs = bm25.get_relevant_documents(query, k=args.top_k)
+                    docs = reciprocal_rank_fusion([docs, sparse_docs], k=args.rrf_k, limit=args.top_k)
+                if reranker is not None:
+                    with metrics.stage("rerank"):
+                        docs = reranker.rerank(query, docs)
+            if repeat:
+                continue
+
+            relevant = question["relevant"]
+            hits = _judge(docs, relevant)
+            row = {"id": question["id"], "mrr": reciprocal_rank(hits)}
+            for k in args.k:
+                row[f"recall@{k}"] = recall_at_k(hits, len(relevant), k)
+                row[f"ndcg@{k}"] = ndcg_at_k(hits, len(relevant), k)
+            per_question.append(row)
+
+    summary = {"mrr": _summarize([row["mrr"] for row in per_question])}
+    for k in args.k:
+        summary[f"recall@{k}"] = _summarize([row[f"recall@{k}"] for row in per_question])
+        summary[f"ndcg@{k}"] = _summarize([row[f"ndcg@{k}"] for row in per_question])
+
+    result = {
+        "commit": _git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "chunk_size": args.chunk_size, "chunk_overlap": args.chunk_overlap, "top_k": args.top_k,
+            "model": args.model, "backend": args.backend, "hybrid": args.hybrid, "rerank": args.rerank,
+            "rerank_model": args.rerank_model if args.rerank else None,
+        },
+        "corpus": {"documents": len(golden["documents"]), "chunks": len(records), "questions": len(per_question)},
+        "build": build,
+        "metrics": summary,
+        "latency": metrics.snapshot(),
+        "questions": per_question,
+    }
+
+    print(json.dumps({key: result[key] for key in ("commit", "config", "corpus", "build", "metrics")},
+                     ensure_ascii=False, indent=2))
+    for stage, stats in result["latency"].items():
+        print(f"{stage:>8}: p50 {stats['p50_ms']} ms, p95 {stats['p95_ms']} ms")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\nSo với {args.baseline} (commit {baseline.get('commit')}):")
+        for name, value in summary.items():
+            previous = baseline["metrics"].get(name)
+            if previous is not None:
+                print(f"{name:>10}: {previous:.4f} -> {value:.4f} ({value - previous:+.4f})")
+        for stage, stats in result["latency"].items():
+            previous = baseline.get("latency", {}).get(stage)
+            if previous:
+                print(f"{stage:>10}: p50 {previous['p50_ms']} -> {stats['p50_ms']} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
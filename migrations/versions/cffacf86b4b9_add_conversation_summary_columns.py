@@ -0,0 +1,39 @@
+"""add conversation summary columns
+
+Bảng chatconversation thêm bản tóm tắt hội thoại và ID tin nhắn cuối đã được tóm tắt.
+Database tạo bằng db.create_all sau khi model có hai cột này thì bỏ qua (chỉ ghi nhận version).
+
+Revision ID: cffacf86b4b9
+Revises: 
+Create Date: 2026-10-18 19:49:40.333843
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'cffacf86b4b9'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _columns():
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns('chatconversation')}
+
+
+def upgrade():
+    existing = _columns()
+    with op.batch_alter_table('chatconversation', schema=None) as batch_op:
+        if 'summary' not in existing:
+            batch_op.add_column(sa.Column('summary', sa.Text(), nullable=True))
+        if 'summary_upto_message_id' not in existing:
+            batch_op.add_column(sa.Column('summary_upto_message_id', sa.Integer(), nullable=True,
+                                          server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('chatconversation', schema=None) as batch_op:
+        batch_op.drop_column('summary_upto_message_id')
+        batch_op.drop_column('summary')
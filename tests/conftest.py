@@ -0,0 +1,15 @@
+"""
+Các module thuần (tính toán, không dùng Flask app) được test mà không chạy app/__init__.py,
+vốn cần cấu hình môi trường (MAIL_PORT, oauth_config.json, database...).
+Gói `app` được đăng ký như namespace rỗng trỏ tới thư mục app/ nên `import app.<module>` chỉ nạp module đó.
+"""
+import os
+import sys
+import types
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+
+if "app" not in sys.modules:
+    package = types.ModuleType("app")
+    package.__path__ = [APP_DIR]
+    sys.modules["app"] = package
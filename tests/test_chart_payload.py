@@ -0,0 +1,102 @@
+"""
+Kiểm tra app.chart_payload: LTTB giữ điểm đầu/cuối, trả đúng `threshold` điểm theo thứ tự
+(giữ nguyên chuỗi khi threshold >= số điểm hoặc < 3) và payload dạng cột của build_chart_payload.
+
+    python -m pytest -q tests/test_chart_payload.py
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.chart_payload import build_chart_payload, lttb_indices
+
+
+def synthetic_history(rows, seed=3):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1.5, rows))
+    open_ = close + rng.normal(0, 0.5, rows)
+    return pd.DataFrame({
+        'Open': open_,
+        'High': np.maximum(open_, close) + rng.uniform(0, 1, rows),
+        'Low': np.minimum(open_, close) - rng.uniform(0, 1, rows),
+        'Close': close,
+        'Volume': rng.integers(1_000, 100_000, rows).astype(float),
+    }, index=pd.bdate_range('2020-01-01', periods=rows))
+
+
+@pytest.mark.parametrize('n, threshold', [(10, 3), (10, 9), (100, 7), (1000, 250), (5000, 500)])
+def test_lttb_keeps_endpoints_and_threshold_points(n, threshold):
+    y = np.random.default_rng(n).normal(size=n).cumsum()
+
+    indices = lttb_indices(y, threshold)
+
+    assert len(indices) == threshold
+    assert indices[0] == 0 and indices[-1] == n - 1
+    assert np.all(np.diff(indices) > 0)
+
+
+@pytest.mark.parametrize('threshold', [10, 11, 50])
+def test_lttb_threshold_not_below_length_keeps_all_points(threshold):
+    np.testing.assert_array_equal(lttb_indices(np.arange(10.0), threshold), np.arange(10))
+
+
+@pytest.mark.parametrize('threshold', [None, 0, 1, 2])
+def test_lttb_threshold_below_three_keeps_all_points(threshold):
+    np.testing.assert_array_equal(lttb_indices(np.arange(10.0), threshold), np.arange(10))
+
+
+def test_lttb_keeps_spikes():
+    y = np.zeros(1000)
+    y[123], y[700] = 50.0, -40.0
+
+    indices = lttb_indices(y, 20)
+
+    assert 123 in indices and 700 in indices
+
+
+def test_lttb_uses_given_x():
+    x = np.cumsum(np.random.default_rng(1).uniform(0.5, 2.0, 200))
+    y = np.sin(x)
+
+    indices = lttb_indices(y, 30, x=x)
+
+    assert len(indices) == 30 and indices[0] == 0 and indices[-1] == 199
+
+
+def test_payload_is_columnar_without_downsampling():
+    hist = synthetic_history(30)
+    hist.iloc[4, hist.columns.get_loc('Volume')] = np.nan
+
+    payload = build_chart_payload(hist)
+
+    assert set(payload) == {'date', 'open', 'high', 'low', 'close', 'volume', 'total_points'}
+    assert payload['total_points'] == 30
+    assert all(len(payload[column]) == 30 for column in ('date', 'open', 'high', 'low', 'close', 'volume'))
+    assert payload['date'][0] == '2020-01-01'
+    assert payload['close'] == hist['Close'].tolist()
+    assert payload['volume'][4] == 0 and isinstance(payload['volume'][0], int)
+
+
+def test_payload_downsamples_to_max_points():
+    hist = synthetic_history(2000)
+
+    payload = build_chart_payload(hist, max_points=300)
+
+    assert payload['total_points'] == 2000
+    assert len(payload['date']) == len(payload['close']) == len(payload['volume']) == 300
+    assert payload['date'][0] == hist.index[0].strftime('%Y-%m-%d')
+    assert payload['date'][-1] == hist.index[-1].strftime('%Y-%m-%d')
+    assert payload['date'] == sorted(payload['date'])
+    # Mỗi nến được chọn giữ nguyên OHLC của chính nó
+    selected = hist.loc[pd.to_datetime(payload['date'])]
+    assert payload['high'] == selected['High'].tolist()
+
+
+def test_payload_drops_missing_close_before_counting():
+    hist = synthetic_history(12)
+    hist.iloc[[3, 7], hist.columns.get_loc('Close')] = np.nan
+
+    payload = build_chart_payload(hist, max_points=20)
+
+    assert payload['total_points'] == 10
+    assert len(payload['close']) == 10 and not any(np.isnan(payload['close']))
@@ -0,0 +1,104 @@
+"""
+Kiểm tra app.indicators.IndicatorEngine: kết quả tính tăng dần (thêm nến, nến cuối đang giao dịch
+thay đổi) phải trùng với tính lại từ đầu, kể cả đoạn khởi động của RSI/ATR và EMA/MACD nối từ `prev`.
+
+    python -m pytest -q tests/test_indicators.py
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.indicators import INDICATORS, IndicatorEngine
+
+SYMBOL = 'TEST'
+
+
+def synthetic_history(rows, seed=7):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1.5, rows))
+    open_ = close + rng.normal(0, 0.5, rows)
+    high = np.maximum(open_, close) + rng.uniform(0, 1, rows)
+    low = np.minimum(open_, close) - rng.uniform(0, 1, rows)
+    volume = rng.integers(1_000, 100_000, rows).astype(float)
+    index = pd.bdate_range('2024-01-01', periods=rows)
+    return pd.DataFrame({'Open': open_, 'High': high, 'Low': low, 'Close': close, 'Volume': volume}, index=index)
+
+
+def cold(name, hist, params):
+    return IndicatorEngine().compute(SYMBOL, name, hist, params)
+
+
+def assert_same(actual, expected):
+    pd.testing.assert_frame_equal(actual, expected, check_exact=False, rtol=1e-9, atol=1e-9)
+
+
+INDICATOR_NAMES = list(INDICATORS)
+
+
+@pytest.mark.parametrize('name', INDICATOR_NAMES)
+# Độ dài ban đầu ngắn hơn / vừa bằng / dài hơn đoạn khởi động (RSI/ATR 14, MACD 26, cửa sổ 20)
+@pytest.mark.parametrize('rows', [2, 5, 13, 14, 15, 30, 60])
+def test_appended_candles_match_cold_compute(name, rows):
+    hist = synthetic_history(rows + 10)
+    params = dict(INDICATORS[name][1])
+    engine = IndicatorEngine()
+
+    engine.compute(SYMBOL, name, hist.iloc[:rows], params)
+    for end in (rows + 1, rows + 4, rows + 10):
+        assert_same(engine.compute(SYMBOL, name, hist.iloc[:end], params), cold(name, hist.iloc[:end], params))
+
+    assert engine.stats()['full'] == 1
+    assert engine.stats()['incremental'] == 3
+
+
+@pytest.mark.parametrize('name', INDICATOR_NAMES)
+def test_updated_last_candle_matches_cold_compute(name):
+    hist = synthetic_history(60)
+    params = dict(INDICATORS[name][1])
+    engine = IndicatorEngine()
+    engine.compute(SYMBOL, name, hist, params)
+
+    # Phiên đang giao dịch: nến cuối đổi giá/khối lượng, các nến trước giữ nguyên
+    live = hist.copy()
+    live.iloc[-1, live.columns.get_loc('Close')] += 2.5
+    live.iloc[-1, live.columns.get_loc('High')] += 3.0
+    live.iloc[-1, live.columns.get_loc('Volume')] += 5_000
+
+    assert_same(engine.compute(SYMBOL, name, live, params), cold(name, live, params))
+    assert engine.stats()['incremental'] == 1
+
+
+def test_unchanged_history_is_a_hit():
+    hist = synthetic_history(40)
+    engine = IndicatorEngine()
+    first = engine.compute(SYMBOL, 'macd', hist, {'fast': 12, 'slow': 26, 'signal': 9})
+
+    assert engine.compute(SYMBOL, 'macd', hist.copy(), {'fast': 12, 'slow': 26, 'signal': 9}) is first
+    assert engine.stats()['hits'] == 1
+
+
+def test_adjusted_history_is_recomputed_from_scratch():
+    hist = synthetic_history(50)
+    params = {'period': 14}
+    engine = IndicatorEngine()
+    engine.compute(SYMBOL, 'rsi', hist.iloc[:40], params)
+
+    # Chia tách cổ phiếu: toàn bộ giá quá khứ bị điều chỉnh
+    adjusted = hist.copy()
+    adjusted[['Open', 'High', 'Low', 'Close']] /= 2
+
+    assert_same(engine.compute(SYMBOL, 'rsi', adjusted, params), cold('rsi', adjusted, params))
+    assert engine.stats()['full'] == 2
+    assert engine.stats()['incremental'] == 0
+
+
+def test_warmup_rows_are_masked():
+    hist = synthetic_history(30)
+    engine = IndicatorEngine()
+    engine.compute(SYMBOL, 'rsi', hist.iloc[:10], {'period': 14})
+    rsi = engine.compute(SYMBOL, 'rsi', hist, {'period': 14})['rsi']
+    engine.compute(SYMBOL, 'atr', hist.iloc[:10], {'period': 14})
+    atr = engine.compute(SYMBOL, 'atr', hist, {'period': 14})['atr']
+
+    assert rsi.iloc[:14].isna().all() and rsi.iloc[14:].notna().all()
+    assert atr.iloc[:13].isna().all() and atr.iloc[13:].notna().all()
@@ -0,0 +1,118 @@
+"""
+Kiểm tra app.market_indices.fetch_indices với provider giả lập (không gọi Yahoo):
+giữ thứ tự, bỏ qua chỉ số quá hạn theo từng mã và không gửi lại chỉ số đang bị treo.
+
+    python -m pytest -q tests/test_market_indices.py
+"""
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from app.market_indices import fetch_indices
+
+
+class FakeTicker:
+    def __init__(self, provider, symbol):
+        self.provider = provider
+        self.symbol = symbol
+
+    def history(self, period='5d', **kwargs):
+        self.provider.wait(self.symbol)
+        close = self.provider.closes[self.symbol]
+        index = pd.date_range(end=pd.Timestamp.today().normalize(), periods=2, freq='D')
+        return pd.DataFrame({'Close': [close - 10, close], 'Volume': [1000, 2000]}, index=index)
+
+
+class FakeProvider:
+    """Thay cho yfinance: mỗi mã ngủ theo `latency` (giây), mã trong `hung` chờ tới khi release()"""
+
+    def __init__(self, latency, hung=()):
+        self.latency = dict(latency)
+        self.hung = set(hung)
+        self.closes = {symbol: 1000.0 + i for i, symbol in enumerate(list(latency) + list(hung))}
+        self.calls = {}
+        self._lock = threading.Lock()
+        self._released = threading.Event()
+
+    def wait(self, symbol):
+        with self._lock:
+            self.calls[symbol] = self.calls.get(symbol, 0) + 1
+        if symbol in self.hung:
+            self._released.wait(30)
+        else:
+            time.sleep(self.latency[symbol])
+
+    def release(self):
+        self._released.set()
+
+    def Ticker(self, symbol):
+        return FakeTicker(self, symbol)
+
+
+@pytest.fixture
+def make_provider():
+    providers = []
+
+    def make(latency, hung=()):
+        provider = FakeProvider(latency, hung)
+        providers.append(provider)
+        return provider
+
+    yield make
+    for provider in providers:
+        provider.release()
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def test_keeps_symbol_order_and_runs_concurrently(make_provider):
+    symbols = {'^A': 'A', '^B': 'B', '^C': 'C', '^D': 'D'}
+    # Mã đầu chậm nhất để thứ tự hoàn thành ngược với thứ tự yêu cầu
+    provider = make_provider({'^A': 0.4, '^B': 0.3, '^C': 0.2, '^D': 0.1})
+
+    indices, elapsed = _timed(lambda: fetch_indices(symbols, provider=provider, max_workers=4, timeout=2))
+
+    assert [index['symbol'] for index in indices] == list(symbols)
+    assert [index['name'] for index in indices] == list(symbols.values())
+    assert indices[0]['change'] == 10.0 and indices[0]['is_positive'] is True
+    assert elapsed < 0.8
+
+
+def test_skips_symbol_past_its_deadline(make_provider):
+    symbols = {'^A': 'A', '^HUNG': 'Hung', '^B': 'B'}
+    provider = make_provider({'^A': 0.05, '^B': 0.05}, hung={'^HUNG'})
+
+    indices, elapsed = _timed(lambda: fetch_indices(symbols, provider=provider, max_workers=4, timeout=0.5))
+
+    assert [index['symbol'] for index in indices] == ['^A', '^B']
+    assert 0.4 < elapsed < 1.5
+
+
+def test_queued_symbol_gets_its_own_timeout(make_provider):
+    # Một worker: ^B chỉ bắt đầu sau khi ^A xong nhưng vẫn có đủ `timeout` giây cho riêng nó
+    symbols = {'^A': 'A', '^B': 'B'}
+    provider = make_provider({'^A': 0.3, '^B': 0.3})
+
+    indices, elapsed = _timed(lambda: fetch_indices(symbols, provider=provider, max_workers=1, timeout=0.5))
+
+    assert [index['symbol'] for index in indices] == ['^A', '^B']
+    assert elapsed < 1.2
+
+
+def test_hung_symbol_is_not_resubmitted(make_provider):
+    symbols = {'^A': 'A', '^HUNG': 'Hung'}
+    provider = make_provider({'^A': 0.05}, hung={'^HUNG'})
+
+    fetch_indices(symbols, provider=provider, max_workers=4, timeout=0.3)
+    indices, elapsed = _timed(lambda: fetch_indices(symbols, provider=provider, max_workers=4, timeout=0.3))
+
+    assert [index['symbol'] for index in indices] == ['^A']
+    assert provider.calls['^HUNG'] == 1
+    # Lần gọi sau dùng lại task đang treo (đã quá hạn) nên không phải chờ thêm cả `timeout`
+    assert elapsed < 0.3